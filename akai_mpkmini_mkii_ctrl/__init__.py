@@ -1,2 +1,7 @@
 # -*- coding: utf-8 -*-
 r"""Module init-file."""
+
+# Port name of the device as reported by the MIDI backend
+DEVICE_NAME = 'MPK Mini Mk II'
+# Default time in seconds to wait for a SysEx reply from the device
+SYSEX_TIMEOUT = 5.0
@@ -1,27 +1,150 @@
 # -*- coding: utf-8 -*-
 r"""Command-line controller for AKAI MPKmini MK2."""
 
+# Heavy dependencies (rtmidi, construct, yaml, asyncio) are only imported
+# by the commands that need them to keep the startup of the CLI fast.
+
+from __future__ import annotations
 
-import collections.abc
 import logging
-from json import dumps
-from typing import List
+from os import path
+from typing import TYPE_CHECKING, Callable, List, Optional
 
 import click
-from config_reader import load_config_from_file, update_config
 
-from akai_mpkmini_mkii_ctrl import controller as ctrl
-from akai_mpkmini_mkii_ctrl import json_converter
-from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+from akai_mpkmini_mkii_ctrl import DEVICE_NAME, SYSEX_TIMEOUT
+
+if TYPE_CHECKING:
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+
+def __midi_ports(ctx: click.Context) -> List[int]:
+    if not ctx.obj['all_devices']:
+        return ctx.obj['midi_ports']
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    midi_ports = ctrl.find_device_ports()
+    if not midi_ports:
+        logging.error(f'No "{DEVICE_NAME}" device found.')
+        exit(1)
+    return midi_ports
+
+
+def __single_midi_port(ctx: click.Context) -> int:
+    if ctx.obj['all_devices'] or len(ctx.obj['midi_ports']) > 1:
+        logging.error('This command supports a single MIDI port only.')
+        exit(1)
+    return ctx.obj['midi_ports'][0]
+
+
+def __forward(ctx: click.Context, request: dict) -> bool:
+    if not ctx.obj['socket']:
+        return False
+    from akai_mpkmini_mkii_ctrl import daemon
+    request['preset'] = ctx.obj['preset']
+    try:
+        response = daemon.send_command(ctx.obj['socket'], request)
+    except OSError as err:
+        logging.error(f'Cannot reach daemon on {ctx.obj["socket"]}. {err}')
+        exit(1)
+    except ValueError as err:  # E.g., no response as the daemon died
+        logging.error(f'Invalid response of daemon. {err}')
+        exit(1)
+    if not response['ok']:
+        logging.error(response['error'])
+        exit(1)
+    logging.info(response['output'])
+    return True
+
 
+def __push(
+    ctx: click.Context,
+    config: MPK_MINI_MK2,
+    verify: bool,
+    if_changed: bool,
+    read_back: bool
+) -> None:
+    import asyncio
 
-def __update(d: dict, u: collections.abc.Mapping) -> dict:
-    for k, v in u.items():
-        if isinstance(v, collections.abc.Mapping):
-            d[k] = __update(d.get(k, {}), v)
+    from akai_mpkmini_mkii_ctrl.async_controller import push_to_devices
+    results = asyncio.run(push_to_devices(
+        __midi_ports(ctx), config, ctx.obj['preset'], ctx.obj['timeout'],
+        verify, if_changed, read_back
+    ))
+    for result in results:
+        elapsed = f'{result.elapsed * 1000:.1f} ms'
+        if result.skipped:
+            logging.info(f'Port {result.midi_port}: UNCHANGED ({elapsed})')
+        elif result.success:
+            logging.info(f'Port {result.midi_port}: OK ({elapsed})')
         else:
-            d[k] = v
-    return d
+            logging.error(f'Port {result.midi_port}: FAILED ({elapsed}) '
+                          + f'{result.error}')
+        for change in result.changes:
+            logging.info(f'- {change}')
+    if not all(result.success for result in results):
+        exit(1)
+
+
+def __watch(
+    ctx: click.Context,
+    input_files: List[str],
+    debounce: float
+) -> None:
+    from contextlib import ExitStack
+    from time import perf_counter
+
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.config_watcher import watch_configs
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    preset = ctx.obj['preset']
+    midi_ports = __midi_ports(ctx)
+    # The ports stay open, so a push is a single send_message call
+    with ExitStack() as stack:
+        midi_outs = {
+            midi_port: stack.enter_context(ctrl.midi_connection(midi_port))[1]
+            for midi_port in midi_ports
+        }
+        logging.info(f'Watching {", ".join(input_files)}. Stop with Ctrl+C.')
+        try:
+            for binary in watch_configs(input_files, debounce):
+                start = perf_counter()
+                for midi_out in midi_outs.values():
+                    ctrl.send_binary_data_to_device(binary, preset, midi_out)
+                elapsed = f'{(perf_counter() - start) * 1000:.1f} ms'
+                logging.info(f'Pushed to preset {preset} ({elapsed})')
+                save_device_state(
+                    {midi_port: binary for midi_port in midi_ports}, preset
+                )
+        except KeyboardInterrupt:
+            pass
+        except OSError as err:
+            logging.error(err)
+            exit(1)
+
+
+def __report_profile(trace_file: Optional[str]) -> None:
+    import json
+
+    from akai_mpkmini_mkii_ctrl import profiling
+    click.echo(json.dumps(profiling.summary(), indent=2), err=True)
+    if trace_file:
+        with open(trace_file, 'w') as trace_handle:
+            json.dump(profiling.chrome_trace(), trace_handle)
+
+
+def __push_options(command: Callable) -> Callable:
+    command = click.option(
+        '--read-back', is_flag=True,
+        help='With --if-changed, compare with the preset read from the '
+        + 'device instead of the local state cache'
+    )(command)
+    command = click.option(
+        '--if-changed', is_flag=True,
+        help='Only push if the preset differs from the last known state'
+    )(command)
+    return click.option(
+        '--verify', is_flag=True, help='Read back preset after pushing'
+    )(command)
 
 
 @click.group(help=__doc__)
@@ -32,53 +155,116 @@ def __update(d: dict, u: collections.abc.Mapping) -> dict:
 )
 @click.option(
     '--midi-port', '-m', required=True, metavar='NUM',
-    type=click.INT, default=0,
-    help='MIDI Port on which the device is located (default: 0)'
+    type=click.INT, default=[0], multiple=True,
+    help='MIDI Port on which the device is located. Push commands accept '
+    + 'several ports (default: 0)'
+)
+@click.option(
+    '--all-devices', '-a', is_flag=True,
+    help='Push to all ports with a connected MPKmini MK2'
+)
+@click.option(
+    '--timeout', '-t', metavar='SECONDS',
+    type=click.FLOAT, default=SYSEX_TIMEOUT,
+    help=f'Time to wait for a reply from the device (default: {SYSEX_TIMEOUT})'
+)
+@click.option(
+    '--socket', '-s', metavar='PATH',
+    help='Forward commands to a daemon started with "serve" on this socket'
 )
 @click.option(
     '--verbose', '-v', is_flag=True,
     help='Verbose output'
 )
+@click.option(
+    '--profile', is_flag=True,
+    help='Print the time spent per phase as JSON to stderr'
+)
+@click.option(
+    '--profile-trace', metavar='FILE',
+    help='Write the timed phases as Chrome trace (implies --profile)'
+)
 @click.pass_context
 def main(
     ctx: click.Context,
     preset: str,
-    midi_port: str,
-    verbose: bool
+    midi_port: List[int],
+    all_devices: bool,
+    timeout: float,
+    socket: Optional[str],
+    verbose: bool,
+    profile: bool,
+    profile_trace: Optional[str]
 ) -> None:
     ctx.ensure_object(dict)
     ctx.obj['preset'] = int(preset)
-    ctx.obj['midi_port'] = int(midi_port)
+    ctx.obj['midi_ports'] = list(midi_port)
+    ctx.obj['all_devices'] = all_devices
+    ctx.obj['timeout'] = timeout
+    ctx.obj['socket'] = socket
     # Setup logging
     log_level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(format='%(levelname)s:%(message)s', level=log_level)
+    # Setup profiling, reported once the command is done
+    if profile or profile_trace:
+        from akai_mpkmini_mkii_ctrl import profiling
+        profiling.enable_profiling()
+        ctx.call_on_close(lambda: __report_profile(profile_trace))
+        ctx.with_resource(
+            profiling.span('command', command=ctx.invoked_subcommand)
+        )
 
 
 @main.command(help='Print preset on device in human readable format')
 @click.pass_context
 def print_preset(ctx: click.Context) -> None:
-    with ctrl.midi_connection(ctx.obj['midi_port']) as (m_in, m_out):
-        config = ctrl.get_config_from_device(ctx.obj['preset'], m_in, m_out)
+    if __forward(ctx, {'command': 'print-preset'}):
+        return
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, m_out):
+        try:
+            config = ctrl.get_config_from_device(
+                ctx.obj['preset'], m_in, m_out, ctx.obj['timeout']
+            )
+        except TimeoutError as te:
+            logging.error(te)
+            exit(1)
         logging.info(config)
 
 
-@main.command(help='Push a local binary preset to the device')
+@main.command(help='Push a local binary preset to the device(s)')
 @click.option(
     '--input-file', '-i', required=True, metavar='FILE',
-    help='Binary input file, i.e., a regular *.mk2 preset file'
+    help='Binary input file, i.e., a regular *.mk2 preset file or a '
+    + 'library preset (library.mk2lib:name)'
 )
+@__push_options
 @click.pass_context
 def push_preset(
     ctx: click.Context,
-    input_file: str
+    input_file: str,
+    verify: bool,
+    if_changed: bool,
+    read_back: bool
 ) -> None:
-    with ctrl.midi_connection(ctx.obj['midi_port']) as (m_in, m_out):
-        ctrl.send_binary_to_device(
-            input_file, ctx.obj['preset'], m_out
-        )
+    if __forward(ctx, {
+        'command': 'push-preset',
+        'input_file': path.abspath(input_file),
+        'verify': verify,
+        'if_changed': if_changed,
+        'read_back': read_back
+    }):
+        return
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    try:
+        config = ctrl.read_binary_file(input_file)
+    except ValueError as ve:
+        logging.error(ve)
+        exit(1)
+    __push(ctx, config, verify, if_changed, read_back)
 
 
-@main.command(help='Push a local JSON preset to the device')
+@main.command(help='Push a local JSON preset to the device(s)')
 @click.option(
     '--input-file', '-i', required=True, metavar='FILE',
     help='JSON input file', multiple=True
@@ -86,45 +272,502 @@ def push_preset(
 @click.option(
     '--check', '-c', is_flag=True, help='Check resulting JSON before pushing'
 )
+@click.option(
+    '--watch', '-w', is_flag=True,
+    help='Keep running and push again whenever an input file changes'
+)
+@click.option(
+    '--debounce', metavar='SECONDS', type=click.FloatRange(min=0),
+    default=0.15, show_default=True,
+    help='With --watch, wait for this quiet period after a change'
+)
+@__push_options
 @click.pass_context
 def push_config_preset(
     ctx: click.Context,
     input_file: List[str],
-    check: bool
+    check: bool,
+    watch: bool,
+    debounce: float,
+    verify: bool,
+    if_changed: bool,
+    read_back: bool
 ) -> None:
+    if watch:
+        # Every change is pushed right away over the open ports
+        unsupported = [option for option, value in [
+            ('--check', check), ('--verify', verify),
+            ('--if-changed', if_changed), ('--read-back', read_back),
+            ('--socket', ctx.obj['socket'])
+        ] if value]
+        if unsupported:
+            raise click.UsageError(
+                f'--watch cannot be combined with {", ".join(unsupported)}.'
+            )
+        __watch(ctx, input_file, debounce)
+        return
+    request = {
+        'command': 'push-config-preset',
+        'input_files': [path.abspath(in_file) for in_file in input_file],
+        'verify': verify,
+        'if_changed': if_changed,
+        'read_back': read_back
+    }
+    if ctx.obj['socket'] and not check:
+        __forward(ctx, request)
+        return
+    from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_files
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+    from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+
     # Combine all provided JSON files
-    config_data: dict = {}
     try:
-        for in_file in input_file:
-            config_data_in_file = load_config_from_file(in_file)
-            config_data = update_config(config_data, config_data_in_file)
+        config_data = load_config_from_files(input_file)
     except ValueError as ve:
         logging.error(ve)
         exit(1)
     if check:
+        from json import dumps
         logging.info(dumps(config_data, indent=4))
         input('Press key to continue...')
-    # Convert to binary structure
-    binary = json_converter.json_to_binary(config_data)
-    config = MPK_MINI_MK2.parse(binary)
-    with ctrl.midi_connection(ctx.obj['midi_port']) as (m_in, m_out):
-        ctrl.send_config_to_device(config, ctx.obj['preset'], m_out)
+        if __forward(ctx, request):
+            return
+    # Convert to binary structure (or take it from the cache)
+    try:
+        binary = compile_config(config_data)
+    except ValueError as ve:
+        logging.error(ve)
+        exit(1)
+    config = MPK_MINI_MK2_COMPILED.parse(binary)
+    __push(ctx, config, verify, if_changed, read_back)
 
 
 @main.command(help='Pull a binary from the device and write to file')
 @click.option(
     '--output-file', '-o', required=True, metavar='FILE',
-    help='Binary output file, i.e., a regular *.mk2 preset file'
+    help='Binary output file, i.e., a regular *.mk2 preset file or a '
+    + 'library preset (library.mk2lib:name)'
 )
 @click.pass_context
 def pull_preset(
     ctx: click.Context,
     output_file: str
 ) -> None:
-    with ctrl.midi_connection(ctx.obj['midi_port']) as (m_in, m_out):
-        binary = ctrl.get_binary_from_device(ctx.obj['preset'], m_in, m_out)
-        with open(output_file, 'wb') as output_file_handle:
-            output_file_handle.write(bytes(binary))
+    if __forward(ctx, {
+        'command': 'pull-preset',
+        'output_file': path.abspath(output_file)
+    }):
+        return
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, m_out):
+        try:
+            binary = ctrl.get_binary_from_device(
+                ctx.obj['preset'], m_in, m_out, ctx.obj['timeout']
+            )
+        except TimeoutError as te:
+            logging.error(te)
+            exit(1)
+        try:
+            ctrl.write_binary_file(output_file, binary)
+        except ValueError as ve:
+            logging.error(ve)
+            exit(1)
+    save_device_state(
+        {__single_midi_port(ctx): binary}, ctx.obj['preset']
+    )
+
+
+@main.command(help='Pull all presets (RAM and 1-4) into one bundle file')
+@click.option(
+    '--output-file', '-o', required=True, metavar='FILE',
+    help='Bundle output file, i.e., concatenated *.mk2 preset files'
+)
+@click.pass_context
+def pull_all(
+    ctx: click.Context,
+    output_file: str
+) -> None:
+    if __forward(ctx, {
+        'command': 'pull-all',
+        'output_file': path.abspath(output_file)
+    }):
+        return
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    midi_port = __single_midi_port(ctx)
+    with ctrl.midi_connection(midi_port) as (m_in, m_out):
+        try:
+            binaries = ctrl.get_binaries_from_device(
+                ctrl.ALL_PRESETS, m_in, m_out, ctx.obj['timeout']
+            )
+        except TimeoutError as te:
+            logging.error(te)
+            exit(1)
+    ctrl.write_bundle_file(output_file, binaries)
+    for preset, binary in zip(ctrl.ALL_PRESETS, binaries):
+        save_device_state({midi_port: binary}, preset)
+    logging.info(f'Wrote presets {ctrl.ALL_PRESETS} to {output_file}')
+
+
+@main.command(help='Push all presets of a bundle file to their slots')
+@click.option(
+    '--input-file', '-i', required=True, metavar='FILE',
+    help='Bundle input file, e.g., written by pull-all'
+)
+@click.pass_context
+def push_all(
+    ctx: click.Context,
+    input_file: str
+) -> None:
+    if __forward(ctx, {
+        'command': 'push-all',
+        'input_file': path.abspath(input_file)
+    }):
+        return
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+    try:
+        configs = ctrl.read_bundle_file(input_file)
+    except ValueError as ve:
+        logging.error(ve)
+        exit(1)
+    midi_port = __single_midi_port(ctx)
+    with ctrl.midi_connection(midi_port) as (_, m_out):
+        ctrl.send_configs_to_device(configs, m_out)
+    for config in configs:
+        save_device_state(
+            {midi_port: MPK_MINI_MK2.build(config)}, config[0].preset
+        )
+    presets = [config[0].preset for config in configs]
+    logging.info(f'Pushed presets {presets} from {input_file}')
+
+
+@main.command(
+    name='compile',
+    help='Compile configuration presets to binary presets in parallel'
+)
+@click.option(
+    '--input', '-i', 'sources', required=True, multiple=True,
+    metavar='DIR|GLOB',
+    help='Directory (searched recursively) or glob pattern of configuration '
+    + 'presets, can be given multiple times'
+)
+@click.option(
+    '--base-file', '-b', multiple=True, metavar='FILE',
+    help='Configuration applied before each preset, can be given multiple '
+    + 'times'
+)
+@click.option(
+    '--output-dir', '-o', required=True, metavar='DIR',
+    help='Directory for the binary presets'
+)
+@click.option(
+    '--jobs', '-j', type=click.IntRange(min=1), metavar='NUM',
+    help='Number of worker processes (default: number of CPUs)'
+)
+def compile_presets(
+    sources: List[str],
+    base_file: List[str],
+    output_dir: str,
+    jobs: Optional[int]
+) -> None:
+    from akai_mpkmini_mkii_ctrl.batch_compiler import (compile_configs,
+                                                       find_config_files)
+    config_files = find_config_files(sources)
+    if not config_files:
+        logging.error('No configuration presets found.')
+        exit(1)
+    failed = 0
+    for result in compile_configs(
+        config_files, output_dir, base_file, jobs
+    ):
+        if result.success:
+            logging.info(f'OK {result.input_file} -> {result.output_file}')
+        else:
+            failed += 1
+            logging.error(f'FAILED {result.input_file}: {result.error}')
+    logging.info(
+        f'Compiled {len(config_files) - failed} of {len(config_files)} presets'
+    )
+    if failed:
+        exit(1)
+
+
+@main.command(help='Pack binary presets into a preset library')
+@click.option(
+    '--input', '-i', 'sources', required=True, multiple=True,
+    metavar='DIR|GLOB',
+    help='Directory (searched recursively) or glob pattern of *.mk2 presets, '
+    + 'can be given multiple times'
+)
+@click.option(
+    '--output-file', '-o', required=True, metavar='FILE',
+    help='Library output file, i.e., a *.mk2lib file'
+)
+@click.option(
+    '--metadata', '-M', multiple=True, metavar='KEY=VALUE',
+    help='Metadata stored with the library, can be given multiple times'
+)
+def pack(
+    sources: List[str],
+    output_file: str,
+    metadata: List[str]
+) -> None:
+    from akai_mpkmini_mkii_ctrl.batch_compiler import (OUTPUT_EXTENSION,
+                                                       find_config_files)
+    from akai_mpkmini_mkii_ctrl.preset_library import pack_library
+    if not all(['=' in entry for entry in metadata]):
+        logging.error('Metadata must be given as KEY=VALUE.')
+        exit(1)
+    preset_files = find_config_files(sources, [OUTPUT_EXTENSION])
+    try:
+        names = pack_library(preset_files, output_file, dict(
+            [entry.split('=', 1) for entry in metadata]
+        ))
+    except (ValueError, OSError) as err:
+        logging.error(err)
+        exit(1)
+    logging.info(f'Packed {len(names)} presets into {output_file}')
+
+
+@main.command(help='Measure the SysEx round-trip latency of the device')
+@click.option(
+    '--cycles', '-n', type=click.IntRange(min=1), default=100,
+    metavar='NUM', help='Number of timed round trips (default: 100)'
+)
+@click.option(
+    '--warmup', type=click.IntRange(min=0), default=5, metavar='NUM',
+    help='Untimed round trips before measuring (default: 5)'
+)
+@click.option(
+    '--output-json', '-o', metavar='FILE',
+    help='Also write the statistics as JSON, use - for stdout'
+)
+@click.pass_context
+def bench_latency(
+    ctx: click.Context,
+    cycles: int,
+    warmup: int,
+    output_json: Optional[str]
+) -> None:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl import latency
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, m_out):
+        round_trips = latency.measure_round_trips(
+            ctx.obj['preset'], m_in, m_out, cycles, ctx.obj['timeout'],
+            warmup
+        )
+    statistics = latency.latency_statistics(round_trips)
+    logging.info(latency.format_statistics(statistics))
+    if output_json:
+        import json
+        with click.open_file(output_json, 'w') as json_handle:
+            json.dump(statistics, json_handle, indent=2)
+    if not round_trips.samples:
+        exit(1)
+
+
+@main.command(help='Show live MIDI events of the device with statistics')
+@click.option(
+    '--stats-only', is_flag=True,
+    help='Only report the statistics, not every single event'
+)
+@click.option(
+    '--report-interval', type=click.FloatRange(min=0.1), default=1.0,
+    metavar='SECONDS', help='Time between two statistics (default: 1.0)'
+)
+@click.option(
+    '--no-mapping', is_flag=True,
+    help='Do not read the preset from the device to name pads and dials'
+)
+@click.pass_context
+def monitor(
+    ctx: click.Context,
+    stats_only: bool,
+    report_interval: float,
+    no_mapping: bool
+) -> None:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl import monitor as event_monitor
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, m_out):
+        names = None
+        if not no_mapping:
+            try:
+                names = event_monitor.event_names(ctrl.get_config_from_device(
+                    ctx.obj['preset'], m_in, m_out, ctx.obj['timeout']
+                ))
+            except TimeoutError as te:
+                logging.warning(f'Controls are not named. {te}')
+
+        def on_event(_: int, status: int, data1: int, data2: int) -> None:
+            click.echo(event_monitor.decode_event(status, data1, data2, names))
+
+        def on_report(report: dict) -> None:
+            logging.info(event_monitor.format_report(report))
+
+        logging.info('Monitoring MIDI events. Stop with Ctrl+C.')
+        try:
+            event_monitor.monitor_events(
+                m_in, None if stats_only else on_event, on_report,
+                report_interval
+            )
+        except KeyboardInterrupt:
+            pass
+
+
+@main.command(help='Record all MIDI events of the device to a binary log')
+@click.option(
+    '--output-file', '-o', required=True, metavar='FILE',
+    help='Recording to append to, created if missing'
+)
+@click.pass_context
+def record(
+    ctx: click.Context,
+    output_file: str
+) -> None:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl import recorder
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, _):
+        logging.info(f'Recording to {output_file}. Stop with Ctrl+C.')
+        try:
+            ring = recorder.record_events(m_in, output_file)
+        except (OSError, ValueError) as err:
+            logging.error(err)
+            exit(1)
+    logging.info(f'Recorded {ring.messages} events, {ring.dropped} dropped')
+
+
+@main.command(help='Replay a recording to a virtual MIDI output port')
+@click.option(
+    '--input-file', '-i', required=True, metavar='FILE',
+    help='Recording written by "record"'
+)
+@click.option(
+    '--port-name', default=f'{DEVICE_NAME} Replay', metavar='NAME',
+    help=f'Name of the virtual port (default: {DEVICE_NAME} Replay)'
+)
+@click.option(
+    '--speed', type=click.FloatRange(min=0.01), default=1.0,
+    metavar='FACTOR', help='Playback speed (default: 1.0)'
+)
+def replay(
+    input_file: str,
+    port_name: str,
+    speed: float
+) -> None:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl import recorder
+    with ctrl.virtual_midi_output(port_name) as midi_out:
+        logging.info(f'Replaying {input_file} to "{port_name}". '
+                     + 'Stop with Ctrl+C.')
+        try:
+            sent = recorder.replay_events(input_file, midi_out, speed)
+        except KeyboardInterrupt:
+            return
+        except (OSError, ValueError) as err:
+            logging.error(err)
+            exit(1)
+    logging.info(f'Replayed {sent} events')
+
+
+@main.command(help='Route remapped MIDI events to a virtual output port')
+@click.option(
+    '--mapping', required=True, metavar='FILE', multiple=True,
+    help='JSON/YAML preset the events are mapped to, one per route'
+)
+@click.option(
+    '--source-file', metavar='FILE',
+    help='JSON/YAML preset on the device (default: read from the device)'
+)
+@click.option(
+    '--port-name', default=f'{DEVICE_NAME} Route', metavar='NAME',
+    help=f'Name of the virtual port (default: {DEVICE_NAME} Route)'
+)
+@click.option(
+    '--switch-channel', type=click.IntRange(1, 16), metavar='CHANNEL',
+    help='Select the route with program changes on this channel'
+)
+@click.pass_context
+def route(
+    ctx: click.Context,
+    mapping: List[str],
+    source_file: Optional[str],
+    port_name: str,
+    switch_channel: Optional[int]
+) -> None:
+    import signal
+    import sys
+
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl import router
+    from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_file
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+    from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+    with ctrl.midi_connection(__single_midi_port(ctx)) as (m_in, m_out):
+        try:
+            if source_file:
+                source = MPK_MINI_MK2_COMPILED.parse(compile_config(
+                    load_config_from_file(source_file)
+                ))
+            else:
+                source = ctrl.get_config_from_device(
+                    ctx.obj['preset'], m_in, m_out, ctx.obj['timeout']
+                )
+            routes = [
+                router.load_route(load_config_from_file(file_path), source,
+                                  file_path)
+                for file_path in mapping
+            ]
+        except (TimeoutError, ValueError) as err:
+            logging.error(err)
+            exit(1)
+        with ctrl.virtual_midi_output(port_name) as midi_out:
+            event_router = router.Router(
+                routes, midi_out,
+                None if switch_channel is None else switch_channel - 1
+            )
+            for index, route_table in enumerate(routes):
+                logging.info(f'Route {index + 1}: {route_table.name}')
+            logging.info(f'Routing to "{port_name}". Enter a route number '
+                         + 'to switch, stop with Ctrl+C.')
+            # Like Ctrl+C, SIGTERM (e.g., of a service manager) ends routing
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            try:
+                with router.routing(m_in, event_router):
+                    for line in sys.stdin:
+                        line = line.strip()
+                        if not line.isdigit():
+                            logging.error(f'Not a route number: {line}')
+                            continue
+                        try:
+                            selected = event_router.select(int(line) - 1)
+                            logging.info(f'Routing {selected.name}')
+                        except ValueError as ve:
+                            logging.error(ve)
+                    # Without an input (e.g., /dev/null or in the background)
+                    # routing goes on until a signal arrives
+                    while True:
+                        signal.pause()
+            except KeyboardInterrupt:
+                pass
+
+
+@main.command(help='Keep the device connected and serve commands sent '
+              + 'with --socket')
+@click.pass_context
+def serve(ctx: click.Context) -> None:
+    from akai_mpkmini_mkii_ctrl import daemon
+    try:
+        daemon.serve(
+            __single_midi_port(ctx),
+            ctx.obj['socket'] or daemon.DEFAULT_SOCKET,
+            ctx.obj['timeout']
+        )
+    except OSError as err:
+        logging.error(err)
+        exit(1)
 
 
 if __name__ == '__main__':
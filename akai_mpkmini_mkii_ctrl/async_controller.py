@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+r"""Asyncio-native midi controller.
+
+One event loop can drive several devices at once. Each ``AsyncMpkController``
+owns the MIDI ports of one device and turns the request/response SysEx
+exchange into an awaited round trip. Replies are handed from the rtmidi
+callback thread to the event loop, so no thread blocks while waiting.
+
+``push_to_devices`` fans a preset out to many devices in parallel and reports
+success and timing per device. Optionally, devices that already hold the
+preset are skipped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from threading import Thread
+from time import perf_counter
+from types import TracebackType
+from typing import (TYPE_CHECKING, Any, Callable, List, NamedTuple, Optional,
+                    Sequence, Tuple, Type)
+
+from construct import ConstructError
+
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl.device_state import (STATE_FILE, Binary,
+                                                 diff_presets,
+                                                 load_device_state,
+                                                 save_device_state)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import (MPK_MINI_MK2,
+                                                MPK_MINI_MK2_COMPILED)
+from akai_mpkmini_mkii_ctrl.profiling import span
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn, MidiOut
+
+
+class PushResult(NamedTuple):
+    """Outcome of pushing a preset to a single device."""
+
+    midi_port: int
+    success: bool
+    elapsed: float
+    error: Optional[str] = None
+    # Unchanged presets are not pushed
+    skipped: bool = False
+    # Field-wise differences to the last known preset on the device
+    changes: Tuple[str, ...] = ()
+
+
+class AsyncMpkController:
+    """Awaitable pull, push and verify calls for one MPKmini MK2."""
+
+    def __init__(  # noqa: D107
+        self,
+        midi_port: int,
+        timeout: float = ctrl.SYSEX_TIMEOUT
+    ) -> None:
+        self.midi_port = midi_port
+        self.timeout = timeout
+        self.midi_in: Optional[MidiIn] = None
+        self.midi_out: Optional[MidiOut] = None
+        self.__receiver: Optional[ctrl.SysexReceiver] = None
+        self.__frames: Optional[asyncio.Queue] = None
+        self.__lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> 'AsyncMpkController':  # noqa: D105
+        await self.connect()
+        return self
+
+    async def __aexit__(  # noqa: D105
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        await self.disconnect()
+
+    async def connect(self, timeout: Optional[float] = None) -> None:
+        loop = asyncio.get_running_loop()
+        opened: asyncio.Future = loop.create_future()
+
+        def deliver(ports: Tuple[MidiIn, MidiOut]) -> None:
+            # Ports opened after the timeout are closed again
+            if opened.cancelled():
+                self.__close_ports(ports)
+            else:
+                opened.set_result(ports)
+
+        def fail(err: Exception) -> None:
+            if not opened.cancelled():
+                opened.set_exception(err)
+
+        def open_ports() -> None:
+            try:
+                ports = self.__open_ports()
+            except Exception as err:  # noqa: B902 - Raised again below
+                self.__call_soon(loop, fail, err)
+                return
+            if not self.__call_soon(loop, deliver, ports):
+                self.__close_ports(ports)
+
+        # Port enumeration and opening block and cannot be cancelled. A
+        # daemon thread keeps them off the loop without asyncio.run (or the
+        # interpreter) waiting for a hung backend at shutdown.
+        Thread(target=open_ports, daemon=True).start()
+        self.midi_in, self.midi_out = await asyncio.wait_for(opened, timeout)
+        frames: asyncio.Queue = asyncio.Queue()
+        self.__frames = frames
+        self.__lock = asyncio.Lock()
+        self.__receiver = ctrl.SysexReceiver(
+            self.midi_in,
+            lambda frame: loop.call_soon_threadsafe(frames.put_nowait, frame)
+        )
+        self.__receiver.__enter__()
+
+    def __open_ports(self) -> Tuple[MidiIn, MidiOut]:
+        with span('open_ports', midi_port=self.midi_port):
+            return ctrl.setup_midi_in_and_out(self.midi_port, False)
+
+    @staticmethod
+    def __close_ports(ports: Tuple[MidiIn, MidiOut]) -> None:
+        for port in ports:
+            port.close_port()
+
+    @staticmethod
+    def __call_soon(
+        loop: asyncio.AbstractEventLoop, callback: Callable, *args: Any
+    ) -> bool:
+        # Schedules a callback from another thread, False if the loop closed
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            return False
+        return True
+
+    async def disconnect(self) -> None:
+        if self.__receiver:
+            self.__receiver.__exit__(None, None, None)
+            self.__receiver = None
+        if self.midi_in:
+            self.midi_in.close_port()
+            self.midi_in = None
+        if self.midi_out:
+            self.midi_out.close_port()
+            self.midi_out = None
+
+    async def pull(self, preset: int) -> bytearray:
+        frames, midi_out, lock = self.__frames, self.midi_out, self.__lock
+        if frames is None or midi_out is None or lock is None:
+            raise RuntimeError('Controller is not connected.')
+        async with lock:
+            # Discard late replies to earlier requests that timed out
+            while not frames.empty():
+                frames.get_nowait()
+            ctrl.send_sysex_from_hex_string(
+                f'f0 47 00 26 66 00 01 0{preset} f7', midi_out
+            )
+            try:
+                with span('receive_sysex', midi_port=self.midi_port):
+                    message = await asyncio.wait_for(
+                        self.__receive_dump(frames, preset), self.timeout
+                    )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f'No SysEx reply from MIDI device within {self.timeout}s.'
+                )
+        return ctrl.patch_dump_to_load(message)
+
+    async def __receive_dump(
+        self, frames: asyncio.Queue, preset: int
+    ) -> bytearray:
+        # Skips late replies that arrive after the request was sent
+        while True:
+            message = await frames.get()
+            if ctrl.is_dump_reply(message, [preset]):
+                return message
+
+    async def pull_config(self, preset: int) -> MPK_MINI_MK2:
+        message = await self.pull(preset)
+        return MPK_MINI_MK2_COMPILED.parse(message)
+
+    async def push(self, config: MPK_MINI_MK2, preset: int) -> None:
+        midi_out, lock = self.midi_out, self.__lock
+        if midi_out is None or lock is None:
+            raise RuntimeError('Controller is not connected.')
+        async with lock:
+            ctrl.send_config_to_device(config, preset, midi_out)
+
+    async def verify(self, config: MPK_MINI_MK2, preset: int) -> bool:
+        config[0].preset = preset
+        expected = MPK_MINI_MK2.build(config)
+        return await self.pull(preset) == expected
+
+    async def push_and_verify(
+        self, config: MPK_MINI_MK2, preset: int
+    ) -> bool:
+        await self.push(config, preset)
+        return await self.verify(config, preset)
+
+
+async def push_to_devices(
+    midi_ports: Sequence[int],
+    config: MPK_MINI_MK2,
+    preset: int,
+    timeout: float = ctrl.SYSEX_TIMEOUT,
+    verify: bool = False,
+    if_changed: bool = False,
+    read_back: bool = False,
+    state_file: str = STATE_FILE
+) -> List[PushResult]:
+    config[0].preset = preset
+    data = MPK_MINI_MK2.build(config)
+    results: List[PushResult] = list(await asyncio.gather(*[
+        __push_to_device(
+            midi_port, data, preset, timeout, verify, if_changed,
+            # Without read-back the local state cache is asked first
+            None if read_back or not if_changed
+            else load_device_state(midi_port, preset, state_file)
+        )
+        for midi_port in midi_ports
+    ]))
+    save_device_state({
+        result.midi_port: data for result in results if result.success
+    }, preset, state_file)
+    return results
+
+
+async def __push_to_device(
+    midi_port: int,
+    data: bytes,
+    preset: int,
+    timeout: float,
+    verify: bool,
+    if_changed: bool,
+    known_state: Optional[bytes]
+) -> PushResult:
+    start = perf_counter()
+    changes: Optional[Tuple[str, ...]] = None
+    if if_changed and known_state:
+        changes = __changes(known_state, data)
+        if changes == ():
+            return PushResult(
+                midi_port, True, perf_counter() - start, skipped=True
+            )
+    # Every device gets its own copy, the preset slot is patched per push
+    config = MPK_MINI_MK2.parse(data)
+    try:
+        controller = AsyncMpkController(midi_port, timeout)
+        # A hung port must not hold up the other devices
+        await controller.connect(timeout)
+        try:
+            if if_changed and not known_state:
+                changes = __changes(await controller.pull(preset), data)
+                if changes == ():
+                    return PushResult(
+                        midi_port, True, perf_counter() - start, skipped=True
+                    )
+            if verify:
+                if not await controller.push_and_verify(config, preset):
+                    return PushResult(
+                        midi_port, False, perf_counter() - start,
+                        'Preset on device differs after push.'
+                    )
+            else:
+                await controller.push(config, preset)
+        finally:
+            await controller.disconnect()
+    except asyncio.TimeoutError:
+        return PushResult(
+            midi_port, False, perf_counter() - start,
+            f'No response from MIDI device within {timeout}s.'
+        )
+    except (OSError, RuntimeError, ValueError) as err:
+        # E.g., no such port or no reply to a pull (TimeoutError)
+        return PushResult(midi_port, False, perf_counter() - start, str(err))
+    return PushResult(
+        midi_port, True, perf_counter() - start, changes=changes or ()
+    )
+
+
+def __changes(current: Binary, data: bytes) -> Optional[Tuple[str, ...]]:
+    # Differences to the preset on the device, None if that is unreadable
+    # (e.g., a corrupt state entry) and the preset is pushed in full
+    try:
+        return tuple(diff_presets(current, data))
+    except ConstructError as err:
+        logging.warning(f'Cannot compare with the preset on the device. {err}')
+        return None
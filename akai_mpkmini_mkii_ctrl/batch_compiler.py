@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+r"""Compile many configuration presets to binary presets in parallel.
+
+Every configuration file is layered on top of optional base files, the same
+way ``push-config-preset`` combines its input files, and compiled in a pool
+of worker processes. Results are yielded as soon as each file is done and a
+broken file is reported without aborting the batch.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os import cpu_count, makedirs, path, replace, walk
+from time import perf_counter
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from akai_mpkmini_mkii_ctrl.config_reader import (JSON_EXTENSIONS,
+                                                  YAML_EXTENSIONS,
+                                                  load_config_from_files)
+from akai_mpkmini_mkii_ctrl.preset_cache import CACHE_DIR, compile_config
+
+CONFIG_EXTENSIONS = JSON_EXTENSIONS + YAML_EXTENSIONS
+OUTPUT_EXTENSION = '.mk2'
+
+
+class CompileResult(NamedTuple):
+    """Outcome of compiling a single configuration file."""
+
+    input_file: str
+    output_file: str
+    success: bool
+    elapsed: float
+    error: Optional[str] = None
+
+
+def find_config_files(
+    sources: Iterable[str],
+    extensions: Sequence[str] = CONFIG_EXTENSIONS
+) -> List[str]:
+    # Sources are directories (searched recursively for files with one of
+    # the extensions) or glob patterns
+    config_files: List[str] = []
+    for source in sources:
+        if path.isdir(source):
+            for root, _, file_names in walk(source):
+                config_files.extend([
+                    path.join(root, file_name) for file_name in file_names
+                    if path.splitext(file_name)[1].lower() in extensions
+                ])
+        else:
+            config_files.extend([
+                file for file in glob(source, recursive=True)
+                if path.isfile(file)
+            ])
+    return sorted(set(path.abspath(file) for file in config_files))
+
+
+def output_files(config_files: Sequence[str], output_dir: str) -> List[str]:
+    # The directory layout below the common parent of all inputs is kept,
+    # so equally named variants in different folders do not collide.
+    if not config_files:
+        return []
+    common_dir = path.commonpath([path.dirname(f) for f in config_files])
+    return [
+        path.join(
+            output_dir,
+            path.splitext(path.relpath(file, common_dir))[0] + OUTPUT_EXTENSION
+        )
+        for file in config_files
+    ]
+
+
+def compile_configs(
+    config_files: Sequence[str],
+    output_dir: str,
+    base_files: Sequence[str] = (),
+    workers: Optional[int] = None,
+    cache_dir: str = CACHE_DIR
+) -> Iterator[CompileResult]:
+    jobs = list(zip(config_files, output_files(config_files, output_dir)))
+    if not jobs:
+        return
+    workers = min(workers or cpu_count() or 1, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                __compile_config, config_file, output_file,
+                list(base_files), cache_dir
+            )
+            for config_file, output_file in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def __compile_config(
+    config_file: str,
+    output_file: str,
+    base_files: List[str],
+    cache_dir: str
+) -> CompileResult:
+    # Runs in a worker process, which also caches the parsed base files
+    start = perf_counter()
+    try:
+        data = compile_config(
+            load_config_from_files(base_files + [config_file]), cache_dir
+        )
+        makedirs(path.dirname(output_file), exist_ok=True)
+        with open(f'{output_file}.tmp', 'wb') as output_handle:
+            output_handle.write(data)
+        replace(f'{output_file}.tmp', output_file)
+    except Exception as err:  # noqa: B902
+        return CompileResult(
+            config_file, output_file, False, perf_counter() - start,
+            str(err) or type(err).__name__
+        )
+    return CompileResult(
+        config_file, output_file, True, perf_counter() - start
+    )
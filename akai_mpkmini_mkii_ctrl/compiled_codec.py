@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+r"""Precompiled fixed-offset codec for fixed-size construct definitions.
+
+Walks a construct definition once and compiles it into offset tables and
+closures that read and write directly from and to a buffer. Parsing and
+building produce and consume the same ``Container``/``ListContainer``
+structures as construct itself, but skip construct's per-call stream,
+context and adapter machinery.
+
+Only the constructs used by fixed-layout formats are supported: ``Sequence``,
+``Struct``, ``Array`` with a constant count, ``Renamed``, ``Const``,
+``Computed`` with a constant value, ``Default``, ``Enum``, ``ExprAdapter``
+and ``FormatField``.
+
+Every struct field and array or sequence item is also addressable on its own
+by a dotted path (e.g. ``1.0.3.note``), so that a single field can be written
+to a built buffer without building everything else again.
+"""
+
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from construct import (Array, Computed, Const, Construct, Container, Default,
+                       Embedded, Enum, ExprAdapter, FormatField, ListContainer,
+                       Renamed, Sequence, Struct)
+from construct.core import (ConstError, EnumInteger, FormatFieldError,
+                            MappingError, StreamError)
+
+Buffer = Union[bytes, bytearray, memoryview]
+Parser = Callable[[Buffer, int], Any]
+Builder = Callable[[Any, bytearray, int], None]
+Compiled = Tuple[int, Parser, Builder]
+# Field path -> (offset, size, builder)
+Fields = Dict[str, Tuple[int, int, Builder]]
+
+
+class CompiledCodec:
+    """Fixed-offset parser and builder compiled from a construct."""
+
+    def __init__(  # noqa: D107
+        self,
+        size: int,
+        template: bytes,
+        consts: List[Tuple[int, bytes]],
+        parser: Parser,
+        builder: Builder,
+        fields: Fields,
+    ) -> None:
+        self.size = size
+        self.template = template
+        self.consts = consts
+        self.fields = fields
+        self.__parser = parser
+        self.__builder = builder
+
+    def sizeof(self) -> int:
+        return self.size
+
+    def parse(self, data: Buffer) -> Any:
+        view = self.check(data)
+        return self.__parser(view, 0)
+
+    def check(self, data: Buffer) -> memoryview:
+        # Validates size and constants without parsing, returns a view
+        view = memoryview(data)
+        if len(view) < self.size:
+            raise StreamError(
+                f'could not read enough bytes, expected {self.size}, '
+                + f'found {len(view)}'
+            )
+        for offset, value in self.consts:
+            if view[offset:offset + len(value)] != value:
+                raise ConstError(
+                    f'parsing expected {value!r} but parsed '
+                    + f'{bytes(view[offset:offset + len(value)])!r}'
+                )
+        return view
+
+    def parse_file(self, file_path: str) -> Any:
+        with open(file_path, 'rb') as file_handle:
+            return self.parse(file_handle.read())
+
+    def build(self, obj: Any) -> bytes:
+        buffer = bytearray(self.template)
+        self.build_into(obj, buffer)
+        return bytes(buffer)
+
+    def build_into(
+        self, obj: Any, buffer: Union[bytearray, memoryview], offset: int = 0
+    ) -> None:
+        if len(buffer) - offset < self.size:
+            raise StreamError(
+                f'could not write {self.size} bytes at offset {offset}'
+            )
+        for const_offset, value in self.consts:
+            start = offset + const_offset
+            buffer[start:start + len(value)] = value
+        try:
+            self.__builder(obj, buffer, offset)  # type: ignore
+        except (ValueError, TypeError, struct.error) as err:
+            raise FormatFieldError(f'building failed, {err}')
+
+    def build_field(
+        self, name: str, obj: Any, buffer: Union[bytearray, memoryview]
+    ) -> Tuple[int, int]:
+        # Writes a single field into a built buffer and returns its byte range
+        try:
+            offset, size, builder = self.fields[name]
+        except KeyError:
+            raise KeyError(f'Unknown field {name}')
+        try:
+            builder(obj, buffer, 0)  # type: ignore
+        except (ValueError, TypeError, struct.error) as err:
+            raise FormatFieldError(f'building {name} failed, {err}')
+        return offset, offset + size
+
+
+def compile_codec(construct: Construct) -> CompiledCodec:
+    consts: List[Tuple[int, bytes]] = []
+    fields: Fields = {}
+    size, parser, builder = __compile(construct, 0, consts, fields)
+    template = bytearray(size)
+    for offset, value in consts:
+        template[offset:offset + len(value)] = value
+    return CompiledCodec(
+        size, bytes(template), consts, parser, builder, fields
+    )
+
+
+def __compile(
+    construct: Construct,
+    offset: int,
+    consts: List[Tuple[int, bytes]],
+    fields: Optional[Fields] = None,
+    prefix: str = ''
+) -> Compiled:
+    # Fields of embedded structs are addressed like those of the parent
+    if isinstance(construct, (Renamed, Embedded)):
+        return __compile(construct.subcon, offset, consts, fields, prefix)
+    if isinstance(construct, Sequence):
+        return __compile_sequence(construct, offset, consts, fields, prefix)
+    if isinstance(construct, Struct):
+        return __compile_struct(construct, offset, consts, fields, prefix)
+    if isinstance(construct, Array):
+        return __compile_array(construct, offset, consts, fields, prefix)
+    if isinstance(construct, Const):
+        return __compile_const(construct, offset, consts)
+    if isinstance(construct, Computed):
+        return __compile_computed(construct)
+    if isinstance(construct, Default):
+        return __compile_default(construct, offset, consts)
+    if isinstance(construct, Enum):
+        return __compile_enum(construct, offset, consts)
+    if isinstance(construct, ExprAdapter):
+        return __compile_expr_adapter(construct, offset, consts)
+    if isinstance(construct, FormatField):
+        return __compile_format_field(construct, offset)
+    raise NotImplementedError(
+        f'Cannot compile construct of type {type(construct).__name__}'
+    )
+
+
+def __compile_sequence(
+    construct: Sequence,
+    offset: int,
+    consts: List[Tuple[int, bytes]],
+    fields: Optional[Fields],
+    prefix: str
+) -> Compiled:
+    parsers: List[Parser] = []
+    builders: List[Builder] = []
+    start = offset
+    for index, subcon in enumerate(construct.subcons):
+        size, parser, builder = __compile(
+            subcon, offset, consts, fields, f'{prefix}{index}.'
+        )
+        __add_field(fields, f'{prefix}{index}', offset, size, builder)
+        parsers.append(parser)
+        builders.append(builder)
+        offset += size
+
+    def parse(view: Buffer, base: int) -> ListContainer:
+        return ListContainer([parser(view, base) for parser in parsers])
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        for builder, item in zip(builders, obj):
+            builder(item, buffer, base)
+
+    return offset - start, parse, build
+
+
+def __compile_struct(
+    construct: Struct,
+    offset: int,
+    consts: List[Tuple[int, bytes]],
+    fields: Optional[Fields],
+    prefix: str
+) -> Compiled:
+    parsers: List[Tuple[str, Parser]] = []
+    required: List[Tuple[str, Builder]] = []
+    optional: List[Tuple[str, Builder]] = []
+    start = offset
+    for subcon in construct.subcons:
+        name = subcon.name
+        size, parser, builder = __compile(
+            subcon, offset, consts, fields,
+            f'{prefix}{name}.' if name else prefix
+        )
+        if name:
+            __add_field(fields, f'{prefix}{name}', offset, size, builder)
+        offset += size
+        if not name:
+            continue
+        parsers.append((name, parser))
+        if size == 0:
+            continue
+        (optional if subcon.flagbuildnone else required).append(
+            (subcon.name, builder)
+        )
+
+    def parse(view: Buffer, base: int) -> Container:
+        return Container([(name, parser(view, base))
+                          for name, parser in parsers])
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        obj = obj if obj is not None else {}
+        for name, builder in required:
+            builder(obj[name], buffer, base)
+        for name, builder in optional:
+            builder(obj.get(name), buffer, base)
+
+    return offset - start, parse, build
+
+
+def __compile_array(
+    construct: Array,
+    offset: int,
+    consts: List[Tuple[int, bytes]],
+    fields: Optional[Fields],
+    prefix: str
+) -> Compiled:
+    if callable(construct.count):
+        raise NotImplementedError('Cannot compile variable-length arrays')
+    count: int = construct.count
+    parsers: List[Parser] = []
+    builders: List[Builder] = []
+    start = offset
+    for index in range(count):
+        size, parser, builder = __compile(
+            construct.subcon, offset, consts, fields, f'{prefix}{index}.'
+        )
+        __add_field(fields, f'{prefix}{index}', offset, size, builder)
+        parsers.append(parser)
+        builders.append(builder)
+        offset += size
+
+    def parse(view: Buffer, base: int) -> ListContainer:
+        return ListContainer([parser(view, base) for parser in parsers])
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        if len(obj) != count:
+            raise ValueError(f'expected {count} elements, found {len(obj)}')
+        for builder, item in zip(builders, obj):
+            builder(item, buffer, base)
+
+    return offset - start, parse, build
+
+
+def __add_field(
+    fields: Optional[Fields],
+    name: str,
+    offset: int,
+    size: int,
+    builder: Builder
+) -> None:
+    if fields is not None and size:
+        fields[name] = (offset, size, builder)
+
+
+def __compile_const(
+    construct: Const, offset: int, consts: List[Tuple[int, bytes]]
+) -> Compiled:
+    value: bytes = construct.value
+    consts.append((offset, value))
+
+    def parse(view: Buffer, base: int) -> bytes:
+        return value
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        if obj not in (None, value):
+            raise ConstError(
+                f'building expected None or {value!r} but got {obj!r}'
+            )
+
+    return len(value), parse, build
+
+
+def __compile_computed(construct: Computed) -> Compiled:
+    if callable(construct.func):
+        raise NotImplementedError('Cannot compile context-dependent values')
+    value = construct.func
+
+    def parse(view: Buffer, base: int) -> Any:
+        return value
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        pass
+
+    return 0, parse, build
+
+
+def __compile_default(
+    construct: Default, offset: int, consts: List[Tuple[int, bytes]]
+) -> Compiled:
+    if callable(construct.value):
+        raise NotImplementedError('Cannot compile context-dependent defaults')
+    default = construct.value
+    size, parser, subbuilder = __compile(construct.subcon, offset, consts)
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        subbuilder(default if obj is None else obj, buffer, base)
+
+    return size, parser, build
+
+
+def __compile_enum(
+    construct: Enum, offset: int, consts: List[Tuple[int, bytes]]
+) -> Compiled:
+    decmapping: Dict[int, Any] = construct.decmapping
+    encmapping: Dict[Any, int] = construct.encmapping
+    size, subparser, subbuilder = __compile(construct.subcon, offset, consts)
+
+    def parse(view: Buffer, base: int) -> Any:
+        value = subparser(view, base)
+        try:
+            return decmapping[value]
+        except KeyError:
+            return EnumInteger(value)
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        if not isinstance(obj, int):
+            try:
+                obj = encmapping[obj]
+            except KeyError:
+                raise MappingError(
+                    f'building failed, no mapping for {obj!r}'
+                )
+        subbuilder(obj, buffer, base)
+
+    return size, parse, build
+
+
+def __compile_expr_adapter(
+    construct: ExprAdapter, offset: int, consts: List[Tuple[int, bytes]]
+) -> Compiled:
+    # The adapter expressions only depend on the value itself, so every
+    # distinct value is passed through construct once and memoized.
+    decoded: Dict[Any, Any] = {}
+    encoded: Dict[Any, Any] = {}
+    size, subparser, subbuilder = __compile(construct.subcon, offset, consts)
+
+    def parse(view: Buffer, base: int) -> Any:
+        value = subparser(view, base)
+        try:
+            return decoded[value]
+        except KeyError:
+            decoded[value] = construct._decode(value, None, None)
+            return decoded[value]
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        try:
+            value = encoded[obj]
+        except KeyError:
+            value = encoded[obj] = construct._encode(obj, None, None)
+        subbuilder(value, buffer, base)
+
+    return size, parse, build
+
+
+def __compile_format_field(construct: FormatField, offset: int) -> Compiled:
+    if construct.length == 1 and construct.fmtstr[-1] == 'B':
+        def parse_byte(view: Buffer, base: int) -> int:
+            return view[base + offset]
+
+        def build_byte(obj: Any, buffer: bytearray, base: int) -> None:
+            buffer[base + offset] = obj
+
+        return 1, parse_byte, build_byte
+
+    packer = struct.Struct(construct.fmtstr)
+
+    def parse(view: Buffer, base: int) -> Any:
+        return packer.unpack_from(view, base + offset)[0]
+
+    def build(obj: Any, buffer: bytearray, base: int) -> None:
+        packer.pack_into(buffer, base + offset, obj)
+
+    return construct.length, parse, build
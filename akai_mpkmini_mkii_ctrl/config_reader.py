@@ -2,35 +2,50 @@
 r"""Configuration file reader."""
 
 import collections.abc
-from json import JSONDecodeError, load
+from collections import OrderedDict
+from json import JSONDecodeError, loads
+from os import path, stat
+from typing import Any, Iterable, Tuple
 
 import yaml
 
+from akai_mpkmini_mkii_ctrl.profiling import span
+
 UNSUPPORTED_ERROR = 'Unsupported configuration file format: '
+JSON_EXTENSIONS = ['.json']
+YAML_EXTENSIONS = ['.yaml', '.yml']
 
+# The C implementation of libyaml is much faster, if PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-def load_config_from_file(file_path: str) -> dict:
-    try:
-        # Assuming JSON format...
-        with open(file_path, 'r') as json_handle:
-            config_json: dict = load(json_handle)
-            if not isinstance(config_json, dict):
-                raise ValueError(f'{UNSUPPORTED_ERROR}{file_path}')
-            return config_json
-    except JSONDecodeError:
-        pass
+# Parsed files kept in memory, the least recently used ones are evicted
+MAX_CACHED_CONFIGS = 64
 
-    try:
-        # ... then YAML format
-        with open(file_path, 'r') as yaml_handle:
-            config_yml: dict = yaml.safe_load(yaml_handle)
-            if not isinstance(config_yml, dict):
-                raise ValueError(f'{UNSUPPORTED_ERROR}{file_path}')
-            return config_yml
-    except yaml.YAMLError:
-        pass
+# Absolute path -> (mtime in ns, size, parsed configuration)
+__CONFIG_CACHE: 'OrderedDict[str, Tuple[int, int, dict]]' = OrderedDict()
 
-    raise ValueError(f'{UNSUPPORTED_ERROR}{file_path}')
+
+def load_config_from_file(file_path: str) -> dict:
+    # Shared layers like a base configuration are parsed once per process
+    # (and again only if they change on disk). Callers get their own copy,
+    # as update_config extends configurations in place.
+    file_stat = stat(file_path)
+    cache_key = path.abspath(file_path)
+    cached = __CONFIG_CACHE.get(cache_key)
+    if (
+        not cached
+        or cached[0] != file_stat.st_mtime_ns
+        or cached[1] != file_stat.st_size
+    ):
+        with span('parse_config', file=file_path):
+            with open(file_path, 'r') as config_handle:
+                config = __parse_config(config_handle.read(), file_path)
+        cached = (file_stat.st_mtime_ns, file_stat.st_size, config)
+        __CONFIG_CACHE[cache_key] = cached
+    __CONFIG_CACHE.move_to_end(cache_key)
+    while len(__CONFIG_CACHE) > MAX_CACHED_CONFIGS:
+        __CONFIG_CACHE.popitem(last=False)
+    return __copy_config(cached[2])
 
 
 def update_config(d: dict, u: collections.abc.Mapping) -> dict:
@@ -40,3 +55,48 @@ def update_config(d: dict, u: collections.abc.Mapping) -> dict:
         else:
             d[k] = v
     return d
+
+
+def load_config_from_files(file_paths: Iterable[str]) -> dict:
+    # Combine all provided files, later files extend/overwrite earlier ones
+    config: dict = {}
+    for file_path in file_paths:
+        with span('load_config', file=file_path):
+            layer = load_config_from_file(file_path)
+        with span('update_config'):
+            config = update_config(config, layer)
+    return config
+
+
+def __parse_config(content: str, file_path: str) -> dict:
+    # The format is told by the extension or else by the content. JSON is
+    # tried first if it looks like JSON, YAML covers everything else.
+    extension = path.splitext(file_path)[1].lower()
+    if extension in JSON_EXTENSIONS or (
+        extension not in YAML_EXTENSIONS and content.lstrip()[:1] == '{'
+    ):
+        try:
+            return __check_config(loads(content), file_path)
+        except JSONDecodeError:
+            pass
+    try:
+        return __check_config(
+            yaml.load(content, Loader=YAML_LOADER), file_path
+        )
+    except yaml.YAMLError:
+        raise ValueError(f'{UNSUPPORTED_ERROR}{file_path}')
+
+
+def __check_config(config: Any, file_path: str) -> dict:
+    if not isinstance(config, dict):
+        raise ValueError(f'{UNSUPPORTED_ERROR}{file_path}')
+    return config
+
+
+def __copy_config(value: Any) -> Any:
+    # Cheaper than copy.deepcopy for the plain types JSON and YAML produce
+    if isinstance(value, dict):
+        return {key: __copy_config(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [__copy_config(item) for item in value]
+    return value
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+r"""Declarative schema of configuration presets.
+
+A schema is a list of fields with their dotted path, type, default value and
+an optional domain of choices or range. It is compiled once into a tree of
+path segments, so that all values of a configuration are read in a single
+traversal. All invalid values of a configuration are reported together.
+
+A value that is missing, empty or ``null`` takes the default. Banks are
+strings of a fixed number of space-separated entries, e.g., ``'C1 D1 E1'``,
+whose entries are converted and checked one by one.
+"""
+
+import logging
+from typing import (Any, Callable, Dict, List, NamedTuple, Optional, Sequence,
+                    Tuple, Union)
+
+from construct import Construct, Default, Enum, Renamed
+
+
+class SchemaField(NamedTuple):
+    """Declaration of a single configuration value."""
+
+    path: str
+    # Converter of the value or, for banks, of every entry, e.g., int
+    type: Callable[[Any], Any]  # noqa: A003
+    default: Any
+    choices: Optional[Sequence[Any]] = None
+    range: Optional[Tuple[int, int]] = None  # noqa: A003
+    # Number of entries of a bank, 0 for a single value
+    entries: int = 0
+
+
+class ConfigError(ValueError):
+    """Invalid values of a configuration, all of them at once."""
+
+    def __init__(self, errors: List[str]) -> None:  # noqa: D107
+        super().__init__(
+            'Invalid configuration:\n'
+            + '\n'.join([f'- {error}' for error in errors])
+        )
+        self.errors = errors
+
+
+# Path segment -> subtree or index of the field
+Tree = Dict[str, Union['Tree', int]]
+Checker = Callable[[Any], Any]
+
+
+class CompiledSchema:
+    """Flat accessor table of a schema, compiled by ``compile_schema``."""
+
+    def __init__(  # noqa: D107
+        self,
+        fields: List[SchemaField],
+        tree: Tree,
+        checkers: List[Checker],
+        defaults: List[Any]
+    ) -> None:
+        self.fields = fields
+        self.__tree = tree
+        self.__checkers = checkers
+        self.__defaults = defaults
+
+    def read(self, config: Optional[dict]) -> List[Any]:
+        # Converted values in the order of the fields
+        values = list(self.__defaults)
+        errors: List[str] = []
+        unknown: List[str] = []
+        self.__walk(self.__tree, config or {}, '', values, errors, unknown)
+        if unknown:
+            logging.warning(
+                f'Unknown configuration keys ignored: {", ".join(unknown)}'
+            )
+        if errors:
+            raise ConfigError(errors)
+        return values
+
+    def __walk(
+        self,
+        tree: Tree,
+        config: Any,
+        prefix: str,
+        values: List[Any],
+        errors: List[str],
+        unknown: List[str]
+    ) -> None:
+        if not isinstance(config, dict):
+            errors.append(
+                f'{prefix[:-1]}: Expected a mapping, found {config!r}'
+            )
+            return
+        for key, value in config.items():
+            node = tree.get(key)
+            if node is None:
+                unknown.append(f'{prefix}{key}')
+            elif value is None or value == '':
+                continue  # The default applies
+            elif isinstance(node, dict):
+                self.__walk(node, value, f'{prefix}{key}.', values, errors,
+                            unknown)
+            else:
+                try:
+                    values[node] = self.__checkers[node](value)
+                except ValueError as ve:
+                    errors.append(f'{prefix}{key}: {ve}')
+
+
+def compile_schema(fields: Sequence[SchemaField]) -> CompiledSchema:
+    tree: Tree = {}
+    checkers: List[Checker] = []
+    defaults: List[Any] = []
+    for index, field in enumerate(fields):
+        *parents, name = field.path.split('.')
+        node = tree
+        for parent in parents:
+            subtree = node.setdefault(parent, {})
+            if not isinstance(subtree, dict):
+                raise ValueError(f'Field {field.path} is inside a value.')
+            node = subtree
+        if name in node:
+            raise ValueError(f'Field {field.path} is declared twice.')
+        node[name] = index
+        checker = __compile_checker(field)
+        checkers.append(checker)
+        defaults.append(checker(field.default))
+    return CompiledSchema(list(fields), tree, checkers, defaults)
+
+
+def enum_choices(construct: Construct) -> List[str]:
+    # Names of an (optionally renamed or defaulted) construct Enum
+    while isinstance(construct, (Renamed, Default)):
+        construct = construct.subcon
+    if not isinstance(construct, Enum):
+        raise ValueError(f'{construct} is not an Enum')
+    return [str(name) for name in construct.encmapping]
+
+
+def __compile_checker(field: SchemaField) -> Checker:
+    convert, choices, value_range = field.type, field.choices, field.range
+
+    def check(value: Any) -> Any:
+        try:
+            converted = convert(value)
+        except (ValueError, TypeError):
+            raise ValueError(f'Invalid value {value!r}')
+        if choices is not None and converted not in choices:
+            raise ValueError(
+                f'Invalid value {value!r}, expected one of '
+                + ', '.join([str(choice) for choice in choices])
+            )
+        if value_range and not value_range[0] <= converted <= value_range[1]:
+            raise ValueError(
+                f'Value {value!r} out of range '
+                + f'{value_range[0]}-{value_range[1]}'
+            )
+        return converted
+
+    if not field.entries:
+        return check
+    entries = field.entries
+
+    def check_bank(value: Any) -> List[Any]:
+        if not isinstance(value, str):
+            raise ValueError(f'Expected {entries} entries, found {value!r}')
+        bank = value.split()
+        if len(bank) != entries:
+            raise ValueError(
+                f'Expected {entries} entries, found {len(bank)} in {value!r}'
+            )
+        converted: List[Any] = []
+        errors: List[str] = []
+        for entry in bank:
+            try:
+                converted.append(check(entry))
+            except ValueError as ve:
+                errors.append(str(ve))
+        if errors:
+            raise ValueError(', '.join(errors))
+        return converted
+
+    return check_bank
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+r"""Watch configuration files and recompile them on change.
+
+Changes are reported by the Linux inotify API, i.e., without polling. The
+directories of the files are watched instead of the files themselves, as
+many editors save by writing a new file and renaming it over the old one.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import select
+import struct
+from os import close, fsdecode, path, read
+from time import monotonic
+from types import TracebackType
+from typing import Dict, Iterable, Iterator, Optional, Set, Type
+
+from construct.core import ConstructError
+
+from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_files
+from akai_mpkmini_mkii_ctrl.json_converter import update_binary
+from akai_mpkmini_mkii_ctrl.preset_cache import CACHE_DIR, compile_config
+
+# Quiet period that ends a burst of changes, e.g., several saves
+DEBOUNCE = 0.15
+
+# inotify(7) flags and events
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_EVENTS = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+# struct inotify_event: wd, mask, cookie, length of the name that follows
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class FileWatcher:
+    """Report changes to a set of files via inotify."""
+
+    def __init__(self, file_paths: Iterable[str]) -> None:  # noqa: D107
+        self.file_paths = set([path.abspath(file) for file in file_paths])
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('Watching files requires inotify, i.e., Linux.')
+        self.__fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'Cannot initialize inotify.')
+        self.__directories: Dict[int, str] = {}
+        for directory in set([path.dirname(f) for f in self.file_paths]):
+            watch = libc.inotify_add_watch(
+                self.__fd, directory.encode(), WATCH_EVENTS
+            )
+            if watch < 0:
+                close(self.__fd)
+                raise OSError(
+                    ctypes.get_errno(), f'Cannot watch directory {directory}.'
+                )
+            self.__directories[watch] = directory
+
+    def __enter__(self) -> 'FileWatcher':  # noqa: D105
+        return self
+
+    def __exit__(  # noqa: D105
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        close(self.__fd)
+
+    def wait(
+        self,
+        timeout: Optional[float] = None,
+        debounce: float = DEBOUNCE
+    ) -> Set[str]:
+        # Blocks until files changed and no further change followed within
+        # the debounce period. Returns no files if the timeout passed.
+        deadline = None if timeout is None else monotonic() + timeout
+        changed: Set[str] = set()
+        while True:
+            if changed:
+                wait_time: Optional[float] = debounce
+            elif deadline is None:
+                wait_time = None
+            else:
+                wait_time = max(0.0, deadline - monotonic())
+            ready, _, _ = select.select([self.__fd], [], [], wait_time)
+            if not ready:
+                return changed
+            changed |= self.__read_events()
+
+    def __read_events(self) -> Set[str]:
+        changed: Set[str] = set()
+        try:
+            data = read(self.__fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            watch, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            # File names are bytes, not necessarily UTF-8
+            name = fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            file = path.join(self.__directories.get(watch, ''), name)
+            if file in self.file_paths:
+                changed.add(file)
+        return changed
+
+
+def watch_configs(
+    file_paths: Iterable[str],
+    debounce: float = DEBOUNCE,
+    timeout: Optional[float] = None,
+    cache_dir: str = CACHE_DIR
+) -> Iterator[bytes]:
+    # Yields the compiled preset first and then whenever a change of the
+    # configuration files results in a different preset. Broken states
+    # while editing are logged and skipped. Stops after a timeout without
+    # any change, if given.
+    # After the first conversion only the bytes controlled by the changed
+    # configuration paths are encoded again.
+    file_paths = list(file_paths)
+    last_config: Optional[dict] = None
+    last_data: Optional[bytes] = None
+    with FileWatcher(file_paths) as watcher:
+        while True:
+            try:
+                config = load_config_from_files(file_paths)
+                if last_config is None or last_data is None:
+                    data = compile_config(config, cache_dir)
+                else:
+                    buffer = bytearray(last_data)
+                    update_binary(buffer, last_config, config)
+                    data = bytes(buffer)
+            except (
+                ValueError, KeyError, TypeError, OSError, ConstructError
+            ) as err:
+                logging.error(f'Configuration not usable. {err}')
+            else:
+                last_config = config
+                if data != last_data:
+                    last_data = data
+                    yield data
+                else:
+                    logging.debug('Configuration changed, preset did not')
+            if not watcher.wait(timeout, debounce):
+                return
@@ -1,26 +1,44 @@
 # -*- coding: utf-8 -*-
 r"""Midi controller."""
 
-import binascii
+from __future__ import annotations
+
 import logging
 from contextlib import contextmanager
-from time import sleep
-from typing import Generator, List, Tuple
+from queue import Empty, SimpleQueue
+from time import monotonic
+from types import TracebackType
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Generator, List,
+                    Optional, Sequence, Tuple, Type)
+
+from construct.core import ConstError, StreamError
 
-import rtmidi
-from construct.core import ConstError
-from rtmidi import MidiIn, MidiOut, RtMidiError, midiutil
+from akai_mpkmini_mkii_ctrl import DEVICE_NAME, SYSEX_TIMEOUT
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import (MPK_MINI_MK2,
+                                                MPK_MINI_MK2_COMPILED)
+from akai_mpkmini_mkii_ctrl.preset_library import (Preset, PresetLibrary,
+                                                   split_reference,
+                                                   update_library)
+from akai_mpkmini_mkii_ctrl.profiling import span
 
-from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+if TYPE_CHECKING:
+    # rtmidi loads the native MIDI backend, so it is imported on first use
+    from rtmidi import MidiIn, MidiOut
 
-DEVICE_NAME = 'MPK Mini Mk II'
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+# Preset slots of the device (0 = RAM, 1-4 = Stored preset)
+ALL_PRESETS = [0, 1, 2, 3, 4]
+# Size of a single preset SysEx message, i.e., a *.mk2 file
+PRESET_SIZE = 117
 
 
 @contextmanager
 def midi_connection(
     midi_port: int
 ) -> Generator[Tuple[MidiIn, MidiOut], None, None]:
-    midi_in, midi_out = setup_midi_in_and_out(midi_port)
+    with span('open_ports', midi_port=midi_port):
+        midi_in, midi_out = setup_midi_in_and_out(midi_port)
     try:
         yield (midi_in, midi_out)
     finally:
@@ -28,17 +46,56 @@ def midi_connection(
         midi_out.close_port()
 
 
-def setup_midi_in_and_out(midi_port: int) -> Tuple[MidiIn, MidiOut]:
+@contextmanager
+def virtual_midi_output(port_name: str) -> Generator[MidiOut, None, None]:
+    # Output port other applications, e.g., a DAW, can connect to
+    import rtmidi
+    midi_out = rtmidi.MidiOut()
+    midi_out.open_virtual_port(port_name)
+    try:
+        yield midi_out
+    finally:
+        midi_out.close_port()
+
+
+def find_device_ports(device_name: str = DEVICE_NAME) -> List[int]:
+    import rtmidi
+    in_ports = rtmidi.MidiIn().get_ports()
+    out_ports = rtmidi.MidiOut().get_ports()
+    return [
+        port for port, name in enumerate(out_ports)
+        if device_name in name
+        and port < len(in_ports) and device_name in in_ports[port]
+    ]
+
+
+def setup_midi_in_and_out(
+    midi_port: int,
+    interactive: bool = True
+) -> Tuple[MidiIn, MidiOut]:
+    import rtmidi
+    from rtmidi import midiutil
+
     # Setup MIDI sender
     midi_out = rtmidi.MidiOut()
     try:
         midi_out.open_port(midi_port)
-    except RtMidiError as err:
+    except rtmidi.RtMidiError as err:
         logging.error(f'Cannot connect to MIDI device. {err}')
+        if not interactive:
+            raise OSError(f'Cannot connect to MIDI device. {err}') from err
     midi_out_port_name = midi_out.get_port_name(midi_port)
 
-    # Setup MIDI receiver
-    midi_in, midi_in_port_name = midiutil.open_midiinput(midi_port)
+    # Setup MIDI receiver (non-interactive raises instead of prompting)
+    try:
+        midi_in, midi_in_port_name = midiutil.open_midiinput(
+            midi_port, interactive=interactive
+        )
+    except rtmidi.RtMidiError as err:
+        if interactive:
+            raise
+        midi_out.close_port()
+        raise OSError(f'Cannot connect to MIDI device. {err}') from err
     midi_in.ignore_types(sysex=False)  # !! Otherwise no sysex receiver
 
     # Check that we're actually connected with an AKAI MPKmini MK2
@@ -57,13 +114,98 @@ def send_binary_to_device(
     preset: int,
     midi_out: MidiOut
 ) -> None:
+    try:
+        library_path, name = split_reference(file_path)
+        if not name:
+            # Valid bytes are sent as read, without a parse/build round trip
+            data = read_binary_data(file_path)
+            data[7] = preset
+            send_binary_data_to_device(data, preset, midi_out)
+            return
+        with PresetLibrary(library_path) as library:
+            with library.get(name) as view:
+                send_binary_data_to_device(view, preset, midi_out)
+    except ValueError as ve:
+        logging.error(ve)
+
+
+def send_binary_data_to_device(
+    data: Preset,
+    preset: int,
+    midi_out: MidiOut
+) -> None:
+    # Sends a compiled preset as is, i.e., without building it again
+    if data[7] != preset:
+        patched = bytearray(data)
+        patched[7] = preset
+        data = patched
+    with span('send_message', size=len(data)):
+        # Zero-copy if the preset slot matches, e.g., for a library slice
+        midi_out.send_message(data)
+    __log_sysex('SENT', data)
+
+
+def read_binary_data(file_path: str) -> bytearray:
+    # Reads and validates a preset without parsing it. Also reads presets
+    # from libraries, i.e., 'library.mk2lib:name'.
+    library_path, name = split_reference(file_path)
+    if name:
+        with PresetLibrary(library_path) as library:
+            data = bytearray(library.get(name))
+    else:
+        data = bytearray(PRESET_SIZE)
+        with open(file_path, 'rb') as in_file_byte:
+            # A short read leaves zeros that would pass as preset values
+            if in_file_byte.readinto(data) != PRESET_SIZE:
+                raise ValueError(
+                    f'Input file {file_path} is not a valid binary format.'
+                )
+    try:
+        MPK_MINI_MK2_COMPILED.check(data)
+    except (ConstError, StreamError):
+        raise ValueError(
+            f'Input file {file_path} is not a valid binary format.'
+        )
+    return data
+
+
+def read_binary_file(file_path: str) -> MPK_MINI_MK2:
+    return MPK_MINI_MK2_COMPILED.parse(read_binary_data(file_path))
+
+
+def write_binary_file(file_path: str, binary: Preset) -> None:
+    # Writing to 'library.mk2lib:name' adds or replaces a library preset
+    library_path, name = split_reference(file_path)
+    if name:
+        update_library(library_path, {name: binary})
+        return
+    with open(file_path, 'wb') as output_file_handle:
+        output_file_handle.write(binary)
+
+
+def read_bundle_file(file_path: str) -> List[MPK_MINI_MK2]:
+    # A bundle is a plain concatenation of preset SysEx messages, each one
+    # carrying its target slot in the preset byte.
     with open(file_path, 'rb') as in_file_byte:
-        data = in_file_byte.read(2000)
+        data = in_file_byte.read()
+    if not data or len(data) % PRESET_SIZE:
+        raise ValueError(
+            f'Input file {file_path} is not a valid bundle format.'
+        )
     try:
-        config = MPK_MINI_MK2.parse(data)
-        send_config_to_device(config, preset, midi_out)
+        return [
+            MPK_MINI_MK2.parse(data[offset:offset + PRESET_SIZE])
+            for offset in range(0, len(data), PRESET_SIZE)
+        ]
     except ConstError:
-        logging.error(f'Input file {file_path} is not a valid binary format.')
+        raise ValueError(
+            f'Input file {file_path} is not a valid bundle format.'
+        )
+
+
+def write_bundle_file(file_path: str, binaries: Sequence[Preset]) -> None:
+    with open(file_path, 'wb') as output_file_handle:
+        output_file_handle.writelines(binaries)
 
 
 def send_config_to_device(
@@ -72,29 +214,93 @@ def send_config_to_device(
     midi_out: MidiOut
 ) -> None:
     config[0].preset = preset
-    data = MPK_MINI_MK2.build(config)
+    with span('construct_build'):
+        data = MPK_MINI_MK2.build(config)
     assert data[0] == 0xF0 and data[-1] == 0xF7
-    midi_out.send_message(data)
-    data_hex = str(binascii.hexlify(bytearray(data)), 'utf-8')
-    logging.debug(f'- SENT {len(data)} BYTES. SYSEX:\n{data_hex}')
+    with span('send_message', size=len(data)):
+        midi_out.send_message(data)
+    __log_sysex('SENT', data)
 
 
 def get_binary_from_device(
     preset: int,
     midi_in: MidiIn,
-    midi_out: MidiOut
-) -> List[int]:
-    send_sysex_from_hex_string(f'f0 47 00 26 66 00 01 0{preset} f7', midi_out)
-    return receive_sysex(midi_in)
+    midi_out: MidiOut,
+    timeout: float = SYSEX_TIMEOUT
+) -> bytearray:
+    # Listen before asking so that a fast reply cannot be missed
+    with SysexReceiver(midi_in, discard_pending=True) as receiver:
+        send_sysex_from_hex_string(
+            f'f0 47 00 26 66 00 01 0{preset} f7', midi_out
+        )
+        return __receive_dumps(receiver, [preset], timeout)[preset]
+
+
+def get_binaries_from_device(
+    presets: List[int],
+    midi_in: MidiIn,
+    midi_out: MidiOut,
+    timeout: float = SYSEX_TIMEOUT
+) -> List[bytearray]:
+    # All requests are sent back to back and the replies are matched to
+    # their slots by the preset byte, in whatever order they arrive.
+    with SysexReceiver(midi_in, discard_pending=True) as receiver:
+        for preset in presets:
+            send_sysex_from_hex_string(
+                f'f0 47 00 26 66 00 01 0{preset} f7', midi_out
+            )
+        replies = __receive_dumps(receiver, presets, timeout)
+    return [replies[preset] for preset in presets]
+
+
+def __receive_dumps(
+    receiver: SysexReceiver,
+    presets: List[int],
+    timeout: float
+) -> Dict[int, bytearray]:
+    # Dump replies by preset slot. Other frames, e.g., a late reply to an
+    # earlier request that timed out, are skipped.
+    replies: Dict[int, bytearray] = {}
+    deadline = monotonic() + timeout
+    while len(replies) < len(presets):
+        try:
+            message = receiver.receive(max(deadline - monotonic(), 0))
+        except TimeoutError:
+            missing = [p for p in presets if p not in replies]
+            raise TimeoutError(
+                f'No SysEx reply for presets {missing} within {timeout}s.'
+            )
+        if is_dump_reply(message, presets):
+            replies[message[7]] = patch_dump_to_load(message)
+        else:
+            logging.debug('Skipped SysEx frame that is no requested dump')
+    return replies
+
+
+def is_dump_reply(message: Preset, presets: List[int]) -> bool:
+    return (
+        len(message) == PRESET_SIZE and message[4] == 103
+        and message[7] in presets
+    )
 
 
 def get_config_from_device(
     preset: int,
     midi_in: MidiIn,
-    midi_out: MidiOut
+    midi_out: MidiOut,
+    timeout: float = SYSEX_TIMEOUT
 ) -> MPK_MINI_MK2:
-    message = get_binary_from_device(preset, midi_in, midi_out)
-    return MPK_MINI_MK2.parse(bytearray(message))
+    message = get_binary_from_device(preset, midi_in, midi_out, timeout)
+    return MPK_MINI_MK2_COMPILED.parse(message)
+
+
+def send_configs_to_device(
+    configs: List[MPK_MINI_MK2],
+    midi_out: MidiOut
+) -> None:
+    # Every preset goes to the slot recorded in its own preset byte
+    for config in configs:
+        send_config_to_device(config, config[0].preset, midi_out)
 
 
 def send_sysex_from_hex_string(
@@ -103,26 +309,114 @@ def send_sysex_from_hex_string(
 ) -> None:
     data = bytearray.fromhex(hex_string)
     assert data[0] == 0xF0 and data[-1] == 0xF7
-    midi_out.send_message(data)
-    data_hex = str(binascii.hexlify(bytearray(data)), 'utf-8')
-    logging.debug(f'- SENT {len(data)} BYTES. SYSEX:\n{data_hex}')
+    with span('send_message', size=len(data)):
+        midi_out.send_message(data)
+    __log_sysex('SENT', data)
 
 
 def receive_sysex(
-    midi_in: MidiIn
-) -> List[int]:
-    message = None
-    while True:
-        raw_tuple = midi_in.get_message()
-        if raw_tuple:
-            message = raw_tuple[0]
-            break
-        sleep(0.01)
-    assert len(message) == 117
+    midi_in: MidiIn,
+    timeout: float = SYSEX_TIMEOUT
+) -> bytearray:
+    # Next dump reply of any preset, also one that arrived before the call.
+    # Other SysEx frames are skipped.
+    deadline = monotonic() + timeout
+    with SysexReceiver(midi_in) as receiver:
+        while True:
+            try:
+                message = receiver.receive(max(deadline - monotonic(), 0))
+            except TimeoutError:
+                raise TimeoutError(
+                    f'No SysEx reply from MIDI device within {timeout}s.'
+                )
+            if is_dump_reply(message, ALL_PRESETS):
+                return patch_dump_to_load(message)
+            logging.debug('Skipped SysEx frame that is no dump')
+
+
+def patch_dump_to_load(message: bytearray) -> bytearray:
+    # Patched in place, the received frame is passed on without copies
+    assert len(message) == PRESET_SIZE
     assert message[4] == 103
     # Flip 4-th position from DEC 103 (HEX 67) to DEC 100 (HEX 64)
     # to flip patch from 'Receive' to 'Send'
     message[4] = 100
-    message_hex = ''.join([str(hex(m))[2:].zfill(2) for m in message])
-    logging.debug(f'- RECEIVED {len(message)} BYTES. SYSEX:\n{message_hex}')
+    __log_sysex('RECEIVED', message)
     return message
+
+
+def __log_sysex(direction: str, data: Preset) -> None:
+    # Hex dumps are only worth their cost if they are actually logged
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        data_hex = data.hex()
+        logging.debug(f'- {direction} {len(data)} BYTES. SYSEX:\n{data_hex}')
+
+
+class SysexReceiver:
+    """Collect complete SysEx frames from a MIDI input via its callback.
+
+    While active, the receiver owns the input callback of ``midi_in``. All
+    non-SysEx traffic (notes, clock, ...) is dropped and SysEx frames split
+    across several callbacks are reassembled until the closing F7 arrives.
+    Complete frames are assembled into a ``bytearray``, the only copy of the
+    received data, and queued for ``receive`` or, if given, handed to
+    ``on_frame`` from the MIDI backend thread instead.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        midi_in: MidiIn,
+        on_frame: Optional[Callable[[bytearray], Any]] = None,
+        discard_pending: bool = False
+    ) -> None:
+        self.midi_in = midi_in
+        self.__frames: SimpleQueue = SimpleQueue()
+        self.__on_frame = on_frame if on_frame else self.__frames.put
+        self.__partial: Optional[bytearray] = None
+        self.__discard_pending = discard_pending
+
+    def __enter__(self) -> 'SysexReceiver':  # noqa: D105
+        # Messages queued before the callback was set are received first,
+        # unless discarded. Callers that only send their requests once the
+        # receiver listens discard them, as they can only be late replies
+        # to earlier requests that timed out.
+        while True:
+            event = self.midi_in.get_message()
+            if not event:
+                break
+            if not self.__discard_pending:
+                self.__on_message(event, None)
+        self.midi_in.set_callback(self.__on_message)
+        return self
+
+    def __exit__(  # noqa: D105
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.midi_in.cancel_callback()
+
+    def receive(self, timeout: float = SYSEX_TIMEOUT) -> bytearray:
+        try:
+            with span('receive_sysex'):
+                return self.__frames.get(timeout=timeout)
+        except Empty:
+            raise TimeoutError(
+                f'No SysEx reply from MIDI device within {timeout}s.'
+            )
+
+    def __on_message(self, event: Tuple[List[int], float], _: Any) -> None:
+        message = event[0]
+        if not message:
+            return
+        if message[0] == SYSEX_START:
+            self.__partial = bytearray(message)
+        elif self.__partial is not None and message[0] < 0x80:
+            # Continuation chunk of a SysEx frame split by the MIDI backend
+            self.__partial.extend(message)
+        else:
+            return  # Notes, clock or other non-SysEx traffic
+        if self.__partial[-1] == SYSEX_END:
+            self.__on_frame(self.__partial)
+            self.__partial = None
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+r"""Persistent daemon that keeps the MIDI ports open.
+
+The daemon opens the device once and serves push, pull and print commands
+over a local Unix socket. Clients send one JSON request per line and receive
+one JSON response per line, so a single connection can carry many commands.
+
+- Request: ``{"command": "push-preset", "preset": 0, "input_file": "..."}``
+- Response: ``{"ok": true, "output": "..."}`` or
+  ``{"ok": false, "error": "..."}``
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import socket
+from os import environ, path, remove
+from threading import Event
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Optional
+
+from akai_mpkmini_mkii_ctrl import SYSEX_TIMEOUT
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn, MidiOut
+
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+# The client side (send_command) is used by every forwarded CLI call, so the
+# device-side modules are only imported where requests are actually served.
+
+DEFAULT_SOCKET = path.join(
+    environ.get('XDG_RUNTIME_DIR', '/tmp'), 'akai-mpkmini-mkii-ctrl.sock'
+)
+# Time between two checks whether serving should stop in seconds
+POLL_INTERVAL = 0.1
+# Time in seconds a silent client may hold the daemon before it is dropped
+IDLE_TIMEOUT = 5.0
+
+
+class Session(NamedTuple):
+    """Open MIDI connection shared by all requests of a daemon."""
+
+    midi_port: int
+    midi_in: MidiIn
+    midi_out: MidiOut
+    timeout: float
+    # None = default state cache
+    state_file: Optional[str] = None
+
+
+Handler = Callable[[dict, Session], str]
+
+
+def serve(
+    midi_port: int,
+    socket_path: str = DEFAULT_SOCKET,
+    timeout: float = SYSEX_TIMEOUT,
+    stop: Optional[Event] = None
+) -> None:
+    # Serves requests until stop is set or Ctrl+C
+    import socketserver
+
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    __remove_stale_socket(socket_path)
+    with ctrl.midi_connection(midi_port) as (midi_in, midi_out):
+        session = Session(midi_port, midi_in, midi_out, timeout)
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            # Requests are served one at a time, so an idle client must not
+            # keep others (and stop) waiting forever
+            timeout = IDLE_TIMEOUT
+
+            def handle(self) -> None:
+                try:
+                    for line in self.rfile:
+                        self.wfile.write(handle_request(line, session))
+                        self.wfile.flush()
+                except TimeoutError:
+                    logging.info('Dropped idle client')
+
+        # Requests are handled one after another on purpose, as they all
+        # share the same MIDI connection.
+        with socketserver.UnixStreamServer(
+            socket_path, RequestHandler
+        ) as server:
+            logging.info(f'Serving MIDI port {midi_port} on {socket_path}')
+            stop = stop or Event()
+            server.timeout = POLL_INTERVAL
+            try:
+                while not stop.is_set():
+                    server.handle_request()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                remove(socket_path)
+
+
+def send_command(socket_path: str, request: dict) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+
+def handle_request(line: bytes, session: Session) -> bytes:
+    response: Dict[str, Any]
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError(f'Invalid request: {request}')
+        handler = __HANDLERS.get(str(request.get('command')))
+        if not handler:
+            raise ValueError(f'Unknown command: {request.get("command")}')
+        response = {'ok': True, 'output': handler(request, session)}
+    except (ValueError, KeyError, OSError) as err:
+        logging.error(err)
+        response = {'ok': False, 'error': str(err)}
+    except Exception as err:  # noqa: B902 - Any reply beats a dead client
+        logging.exception(err)
+        response = {'ok': False, 'error': f'{type(err).__name__}: {err}'}
+    return json.dumps(response).encode('utf-8') + b'\n'
+
+
+def __print_preset(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    config = ctrl.get_config_from_device(
+        request['preset'], session.midi_in, session.midi_out, session.timeout
+    )
+    return str(config)
+
+
+def __pull_preset(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    binary = ctrl.get_binary_from_device(
+        request['preset'], session.midi_in, session.midi_out, session.timeout
+    )
+    ctrl.write_binary_file(request['output_file'], binary)
+    save_device_state(
+        {session.midi_port: binary}, request['preset'], __state_file(session)
+    )
+    return f'Wrote preset {request["preset"]} to {request["output_file"]}'
+
+
+def __push_preset(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    config = ctrl.read_binary_file(request['input_file'])
+    return __send(request, config, session) or (
+        f'Pushed {request["input_file"]} to preset {request["preset"]}'
+    )
+
+
+def __push_config_preset(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_files
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+    from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+    config_data = load_config_from_files(request['input_files'])
+    binary = compile_config(config_data)
+    config = MPK_MINI_MK2_COMPILED.parse(binary)
+    return __send(request, config, session) or (
+        f'Pushed {", ".join(request["input_files"])} '
+        + f'to preset {request["preset"]}'
+    )
+
+
+def __pull_all(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    binaries = ctrl.get_binaries_from_device(
+        ctrl.ALL_PRESETS, session.midi_in, session.midi_out, session.timeout
+    )
+    ctrl.write_bundle_file(request['output_file'], binaries)
+    for preset, binary in zip(ctrl.ALL_PRESETS, binaries):
+        save_device_state(
+            {session.midi_port: binary}, preset, __state_file(session)
+        )
+    return f'Wrote presets {ctrl.ALL_PRESETS} to {request["output_file"]}'
+
+
+def __push_all(request: dict, session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import save_device_state
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+    configs = ctrl.read_bundle_file(request['input_file'])
+    ctrl.send_configs_to_device(configs, session.midi_out)
+    for config in configs:
+        save_device_state(
+            {session.midi_port: MPK_MINI_MK2.build(config)}, config[0].preset,
+            __state_file(session)
+        )
+    presets = [config[0].preset for config in configs]
+    return f'Pushed presets {presets} from {request["input_file"]}'
+
+
+def __send(request: dict, config: MPK_MINI_MK2, session: Session) -> str:
+    # Returns a message if nothing was sent, otherwise an empty string
+    from construct import ConstructError
+
+    from akai_mpkmini_mkii_ctrl import controller as ctrl
+    from akai_mpkmini_mkii_ctrl.device_state import (diff_presets,
+                                                     load_device_state,
+                                                     save_device_state)
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+    preset = request['preset']
+    config[0].preset = preset
+    data = MPK_MINI_MK2.build(config)
+    if request.get('if_changed'):
+        known_state = None if request.get('read_back') else load_device_state(
+            session.midi_port, preset, __state_file(session)
+        )
+        current = known_state or ctrl.get_binary_from_device(
+            preset, session.midi_in, session.midi_out, session.timeout
+        )
+        try:
+            changes = diff_presets(current, data)
+            if not changes:
+                return f'Preset {preset} is unchanged, nothing pushed'
+            logging.info('\n'.join([f'- {change}' for change in changes]))
+        except ConstructError as err:  # Unreadable, so pushed in full
+            logging.warning(f'Cannot compare with the preset on the device. '
+                            f'{err}')
+    ctrl.send_config_to_device(config, preset, session.midi_out)
+    if request.get('verify'):
+        binary = ctrl.get_binary_from_device(
+            preset, session.midi_in, session.midi_out, session.timeout
+        )
+        if binary != data:
+            raise ValueError('Preset on device differs after push.')
+    save_device_state({session.midi_port: data}, preset, __state_file(session))
+    return ''
+
+
+def __state_file(session: Session) -> str:
+    from akai_mpkmini_mkii_ctrl.device_state import STATE_FILE
+    return session.state_file or STATE_FILE
+
+
+__HANDLERS: Dict[str, Handler] = {
+    'print-preset': __print_preset,
+    'pull-preset': __pull_preset,
+    'push-preset': __push_preset,
+    'push-config-preset': __push_config_preset,
+    'pull-all': __pull_all,
+    'push-all': __push_all,
+}
+
+
+def __remove_stale_socket(socket_path: str) -> None:
+    if not path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            remove(socket_path)  # Left behind by a daemon that died
+            return
+    raise OSError(f'A daemon is already serving on {socket_path}')
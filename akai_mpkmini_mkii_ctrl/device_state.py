@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+r"""Last known preset state of devices and field-wise preset comparison.
+
+The state cache remembers the SysEx payload last pushed to or pulled from
+every MIDI port and preset slot, so unchanged presets can be skipped without
+talking to the device.
+"""
+
+import json
+from os import environ, makedirs, path, replace
+from typing import Any, Dict, List, Optional, Union
+
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+
+STATE_FILE = path.join(
+    environ.get('XDG_CACHE_HOME', path.join(path.expanduser('~'), '.cache')),
+    'akai-mpkmini-mkii-ctrl', 'device-state.json'
+)
+PRESET_SIZE = 117
+
+# Section names of the top-level MPK_MINI_MK2 sequence ('' = flatten)
+__SECTIONS = ['', 'pads', 'dials', '', '']
+# Fields that do not describe the preset itself
+__IGNORED_FIELDS = ['preset']
+
+Binary = Union[bytes, bytearray, List[int]]
+
+
+def load_device_state(
+    midi_port: int,
+    preset: int,
+    state_file: str = STATE_FILE
+) -> Optional[bytes]:
+    # A broken entry counts as unknown, it is replaced by the next push
+    data = __read_state_file(state_file).get(__state_key(midi_port, preset))
+    try:
+        state = bytes.fromhex(data) if isinstance(data, str) else None
+    except ValueError:
+        return None
+    return state if state and len(state) == PRESET_SIZE else None
+
+
+def save_device_state(
+    states: Dict[int, Binary],
+    preset: int,
+    state_file: str = STATE_FILE
+) -> None:
+    # States of several ports are saved at once to rewrite the file only once
+    if not states:
+        return
+    state = __read_state_file(state_file)
+    for midi_port, data in states.items():
+        state[__state_key(midi_port, preset)] = bytes(data).hex()
+    makedirs(path.dirname(state_file), exist_ok=True)
+    with open(f'{state_file}.tmp', 'w') as state_handle:
+        json.dump(state, state_handle, indent=2, sort_keys=True)
+    replace(f'{state_file}.tmp', state_file)
+
+
+def diff_presets(current: Binary, target: Binary) -> List[str]:
+    changes: List[str] = []
+    __diff(
+        MPK_MINI_MK2_COMPILED.parse(bytes(current)),
+        MPK_MINI_MK2_COMPILED.parse(bytes(target)),
+        '', changes
+    )
+    return changes
+
+
+def __diff(current: Any, target: Any, name: str, changes: List[str]) -> None:
+    if isinstance(current, dict):
+        for key in target:
+            if key.startswith('_') or key in __IGNORED_FIELDS:
+                continue
+            field = f'{name}.{key}' if name else key
+            __diff(current.get(key), target[key], field, changes)
+    elif isinstance(current, list):
+        for index, (current_item, target_item) in enumerate(
+            zip(current, target)
+        ):
+            if not name and index < len(__SECTIONS):
+                field = __SECTIONS[index]
+            else:
+                field = f'{name}[{index}]'
+            __diff(current_item, target_item, field, changes)
+    elif current != target:
+        changes.append(f'{name}: {current} -> {target}')
+
+
+def __state_key(midi_port: int, preset: int) -> str:
+    return f'{midi_port}:{preset}'
+
+
+def __read_state_file(state_file: str) -> Dict[str, str]:
+    try:
+        with open(state_file, 'r') as state_handle:
+            state = json.load(state_handle)
+            return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}  # No or unreadable cache, i.e., nothing known
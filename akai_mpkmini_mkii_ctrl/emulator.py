@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+r"""In-process emulator of an MPKmini MK2 for hardware-free runs.
+
+``VirtualMpkMini`` answers preset dump requests and stores preset load
+messages per slot, just like the device. Its ``midi_in`` and ``midi_out``
+implement the subset of the rtmidi ``MidiIn``/``MidiOut`` interface used by
+the controller, so they can be handed to every controller function in place
+of real ports.
+
+Latency, dropped messages and SysEx messages split into several chunks by
+the MIDI backend can be simulated to exercise the receiving side.
+"""
+
+import random
+import threading
+from collections import deque
+from os import path
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from akai_mpkmini_mkii_ctrl import DEVICE_NAME
+
+# SysEx header of all messages addressed to or sent by the device
+SYSEX_HEADER = [0xF0, 0x47, 0x00, 0x26]
+# Message type (4th byte) of preset loads, dump requests and dump replies
+LOAD_PRESET = 0x64
+DUMP_REQUEST = 0x66
+DUMP_REPLY = 0x67
+
+# Preset that all slots of the emulated device hold initially
+with open(
+    path.join(path.dirname(__file__), 'preset.mk2'), 'rb'
+) as preset_handle:
+    DEFAULT_PRESET = preset_handle.read()
+
+MidiEvent = Tuple[List[int], float]
+
+
+class VirtualMidiIn:
+    """Receiving side of the emulator with the interface of rtmidi.MidiIn."""
+
+    def __init__(self, port_name: str = DEVICE_NAME) -> None:  # noqa: D107
+        self.port_name = port_name
+        self.__lock = threading.Lock()
+        self.__pending: Deque[MidiEvent] = deque()
+        self.__callback: Optional[Callable[[MidiEvent, Any], None]] = None
+        self.__callback_data: Any = None
+        self.__last_event = monotonic()
+        self.__open = True
+
+    def get_message(self) -> Optional[MidiEvent]:
+        with self.__lock:
+            return self.__pending.popleft() if self.__pending else None
+
+    def set_callback(
+        self,
+        func: Callable[[MidiEvent, Any], None],
+        data: Any = None
+    ) -> None:
+        with self.__lock:
+            self.__callback, self.__callback_data = func, data
+
+    def cancel_callback(self) -> None:
+        with self.__lock:
+            self.__callback, self.__callback_data = None, None
+
+    def ignore_types(
+        self,
+        sysex: bool = True,
+        timing: bool = True,
+        active_sense: bool = True
+    ) -> None:
+        pass  # The emulator only ever sends SysEx
+
+    def get_port_name(self, _: int = 0) -> str:
+        return self.port_name
+
+    def is_port_open(self) -> bool:
+        return self.__open
+
+    def close_port(self) -> None:
+        self.__open = False
+        self.cancel_callback()
+
+    def deliver(self, message: Sequence[int]) -> None:
+        # Called by the device, from whatever thread the reply is sent on
+        with self.__lock:
+            if not self.__open:
+                return
+            now = monotonic()
+            event = (list(message), now - self.__last_event)
+            self.__last_event = now
+            callback, data = self.__callback, self.__callback_data
+            if not callback:
+                self.__pending.append(event)
+        if callback:
+            callback(event, data)
+
+
+class VirtualMidiOut:
+    """Sending side of the emulator with the interface of rtmidi.MidiOut."""
+
+    def __init__(  # noqa: D107
+        self,
+        device: 'VirtualMpkMini',
+        port_name: str = DEVICE_NAME
+    ) -> None:
+        self.device = device
+        self.port_name = port_name
+        self.__open = True
+
+    def send_message(self, message: Sequence[int]) -> None:
+        if not self.__open:
+            raise OSError('MIDI output port is closed.')
+        self.device.receive(list(message))
+
+    def get_port_name(self, _: int = 0) -> str:
+        return self.port_name
+
+    def is_port_open(self) -> bool:
+        return self.__open
+
+    def close_port(self) -> None:
+        self.__open = False
+
+
+class VirtualMpkMini:
+    """Emulated MPKmini MK2 with five preset slots.
+
+    ``latency`` delays every reply by the given seconds, ``drop_rate`` is
+    the probability of an incoming message getting lost and ``chunk_size``
+    splits replies into chunks of at most that many bytes. All slots start
+    with the default preset unless ``presets`` are given.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        latency: float = 0.0,
+        drop_rate: float = 0.0,
+        chunk_size: Optional[int] = None,
+        presets: Optional[Dict[int, bytes]] = None,
+        seed: Optional[int] = None,
+        port_name: str = DEVICE_NAME
+    ) -> None:
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.chunk_size = chunk_size
+        self.presets: Dict[int, bytearray] = {}
+        for slot in range(5):
+            preset = bytearray((presets or {}).get(slot, DEFAULT_PRESET))
+            preset[7] = slot
+            self.presets[slot] = preset
+        self.received: List[List[int]] = []
+        self.dropped = 0
+        self.midi_in = VirtualMidiIn(port_name)
+        self.midi_out = VirtualMidiOut(self, port_name)
+        self.__random = random.Random(seed)
+        self.__delivery_lock = threading.Lock()
+
+    def ports(self) -> Tuple[VirtualMidiIn, VirtualMidiOut]:
+        return self.midi_in, self.midi_out
+
+    def receive(self, message: List[int]) -> None:
+        if self.drop_rate and self.__random.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        self.received.append(message)
+        if message[:4] != SYSEX_HEADER or len(message) < 9:
+            return  # Not addressed to an MPKmini MK2
+        if message[4] == LOAD_PRESET and message[7] in self.presets:
+            self.presets[message[7]] = bytearray(message)
+        elif message[4] == DUMP_REQUEST and message[7] in self.presets:
+            reply = bytearray(self.presets[message[7]])
+            reply[4] = DUMP_REPLY
+            self.__reply(list(reply))
+
+    def __reply(self, message: List[int]) -> None:
+        if self.chunk_size:
+            chunks = [
+                message[offset:offset + self.chunk_size]
+                for offset in range(0, len(message), self.chunk_size)
+            ]
+        else:
+            chunks = [message]
+        if not self.latency:
+            self.__deliver(chunks)
+            return
+        # Like the MIDI backend, replies arrive on another thread
+        timer = threading.Timer(self.latency, self.__deliver, [chunks])
+        timer.daemon = True
+        timer.start()
+
+    def __deliver(self, chunks: List[List[int]]) -> None:
+        # Chunks of concurrent replies must not interleave on the wire
+        with self.__delivery_lock:
+            for chunk in chunks:
+                self.midi_in.deliver(chunk)
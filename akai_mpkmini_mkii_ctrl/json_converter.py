@@ -2,144 +2,252 @@
 r"""Convert JSON presets to Construct presets."""
 
 import logging
-from os import path
-from re import sub
-from typing import Any, List
-
-from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
-from akai_mpkmini_mkii_ctrl.note_converter import note_to_decimal as n2d
+from os import path, stat
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from akai_mpkmini_mkii_ctrl.config_schema import (SchemaField, compile_schema,
+                                                  enum_choices)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import (MPK_MINI_MK2,
+                                                MPK_MINI_MK2_COMPILED,
+                                                Arpeggio, Arpeggio_clk,
+                                                Arpeggio_div, Arpeggio_enable,
+                                                Arpeggio_mode, General, Joy,
+                                                Transpose)
+from akai_mpkmini_mkii_ctrl.note_converter import (BANK_PLACEHOLDER,
+                                                   note_to_decimal)
+from akai_mpkmini_mkii_ctrl.profiling import span
 
 TEMPLATE = path.join(path.dirname(path.abspath(__file__)), 'preset.mk2')
 
+# Template path -> (mtime in ns, validated template bytes)
+__TEMPLATE_CACHE: Dict[str, Tuple[int, bytes]] = {}
 
-def json_to_binary(json: dict) -> List[int]:
-    # TODO I don't know how to initialise the 'MPK_MINI_MK2' structure
-    # manually without a bunch of boilerplate. So I load some from file.
-    preset = MPK_MINI_MK2.parse_file(TEMPLATE)
+# Converts a configuration value to (codec field, value) pairs
+Encoder = Callable[[Any], List[Tuple[str, Any]]]
 
-    # Constants
-    preset[0].mk2 = True  # TODO This is obsolete
-    preset[0].preset = 0  # Will be changed depending on the --patch option
+# Value ranges of the SysEx data bytes, i.e., 7 bits
+__DATA_RANGE = (0, 127)
+__TRIGGERS = {'M': 'MOMENTARY', 'T': 'TOGGLE'}
+
+
+def __field(field: str, shift: int = 0) -> Encoder:
+    return lambda value: [(field, value - shift if shift else value)]
 
-    # Midi channel for pads and dials/keys
-    preset[0].pchannel = __read_json(json, 'midi-channels.pads', 1) - 1
-    preset[0].dchannel = __read_json(json, 'midi-channels.keys', 1) - 1
 
+def __each(
+    array: str, field: str, convert: Callable[[Any], Any] = lambda v: v
+) -> Encoder:
+    # One value per pad/dial of the array
+    return lambda values: [
+        (f'{array}.{index}.{field}', convert(value))
+        for index, value in enumerate(values)
+    ]
+
+
+def __on_off(value: Any) -> str:
+    # Unquoted ON and OFF are read as booleans from YAML
+    if isinstance(value, bool):
+        return 'ON' if value else 'OFF'
+    return str(value)
+
+
+def __note(note: str) -> int:
+    # '-' is converted to C-2
+    return 0 if note == BANK_PLACEHOLDER else note_to_decimal(note)
+
+
+def __pad_fields(bank: int, name: str) -> List[Tuple[SchemaField, Encoder]]:
+    return [
+        # By default set to C-2
+        (SchemaField(
+            f'pads.{name}.notes', __note, '- - - - - - - -', entries=8
+        ), __each(f'1.{bank}', 'note')),
+        (SchemaField(
+            f'pads.{name}.cc', int, '20 21 22 23 24 25 26 27',
+            range=__DATA_RANGE, entries=8
+        ), __each(f'1.{bank}', 'midicc')),
+        (SchemaField(
+            f'pads.{name}.prog', int, '20 21 22 23 24 25 26 27',
+            range=(1, 128), entries=8
+        ), __each(f'1.{bank}', 'prog', lambda prog: prog - 1)),
+        (SchemaField(
+            f'pads.{name}.trigger', str, 'M M M M M M M M',
+            choices=list(__TRIGGERS), entries=8
+        ), __each(f'1.{bank}', 'trigger', __TRIGGERS.get)),
+    ]
+
+
+# Schema of every configuration value and the codec fields, i.e., the byte
+# ranges of the binary preset, it controls
+CONFIG_FIELDS: List[Tuple[SchemaField, Encoder]] = [
+    # Midi channel for pads and dials/keys
+    (SchemaField('midi-channels.pads', int, 1, range=(1, 16)),
+     __field('0.pchannel', 1)),
+    (SchemaField('midi-channels.keys', int, 1, range=(1, 16)),
+     __field('0.dchannel', 1)),
     # Octave-wise shift
-    preset[0].octave = __read_json(json, 'transponse.octave', 'OCT_0')
+    (SchemaField('transponse.octave', str, 'OCT_0',
+                 choices=enum_choices(General.octave)),
+     __field('0.octave')),
     # Note-wise shift
-    preset[3].transpose = __read_json(json, 'transponse.note', 'TRANS_0')
-
+    (SchemaField('transponse.note', str, 'TRANS_0',
+                 choices=enum_choices(Transpose.transpose)),
+     __field('3.transpose')),
     # Arpeggiator
-    preset[0].enable = __read_json(json, 'arpeggiator.enable', 'OFF')
-    preset[0].mode = __read_json(json, 'arpeggiator.mode', 'EXCLUSIVE')
-    preset[0].division = __read_json(json, 'arpeggiator.division', 'DIV_1_8')
-    preset[0].clock = __read_json(json, 'arpeggiator.clock', 'INTERNAL')
-    preset[0].latch = __read_json(json, 'arpeggiator.latch', 'DISABLE')
-    preset[0].swing = __read_json(json, 'arpeggiator.swing', 'SWING_50')
-    preset[0].taps = __read_json(json, 'arpeggiator.taps', 3)
-    preset[0].tempo = __read_json(json, 'arpeggiator.tempo', 140)
-    preset[0].octaves = __read_json(json, 'arpeggiator.octaves', 'OCT_1')
-
+    (SchemaField('arpeggiator.enable', __on_off, 'OFF',
+                 choices=enum_choices(Arpeggio_enable.enable)),
+     __field('0.enable')),
+    (SchemaField('arpeggiator.mode', str, 'EXCLUSIVE',
+                 choices=enum_choices(Arpeggio_mode.mode)),
+     __field('0.mode')),
+    (SchemaField('arpeggiator.division', str, 'DIV_1_8',
+                 choices=enum_choices(Arpeggio_div.division)),
+     __field('0.division')),
+    (SchemaField('arpeggiator.clock', str, 'INTERNAL',
+                 choices=enum_choices(Arpeggio_clk.clock)),
+     __field('0.clock')),
+    (SchemaField('arpeggiator.latch', str, 'DISABLE',
+                 choices=enum_choices(Arpeggio.latch)),
+     __field('0.latch')),
+    (SchemaField('arpeggiator.swing', str, 'SWING_50',
+                 choices=enum_choices(Arpeggio.swing)),
+     __field('0.swing')),
+    (SchemaField('arpeggiator.taps', int, 3, range=__DATA_RANGE),
+     __field('0.taps')),
+    (SchemaField('arpeggiator.tempo', int, 140, range=(30, 240)),
+     __field('0.tempo')),
+    (SchemaField('arpeggiator.octaves', str, 'OCT_1',
+                 choices=enum_choices(Arpeggio.octaves)),
+     __field('0.octaves')),
     # Joystick
-    preset[0].axis_x = __read_json(json, 'joystick.axis-x', 'CC2')
-    preset[0].x_up = __read_json(json, 'joystick.x-up', 1)
-    preset[0].x_down = __read_json(json, 'joystick.x-down', 1)
-    preset[0].axis_y = __read_json(json, 'joystick.axis-y', 'PBEND')
-    preset[0].y_up = __read_json(json, 'joystick.y-up', 0)
-    preset[0].y_down = __read_json(json, 'joystick.y-down', 1)
-
-    # CC and Prog Change setup for pads
-    current_cc = 12  # Start with CC 12 upwards
-    current_prog_change = 20  # Start with PROG 20 upwards
-    for bank in range(0, 2):
-        for pad in range(0, 8):
-            preset[1][bank][pad].midicc = current_cc
-            preset[1][bank][pad].prog = current_prog_change
-            # CC-MODE Momentary (0) or Trigger (1)
-            preset[1][bank][pad].trigger = 0
-            current_cc += 1
-            current_prog_change += 1
-
+    (SchemaField('joystick.axis-x', str, 'CC2',
+                 choices=enum_choices(Joy.axis_x)),
+     __field('0.axis_x')),
+    (SchemaField('joystick.x-up', int, 1, range=__DATA_RANGE),
+     __field('0.x_up')),
+    (SchemaField('joystick.x-down', int, 1, range=__DATA_RANGE),
+     __field('0.x_down')),
+    (SchemaField('joystick.axis-y', str, 'PBEND',
+                 choices=enum_choices(Joy.axis_y)),
+     __field('0.axis_y')),
+    (SchemaField('joystick.y-up', int, 0, range=__DATA_RANGE),
+     __field('0.y_up')),
+    (SchemaField('joystick.y-down', int, 1, range=__DATA_RANGE),
+     __field('0.y_down')),
     # MIDI CC Dials
-    dials_cc = __extract_bank_int(json, 'dials.cc', '4 5 6 7 8 9 10 11')
-    for i, dial in enumerate(preset[2][0]):
-        dial.min = __read_json(json, 'dials.min-value', 0)
-        dial.max = __read_json(json, 'dials.max-value', 0)
-        dial.midicc = dials_cc[i]
-
+    (SchemaField('dials.cc', int, '4 5 6 7 8 9 10 11',
+                 range=__DATA_RANGE, entries=8),
+     __each('2.0', 'midicc')),
+    (SchemaField('dials.min-value', int, 0, range=__DATA_RANGE),
+     lambda value: [(f'2.0.{dial}.min', value) for dial in range(8)]),
+    (SchemaField('dials.max-value', int, 0, range=__DATA_RANGE),
+     lambda value: [(f'2.0.{dial}.max', value) for dial in range(8)]),
     # Pad Banks
-    for entry in enumerate(['bank-a', 'bank-b']):
-        notes = __extract_bank_notes(json, f'pads.{entry[1]}.notes')
-        cc = __extract_bank_int(
-            json, f'pads.{entry[1]}.cc', '20 21 22 23 24 25 26 27'
-        )
-        prog = __extract_bank_int(
-            json, f'pads.{entry[1]}.prog', '20 21 22 23 24 25 26 27'
-        )
-        trigger = __extract_bank_trigger(
-            json, f'pads.{entry[1]}.trigger', 'M M M M M M M M'
-        )
-        for pad in range(0, 8):
-            preset[1][entry[0]][pad].note = n2d(notes[pad])
-            preset[1][entry[0]][pad].midicc = cc[pad]
-            preset[1][entry[0]][pad].prog = prog[pad] - 1
-            preset[1][entry[0]][pad].trigger = trigger[pad]
+    *__pad_fields(0, 'bank-a'),
+    *__pad_fields(1, 'bank-b'),
+]
+CONFIG_SCHEMA = compile_schema([field for field, _ in CONFIG_FIELDS])
+
+
+def json_to_binary(json: dict) -> List[int]:
+    # TODO I don't know how to initialise the 'MPK_MINI_MK2' structure
+    # manually without a bunch of boilerplate. So I load some from file.
+    with span('load_template'):
+        preset = __load_template()
+
+    # Constants
+    preset[0].mk2 = True  # TODO This is obsolete
+    preset[0].preset = 0  # Will be changed depending on the --patch option
+
+    # All values are read and validated in a single pass
+    with span('read_config'):
+        values = CONFIG_SCHEMA.read(json)
+    for (_, encode), value in zip(CONFIG_FIELDS, values):
+        for field, field_value in encode(value):
+            __set_field(preset, field, field_value)
 
     logging.debug(preset)
 
     # Finalise
-    data = MPK_MINI_MK2.build(preset)
+    with span('construct_build'):
+        data = MPK_MINI_MK2.build(preset)
     assert data[0] == 0xF0 and data[-1] == 0xF7
     return data
 
 
-def __extract_bank_notes(json: dict, path: str) -> List[str]:
-    default_bank_notes = '- - - - - - - -'  # i.e. by default set to C-2
-    # Extract notes from preset path
-    notes = [
-        note.strip()
-        for note in __read_json(json, path, default_bank_notes).split(r' ')
-    ]
-    logging.debug(f'{path} = {notes}')
-    # Replace default value '-' with 'C-2'
-    return [sub(r'^-$', 'C-2', note) for note in notes]
-
-
-def __extract_bank_int(json: dict, path: str, default_bank: str) -> List[int]:
-    int_string = __read_json(json, path, default_bank)
-    ints = [int(value.strip()) for value in int_string.split(' ')]
-    logging.debug(f'{path} = {ints}')
-    return ints
-
-
-def __extract_bank_trigger(
-    json: dict, path: str, default_bank: str
-) -> List[str]:
-    trigger_string = __read_json(json, path, default_bank)
-    trigger = []
-    for t in trigger_string.split(' '):
-        if t == 'T':
-            trigger.append('TOGGLE')
-        elif t == 'M':
-            trigger.append('MOMENTARY')
+def update_binary(
+    data: bytearray,
+    previous_json: dict,
+    json: dict
+) -> List[Tuple[int, int]]:
+    # Re-encodes in place only the bytes of a preset built from the previous
+    # configuration that are controlled by changed configuration paths.
+    # Returns the rewritten byte ranges. On errors, data is left half-done.
+    changed = changed_config_paths(previous_json, json)
+    ranges: List[Tuple[int, int]] = []
+    with span('update_binary', changed=len(changed)):
+        values = CONFIG_SCHEMA.read(json)
+        for (schema_field, encode), value in zip(CONFIG_FIELDS, values):
+            if not __affected(schema_field.path, changed):
+                continue
+            for field, field_value in encode(value):
+                ranges.append(
+                    MPK_MINI_MK2_COMPILED.build_field(field, field_value, data)
+                )
+    return ranges
+
+
+def changed_config_paths(previous_json: Any, json: Any) -> Set[str]:
+    # Dotted paths of the values that were added, removed or changed
+    changed: Set[str] = set()
+    __diff(previous_json or {}, json or {}, '', changed)
+    return changed
+
+
+def __diff(
+    previous: Any, current: Any, prefix: str, changed: Set[str]
+) -> None:
+    if not isinstance(previous, dict) or not isinstance(current, dict):
+        if previous != current:
+            changed.add(prefix[:-1])
+        return
+    for key in set(previous) | set(current):
+        if key not in previous or key not in current:
+            changed.add(f'{prefix}{key}')
         else:
-            raise ValueError('Only T and M is supported')
-    logging.debug(f'{path} = {trigger}')
-    return trigger
-
-
-def __read_json(json: dict, path: str, default_value: Any) -> Any:
-    if not path:
-        return default_value
-    json = json if json else {}
-    try:
-        for breadcrumb in path.split('.'):
-            json = json[breadcrumb]
-        value = json if json else default_value
-        logging.debug(f'JSON | {path} = {value}')
-        return value
-    except KeyError:
-        logging.warn(f'!!! JSON | {path} = {default_value} '
-                     + '(Key not found. Default will be used.)')
-        return default_value
+            __diff(previous[key], current[key], f'{prefix}{key}.', changed)
+
+
+def __affected(config_path: str, changed: Set[str]) -> bool:
+    # A change of the path itself, of a parent or of a child of the path
+    return any(
+        config_path == path
+        or config_path.startswith(f'{path}.')
+        or path.startswith(f'{config_path}.')
+        for path in changed
+    )
+
+
+def __set_field(preset: Any, field: str, value: Any) -> None:
+    *parents, name = [
+        int(part) if part.isdigit() else part for part in field.split('.')
+    ]
+    for parent in parents:
+        preset = preset[parent]
+    preset[name] = value
+
+
+def __load_template() -> Any:
+    # The template is read and validated once per process (and again only
+    # if it changes on disk). Every conversion then gets its own fresh copy
+    # by parsing the cached bytes with the precompiled codec, which is much
+    # cheaper than re-reading the file and running construct.
+    mtime = stat(TEMPLATE).st_mtime_ns
+    cached = __TEMPLATE_CACHE.get(TEMPLATE)
+    if not cached or cached[0] != mtime:
+        with open(TEMPLATE, 'rb') as template_handle:
+            data = template_handle.read()
+        MPK_MINI_MK2.parse(data)  # Validate with the reference construct
+        cached = (mtime, data)
+        __TEMPLATE_CACHE[TEMPLATE] = cached
+    return MPK_MINI_MK2_COMPILED.parse(cached[1])
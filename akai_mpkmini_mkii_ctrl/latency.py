@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+r"""SysEx round-trip latency measurement.
+
+A round trip is a preset dump request followed by the complete reply, i.e.,
+a call of ``get_binary_from_device``. Round trips are timed with the
+monotonic high-resolution ``perf_counter_ns`` clock.
+"""
+
+from __future__ import annotations
+
+from math import ceil
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Sequence
+
+from akai_mpkmini_mkii_ctrl import SYSEX_TIMEOUT
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn, MidiOut
+
+PERCENTILES = [50, 95, 99]
+HISTOGRAM_BINS = 10
+HISTOGRAM_WIDTH = 40
+
+
+class RoundTrips(NamedTuple):
+    """Round-trip times in seconds and the number of timed out requests."""
+
+    samples: List[float]
+    timeouts: int
+
+
+def measure_round_trips(
+    preset: int,
+    midi_in: MidiIn,
+    midi_out: MidiOut,
+    cycles: int,
+    timeout: float = SYSEX_TIMEOUT,
+    warmup: int = 1
+) -> RoundTrips:
+    samples: List[float] = []
+    timeouts = 0
+    for cycle in range(warmup + cycles):
+        start = perf_counter_ns()
+        try:
+            ctrl.get_binary_from_device(preset, midi_in, midi_out, timeout)
+        except TimeoutError:
+            if cycle >= warmup:
+                timeouts += 1
+            __discard_late_replies(midi_in, timeout)
+            continue
+        elapsed = perf_counter_ns() - start
+        if cycle >= warmup:  # Warm-up cycles are not recorded
+            samples.append(elapsed / 10**9)
+    return RoundTrips(samples, timeouts)
+
+
+def __discard_late_replies(midi_in: MidiIn, timeout: float) -> None:
+    # A reply that arrives after its request timed out would be taken for
+    # the reply to the next request, all requests ask for the same preset.
+    # Frames are discarded until none arrived for another timeout.
+    with ctrl.SysexReceiver(midi_in) as receiver:
+        try:
+            while True:
+                receiver.receive(timeout)
+        except TimeoutError:
+            pass
+
+
+def percentile(sorted_samples: Sequence[float], percent: float) -> float:
+    # Nearest-rank percentile of ascending samples
+    rank = max(1, ceil(len(sorted_samples) * percent / 100))
+    return sorted_samples[rank - 1]
+
+
+def latency_statistics(round_trips: RoundTrips) -> Dict[str, Any]:
+    # All times in milliseconds
+    samples = sorted(round_trips.samples)
+    statistics: Dict[str, Any] = {
+        'cycles': len(samples) + round_trips.timeouts,
+        'timeouts': round_trips.timeouts
+    }
+    if not samples:
+        return statistics
+    statistics.update({
+        'min_ms': samples[0] * 1000,
+        'median_ms': percentile(samples, 50) * 1000,
+        **{
+            f'p{percent}_ms': percentile(samples, percent) * 1000
+            for percent in PERCENTILES if percent != 50
+        },
+        'max_ms': samples[-1] * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'histogram': latency_histogram(samples),
+    })
+    return statistics
+
+
+def latency_histogram(
+    samples: Sequence[float],
+    bins: int = HISTOGRAM_BINS
+) -> List[Dict[str, float]]:
+    # Equally wide bins between the fastest and slowest round trip
+    low, high = min(samples), max(samples)
+    if high == low:
+        return [{
+            'from_ms': low * 1000, 'to_ms': high * 1000, 'count': len(samples)
+        }]
+    width = (high - low) / bins
+    counts = [0] * bins
+    for sample in samples:
+        counts[min(int((sample - low) / width), bins - 1)] += 1
+    return [
+        {
+            'from_ms': (low + index * width) * 1000,
+            'to_ms': (low + (index + 1) * width) * 1000,
+            'count': count
+        }
+        for index, count in enumerate(counts)
+    ]
+
+
+def format_statistics(statistics: Dict[str, Any]) -> str:
+    lines = [
+        f'{statistics["cycles"]} round trips, '
+        + f'{statistics["timeouts"]} timed out'
+    ]
+    if 'histogram' not in statistics:
+        return '\n'.join(lines)
+    lines.append(' '.join([
+        f'{key[:-3]}={statistics[key]:.3f}' for key in statistics
+        if key.endswith('_ms')
+    ]) + ' (ms)')
+    histogram = statistics['histogram']
+    most = max([entry['count'] for entry in histogram])
+    for entry in histogram:
+        bar = '#' * round(entry['count'] / most * HISTOGRAM_WIDTH)
+        lines.append(
+            f'{entry["from_ms"]:9.3f} - {entry["to_ms"]:9.3f} ms '
+            + f'{entry["count"]:6d} {bar}'
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+r"""Live monitor of the MIDI events sent by the device.
+
+The input callback of the MIDI backend only stamps each event with the
+monotonic ``perf_counter_ns`` clock and stores it in a preallocated ring
+buffer, so that it never waits for decoding or printing. The monitor loop
+drains the buffer, names the events after the pads, dials and joystick of
+the current preset and reports events per second, the jitter of the time
+between events and the number of events dropped because the buffer was
+full.
+"""
+
+from __future__ import annotations
+
+from array import array
+from math import sqrt
+from threading import Event
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from akai_mpkmini_mkii_ctrl.note_converter import decimal_to_note
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn
+
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+RING_CAPACITY = 4096
+# Time between two drains of the ring buffer in seconds
+POLL_INTERVAL = 0.005
+REPORT_INTERVAL = 1.0
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+POLY_PRESSURE = 0xA0
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+CHANNEL_PRESSURE = 0xD0
+PITCH_BEND = 0xE0
+SYSEX_START = 0xF0
+CLOCK = 0xF8
+
+__SYSTEM_NAMES = {
+    CLOCK: 'clock', 0xFA: 'start', 0xFB: 'continue', 0xFC: 'stop',
+    0xFE: 'active sensing', 0xFF: 'reset'
+}
+
+# (message type, channel, data1 or -1 for pitch bend) -> control name
+EventNames = Dict[Tuple[int, int, int], str]
+
+
+class EventRing:
+    """Preallocated ring buffer of MIDI events for one writer and reader.
+
+    The writer (the MIDI callback) and the reader (the monitor loop) each
+    only advance their own counter, so no lock is needed. Events arriving
+    while the buffer is full are counted as dropped.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY) -> None:  # noqa: D107
+        self.capacity = capacity
+        self.timestamps = array('q', bytes(8 * capacity))
+        self.statuses = array('B', bytes(capacity))
+        self.data1 = array('B', bytes(capacity))
+        self.data2 = array('B', bytes(capacity))
+        self.dropped = 0
+        self.__written = 0
+        self.__read = 0
+
+    def __len__(self) -> int:  # noqa: D105
+        return self.__written - self.__read
+
+    def push(self, timestamp: int, message: List[int]) -> bool:
+        written = self.__written
+        if written - self.__read >= self.capacity:
+            self.dropped += 1
+            return False
+        index = written % self.capacity
+        size = len(message)
+        self.timestamps[index] = timestamp
+        self.statuses[index] = message[0]
+        self.data1[index] = message[1] if size > 1 else 0
+        self.data2[index] = message[2] if size > 2 else 0
+        self.__written = written + 1  # Publish only once the slot is set
+        return True
+
+    def drain(self, handler: Callable[[int, int, int, int], Any]) -> int:
+        # Hands all buffered events to handler(timestamp, status, d1, d2)
+        read, written = self.__read, self.__written
+        for position in range(read, written):
+            index = position % self.capacity
+            handler(
+                self.timestamps[index], self.statuses[index],
+                self.data1[index], self.data2[index]
+            )
+            self.__read = position + 1
+        return written - read
+
+    def on_message(self, event: Tuple[List[int], float], _: Any) -> None:
+        # Input callback of the MIDI backend, SysEx is not monitored
+        message = event[0]
+        if message and message[0] != SYSEX_START:
+            self.push(perf_counter_ns(), message)
+
+
+class EventStatistics:
+    """Event rate and inter-event jitter of a reporting window."""
+
+    def __init__(self) -> None:  # noqa: D107
+        self.reset()
+
+    def reset(self) -> None:
+        self.events = 0
+        self.__last: Optional[int] = None
+        self.__intervals = 0
+        # Running mean and sum of squared deviations (Welford)
+        self.__mean = 0.0
+        self.__squares = 0.0
+        self.__max = 0
+
+    def add(self, timestamp: int) -> None:
+        self.events += 1
+        if self.__last is not None:
+            interval = timestamp - self.__last
+            self.__intervals += 1
+            delta = interval - self.__mean
+            self.__mean += delta / self.__intervals
+            self.__squares += delta * (interval - self.__mean)
+            self.__max = max(self.__max, interval)
+        self.__last = timestamp
+
+    def report(self, elapsed: float, dropped: int) -> Dict[str, Any]:
+        # Times in milliseconds
+        jitter = (
+            sqrt(self.__squares / self.__intervals) if self.__intervals else 0
+        )
+        return {
+            'events': self.events,
+            'events_per_second': self.events / elapsed if elapsed else 0.0,
+            'mean_interval_ms': self.__mean / 10**6,
+            'max_interval_ms': self.__max / 10**6,
+            'jitter_ms': jitter / 10**6,
+            'dropped': dropped
+        }
+
+
+def event_names(config: MPK_MINI_MK2) -> EventNames:
+    # Controls of a preset by the messages they send
+    names: EventNames = {}
+    general = config[0]
+    pchannel, dchannel = general.pchannel, general.dchannel
+    for axis, up, down in [
+        ('X', general.x_up, general.x_down),
+        ('Y', general.y_up, general.y_down)
+    ]:
+        mode = str(general[f'axis_{axis.lower()}'])
+        if mode == 'PBEND':
+            names[(PITCH_BEND, dchannel, -1)] = f'Joystick {axis}'
+        elif mode == 'CC1':
+            names[(CONTROL_CHANGE, dchannel, up)] = f'Joystick {axis}'
+        else:
+            names[(CONTROL_CHANGE, dchannel, up)] = f'Joystick {axis}+'
+            names[(CONTROL_CHANGE, dchannel, down)] = f'Joystick {axis}-'
+    for dial_index, dial in enumerate(config[2][0]):
+        names[(CONTROL_CHANGE, dchannel, dial.midicc)] = (
+            f'Dial K{dial_index + 1}'
+        )
+    for bank_index, bank in enumerate(config[1]):
+        for pad_index, pad in enumerate(bank):
+            name = f'Pad {"AB"[bank_index]}{pad_index + 1}'
+            names[(NOTE_ON, pchannel, pad.note)] = name
+            names[(CONTROL_CHANGE, pchannel, pad.midicc)] = name
+            names[(PROGRAM_CHANGE, pchannel, pad.prog)] = name
+    return names
+
+
+def decode_event(
+    status: int,
+    data1: int,
+    data2: int,
+    names: Optional[EventNames] = None
+) -> str:
+    if status >= 0xF0:
+        return __SYSTEM_NAMES.get(status, f'system {status:02x}')
+    kind, channel = status & 0xF0, status & 0x0F
+    if kind == NOTE_ON and data2 == 0:
+        kind = NOTE_OFF
+    key = (NOTE_ON if kind == NOTE_OFF else kind, channel, data1)
+    if kind in (NOTE_ON, NOTE_OFF):
+        description = (
+            f'note {"on" if kind == NOTE_ON else "off"} '
+            + f'{decimal_to_note(data1)} velocity {data2}'
+        )
+    elif kind == CONTROL_CHANGE:
+        description = f'cc {data1} value {data2}'
+    elif kind == PROGRAM_CHANGE:
+        description = f'program {data1 + 1}'
+    elif kind == PITCH_BEND:
+        key = (PITCH_BEND, channel, -1)
+        description = f'pitch bend {(data2 << 7 | data1) - 8192}'
+    elif kind == POLY_PRESSURE:
+        description = f'pressure {decimal_to_note(data1)} {data2}'
+    else:
+        description = f'channel pressure {data1}'
+    name = (names or {}).get(key)
+    if name is None and kind in (NOTE_ON, NOTE_OFF):
+        name = 'Key'
+    return f'{name or "-":<11} ch {channel + 1:<2} {description}'
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    return (
+        f'{report["events_per_second"]:8.1f} events/s, '
+        + f'interval mean {report["mean_interval_ms"]:.3f} ms, '
+        + f'max {report["max_interval_ms"]:.3f} ms, '
+        + f'jitter {report["jitter_ms"]:.3f} ms, '
+        + f'{report["dropped"]} dropped'
+    )
+
+
+def monitor_events(
+    midi_in: MidiIn,
+    on_event: Optional[Callable[[int, int, int, int], Any]] = None,
+    on_report: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    report_interval: float = REPORT_INTERVAL,
+    capacity: int = RING_CAPACITY,
+    stop: Optional[Event] = None
+) -> EventRing:
+    # Runs until stop is set (or Ctrl+C). All events are handed to on_event
+    # in the monitor thread, statistics to on_report every report interval.
+    ring = EventRing(capacity)
+    statistics = EventStatistics()
+    stop = stop or Event()
+
+    def handle(timestamp: int, status: int, data1: int, data2: int) -> None:
+        statistics.add(timestamp)
+        if on_event:
+            on_event(timestamp, status, data1, data2)
+
+    midi_in.ignore_types(sysex=True, timing=False, active_sense=True)
+    midi_in.set_callback(ring.on_message)
+    try:
+        window_start, dropped = perf_counter_ns(), 0
+        while not stop.wait(POLL_INTERVAL):
+            ring.drain(handle)
+            now = perf_counter_ns()
+            if now - window_start >= report_interval * 10**9:
+                if on_report:
+                    on_report(statistics.report(
+                        (now - window_start) / 10**9, ring.dropped - dropped
+                    ))
+                statistics.reset()
+                window_start, dropped = now, ring.dropped
+        ring.drain(handle)
+    finally:
+        midi_in.cancel_callback()
+    return ring
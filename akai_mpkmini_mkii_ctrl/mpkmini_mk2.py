@@ -7,6 +7,8 @@ Source: https://github.com/mungewell/mpd-utils/blob/master/mpk_mini.py
 from construct import (Array, Byte, Computed, Const, Default, Embedded, Enum,
                        ExprAdapter, Int16ub, Sequence, Struct, obj_)
 
+from akai_mpkmini_mkii_ctrl.compiled_codec import compile_codec
+
 # -----------------------------------------------------------------------------
 # CONSTANTS DEFINING MPK FEATURES
 # -----------------------------------------------------------------------------
@@ -210,3 +212,9 @@ MPK_MINI_MK2 = Sequence(
     Transpose,
     Footer,
 )
+
+# -----------------------------------------------------------------------------
+# PRECOMPILED FIXED-OFFSET CODEC OF THE SAME FORMAT
+# -----------------------------------------------------------------------------
+
+MPK_MINI_MK2_COMPILED = compile_codec(MPK_MINI_MK2)
@@ -1,10 +1,69 @@
 # -*- coding: utf-8 -*-
-r"""Convert notes to and from decimal."""
+r"""Convert notes to and from decimal.
+
+Both directions are served from lookup tables that are built once on import
+and cover all 128 MIDI notes, i.e., ``C-2`` to ``G8``. Notes are accepted in
+upper and lower case and with flats for the black keys (``Db3`` = ``C#3``).
+"""
+
+from typing import Dict, Iterable, List
 
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Flat aliases of the sharp notes
+FLATS = {'C#': 'Db', 'D#': 'Eb', 'F#': 'Gb', 'G#': 'Ab', 'A#': 'Bb'}
+# Unassigned pad in a bank string, i.e., C-2
+BANK_PLACEHOLDER = '-'
+
+
+def __build_decimal_table() -> List[str]:
+    return [
+        f'{NOTES[decimal % 12]}{decimal // 12 - 2}' for decimal in range(128)
+    ]
+
+
+def __build_note_table() -> Dict[str, int]:
+    table: Dict[str, int] = {}
+    for decimal in range(128):
+        note, octave = NOTES[decimal % 12], decimal // 12 - 2
+        for name in [note, FLATS.get(note)]:
+            if name:
+                table[f'{name}{octave}'] = decimal
+                table[f'{name.lower()}{octave}'] = decimal
+    return table
+
+
+__DECIMAL_TABLE = __build_decimal_table()
+__NOTE_TABLE = __build_note_table()
 
 
 def note_to_decimal(note: str) -> int:
+    decimal = __NOTE_TABLE.get(note) if isinstance(note, str) else None
+    return decimal if decimal is not None else __parse_note(note)
+
+
+def decimal_to_note(decimal: int) -> str:
+    if not isinstance(decimal, int) or decimal < 0 or decimal > 127:
+        raise ValueError(f'Decimal "{decimal}" unknown.')
+    return __DECIMAL_TABLE[decimal]
+
+
+def bank_to_decimals(bank: str) -> List[int]:
+    # e.g. 'C1 D1 - E1' -> [36, 38, 0, 40]
+    table = __NOTE_TABLE
+    return [
+        0 if note == BANK_PLACEHOLDER
+        else table[note] if note in table
+        else __parse_note(note)
+        for note in bank.split()
+    ]
+
+
+def decimals_to_bank(decimals: Iterable[int]) -> str:
+    return ' '.join([decimal_to_note(decimal) for decimal in decimals])
+
+
+def __parse_note(note: str) -> int:
+    # Slow path for spellings not in the table, e.g., 'C+1' or 'C01'
     try:
         if not note or not isinstance(note, str):
             raise ValueError
@@ -22,16 +81,3 @@ def note_to_decimal(note: str) -> int:
     except ValueError:
         raise ValueError(f'Note "{note}" unknown.')
     return note_idx
-
-
-def decimal_to_note(decimal: int) -> str:
-    if (
-        decimal is None
-        or not isinstance(decimal, int)
-        or decimal < 0
-        or decimal > 127
-    ):
-        raise ValueError(f'Decimal "{decimal}" unknown.')
-    note = NOTES[decimal % 12]
-    octave = int(((decimal - (decimal % 12)) / 12) - 2)
-    return f'{note}{octave}'
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+r"""Content-addressed disk cache of compiled presets.
+
+Presets compiled from a merged configuration are stored under the hash of
+that configuration, so pushing the same configuration again reuses the
+SysEx payload instead of converting it anew. The hash also covers the
+converter sources and the preset template, i.e., entries of an outdated
+converter are never hit again and age out. The cache holds at most
+``MAX_ENTRIES`` presets and evicts the least recently used ones.
+"""
+
+import hashlib
+import json
+import logging
+from os import (environ, getpid, listdir, makedirs, path, remove, replace,
+                stat, utime)
+from typing import Dict, List, Optional, Tuple
+
+from akai_mpkmini_mkii_ctrl import json_converter
+from akai_mpkmini_mkii_ctrl.profiling import span
+
+CACHE_DIR = path.join(
+    environ.get('XDG_CACHE_HOME', path.join(path.expanduser('~'), '.cache')),
+    'akai-mpkmini-mkii-ctrl', 'presets'
+)
+MAX_ENTRIES = 256
+PRESET_SIZE = 117
+CACHE_SUFFIX = '.mk2'
+
+# Everything that determines the output of json_to_binary, i.e., all
+# package modules json_converter imports (checked by the tests)
+__CONVERTER_FILES = [
+    path.join(path.dirname(path.abspath(__file__)), file_name)
+    for file_name in [
+        'json_converter.py', 'config_schema.py', 'note_converter.py',
+        'mpkmini_mk2.py', 'compiled_codec.py'
+    ]
+] + [json_converter.TEMPLATE]
+
+# Stats of the converter files -> their fingerprint
+__FINGERPRINT: Dict[str, Tuple[List[Tuple[int, int]], str]] = {}
+
+
+def compile_config(
+    config: dict,
+    cache_dir: str = CACHE_DIR,
+    max_entries: int = MAX_ENTRIES
+) -> bytes:
+    with span('preset_cache_lookup'):
+        key = config_key(config)
+        cached = __read_entry(cache_dir, key)
+    if cached:
+        logging.debug(f'Compiled preset {key} taken from cache')
+        # Cached presets are valid, but unknown keys are still reported
+        json_converter.CONFIG_SCHEMA.read(config)
+        return cached
+    with span('json_to_binary'):
+        data = bytes(json_converter.json_to_binary(config))
+    try:
+        __write_entry(cache_dir, key, data, max_entries)
+    except OSError as err:
+        logging.warning(f'Cannot cache compiled preset. {err}')
+    return data
+
+
+def config_key(config: dict) -> str:
+    content = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(
+        f'{__converter_fingerprint()}\n{content}'.encode('utf-8')
+    ).hexdigest()
+
+
+def __converter_fingerprint() -> str:
+    # Hashing the sources is cheap, but only redone if any of them changed
+    stats = [
+        (file_stat.st_mtime_ns, file_stat.st_size)
+        for file_stat in [stat(file) for file in __CONVERTER_FILES]
+    ]
+    cached = __FINGERPRINT.get('converter')
+    if not cached or cached[0] != stats:
+        converter_hash = hashlib.sha256()
+        for file in __CONVERTER_FILES:
+            with open(file, 'rb') as file_handle:
+                converter_hash.update(file_handle.read())
+        cached = (stats, converter_hash.hexdigest())
+        __FINGERPRINT['converter'] = cached
+    return cached[1]
+
+
+def __read_entry(cache_dir: str, key: str) -> Optional[bytes]:
+    entry = path.join(cache_dir, f'{key}{CACHE_SUFFIX}')
+    try:
+        with open(entry, 'rb') as entry_handle:
+            data = entry_handle.read()
+        utime(entry)  # Mark as recently used
+    except OSError:
+        return None  # Not cached (or vanished meanwhile)
+    if len(data) != PRESET_SIZE or data[0] != 0xF0 or data[-1] != 0xF7:
+        return None  # Truncated or otherwise broken entry
+    return data
+
+
+def __write_entry(
+    cache_dir: str,
+    key: str,
+    data: bytes,
+    max_entries: int
+) -> None:
+    makedirs(cache_dir, exist_ok=True)
+    entry = path.join(cache_dir, f'{key}{CACHE_SUFFIX}')
+    # Parallel compiles may write the same entry, each via its own file
+    temp_entry = f'{entry}.{getpid()}.tmp'
+    with open(temp_entry, 'wb') as entry_handle:
+        entry_handle.write(data)
+    replace(temp_entry, entry)
+    __evict(cache_dir, max_entries)
+
+
+def __evict(cache_dir: str, max_entries: int) -> None:
+    entries: List[Tuple[int, str]] = []
+    for file_name in listdir(cache_dir):
+        if not file_name.endswith(CACHE_SUFFIX):
+            continue
+        entry = path.join(cache_dir, file_name)
+        try:
+            entries.append((stat(entry).st_mtime_ns, entry))
+        except OSError:
+            pass  # Evicted by another process meanwhile
+    if len(entries) <= max_entries:
+        return
+    for _, entry in sorted(entries)[:len(entries) - max_entries]:
+        try:
+            remove(entry)
+        except OSError:
+            pass
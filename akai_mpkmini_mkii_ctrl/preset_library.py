@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+r"""Packed, memory-mapped archive of binary presets (``*.mk2lib``).
+
+A library stores many presets in a single file, so a preset store with
+thousands of variants does not need thousands of files to be opened.
+
+- Header: ``MK2LIB``, format version, number of presets and the offset and
+  size of the index (little-endian, see ``HEADER``)
+- Records: the presets as fixed-size 117-byte SysEx messages
+- Index: JSON object with ``presets`` (name -> record offset) and free-form
+  ``metadata``
+
+Libraries are opened with ``mmap``, so a preset is a zero-copy slice of the
+mapped file. Presets are referenced as ``library.mk2lib:name``.
+"""
+
+import json
+import mmap
+import re
+import struct
+from os import path, replace
+from types import TracebackType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Type, Union
+
+from construct.core import ConstructError
+
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+
+LIBRARY_EXTENSION = '.mk2lib'
+MAGIC = b'MK2LIB'
+VERSION = 1
+# Magic, version, number of presets, index offset, index size
+HEADER = struct.Struct('<6sHIII')
+PRESET_SIZE = 117
+
+__REFERENCE = re.compile(rf'^(.+\{LIBRARY_EXTENSION}):(.+)$')
+
+Preset = Union[bytes, bytearray, memoryview]
+
+
+class PresetLibrary:
+    """Read-only, memory-mapped view of a preset library.
+
+    Presets returned by ``get`` are slices of the mapping. Release them (or
+    let them go out of scope) before the library is closed.
+    """
+
+    def __init__(self, file_path: str) -> None:  # noqa: D107
+        self.file_path = file_path
+        with open(file_path, 'rb') as library_handle:
+            try:
+                self.__mmap = mmap.mmap(
+                    library_handle.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:  # Empty file
+                raise ValueError(self.__invalid())
+        try:
+            self.__index, self.metadata = self.__read_index()
+        except ValueError:
+            self.__mmap.close()
+            raise
+
+    def __enter__(self) -> 'PresetLibrary':  # noqa: D105
+        return self
+
+    def __exit__(  # noqa: D105
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self.__index)
+
+    def __contains__(self, name: object) -> bool:  # noqa: D105
+        return name in self.__index
+
+    def names(self) -> List[str]:
+        return list(self.__index)
+
+    def get(self, name: str) -> memoryview:
+        offset = self.__index.get(name)
+        if offset is None:
+            raise ValueError(
+                f'Preset "{name}" not found in library {self.file_path}.'
+            )
+        return memoryview(self.__mmap)[offset:offset + PRESET_SIZE]
+
+    def close(self) -> None:
+        self.__mmap.close()
+
+    def __read_index(self) -> Tuple[Dict[str, int], dict]:
+        data = self.__mmap
+        if len(data) < HEADER.size:
+            raise ValueError(self.__invalid())
+        magic, version, count, index_offset, index_size = HEADER.unpack_from(
+            data
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(self.__invalid())
+        try:
+            index = json.loads(data[index_offset:index_offset + index_size])
+            presets = index['presets']
+            metadata = index['metadata']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(self.__invalid())
+        if (
+            not isinstance(presets, dict) or len(presets) != count
+            or not isinstance(metadata, dict)
+            or not all(
+                isinstance(offset, int)
+                and HEADER.size <= offset <= index_offset - PRESET_SIZE
+                for offset in presets.values()
+            )
+        ):
+            raise ValueError(self.__invalid())
+        return presets, metadata
+
+    def __invalid(self) -> str:
+        return f'Input file {self.file_path} is not a valid library format.'
+
+
+def split_reference(reference: str) -> Tuple[str, Optional[str]]:
+    # 'presets.mk2lib:drums/kit-1' -> ('presets.mk2lib', 'drums/kit-1')
+    match = __REFERENCE.match(reference)
+    return (match.group(1), match.group(2)) if match else (reference, None)
+
+
+def read_library(file_path: str) -> Tuple[Dict[str, bytes], dict]:
+    with PresetLibrary(file_path) as library:
+        presets = {name: bytes(library.get(name)) for name in library.names()}
+        return presets, library.metadata
+
+
+def write_library(
+    file_path: str,
+    presets: Mapping[str, Preset],
+    metadata: Optional[dict] = None
+) -> None:
+    records: List[bytes] = []
+    index: Dict[str, int] = {}
+    for name, preset in presets.items():
+        __check_preset(name, preset)
+        index[name] = HEADER.size + len(records) * PRESET_SIZE
+        records.append(bytes(preset))
+    index_data = json.dumps(
+        {'presets': index, 'metadata': metadata or {}}
+    ).encode('utf-8')
+    index_offset = HEADER.size + len(records) * PRESET_SIZE
+    # Written next to the library and moved over it, so that open mappings
+    # of the old library stay valid.
+    with open(f'{file_path}.tmp', 'wb') as library_handle:
+        library_handle.write(HEADER.pack(
+            MAGIC, VERSION, len(records), index_offset, len(index_data)
+        ))
+        library_handle.writelines(records)
+        library_handle.write(index_data)
+    replace(f'{file_path}.tmp', file_path)
+
+
+def update_library(
+    file_path: str,
+    presets: Mapping[str, Preset],
+    metadata: Optional[dict] = None
+) -> None:
+    # Adds or replaces presets, a missing library is created
+    current: Dict[str, Preset] = {}
+    current_metadata: dict = {}
+    if path.exists(file_path):
+        read_presets, current_metadata = read_library(file_path)
+        current.update(read_presets)
+    current.update(presets)
+    write_library(file_path, current, {**current_metadata, **(metadata or {})})
+
+
+def pack_library(
+    preset_files: Iterable[str],
+    file_path: str,
+    metadata: Optional[dict] = None
+) -> List[str]:
+    # Presets are named by their path below the common parent directory
+    preset_files = list(preset_files)
+    if not preset_files:
+        write_library(file_path, {}, metadata)
+        return []
+    common_dir = path.commonpath([path.dirname(f) for f in preset_files])
+    presets: Dict[str, bytes] = {}
+    for preset_file in preset_files:
+        name = path.splitext(path.relpath(preset_file, common_dir))[0]
+        with open(preset_file, 'rb') as preset_handle:
+            presets[name.replace(path.sep, '/')] = preset_handle.read()
+    write_library(file_path, presets, metadata)
+    return list(presets)
+
+
+def __check_preset(name: str, preset: Preset) -> None:
+    if not name or not isinstance(name, str):
+        raise ValueError(f'Invalid preset name "{name}".')
+    try:
+        if len(preset) != PRESET_SIZE:
+            raise ValueError
+        MPK_MINI_MK2_COMPILED.parse(bytes(preset))
+    except (ValueError, ConstructError):
+        raise ValueError(f'Preset "{name}" is not a valid binary format.')
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+r"""Lightweight timing spans for the phases of a command.
+
+Phases are wrapped in ``with span('name'):``. Recording is off by default,
+in which case ``span`` returns a shared no-op context manager, so that
+instrumented code costs next to nothing. Once enabled with
+``enable_profiling``, the recorded spans can be summarized per phase or
+written as a Chrome trace (``chrome://tracing``, https://ui.perfetto.dev).
+"""
+
+from contextlib import contextmanager, nullcontext
+from os import getpid
+from threading import get_ident
+from time import perf_counter
+from typing import (Any, ContextManager, Dict, Generator, List, NamedTuple,
+                    Optional)
+
+
+class Span(NamedTuple):
+    """Timing of a single phase, in seconds since profiling was enabled."""
+
+    name: str
+    start: float
+    duration: float
+    thread: int
+    args: Dict[str, Any]
+
+
+__NO_SPAN: ContextManager[None] = nullcontext()
+# Recorded spans, None while profiling is disabled
+__SPANS: Optional[List[Span]] = None
+__ORIGIN = 0.0
+
+
+def enable_profiling() -> None:
+    global __SPANS, __ORIGIN
+    __SPANS, __ORIGIN = [], perf_counter()
+
+
+def disable_profiling() -> None:
+    global __SPANS
+    __SPANS = None
+
+
+def profiling_enabled() -> bool:
+    return __SPANS is not None
+
+
+def span(name: str, **args: Any) -> ContextManager[None]:
+    if __SPANS is None:
+        return __NO_SPAN
+    return __record(__SPANS, name, args)
+
+
+def recorded_spans() -> List[Span]:
+    return list(__SPANS or [])
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    # Per phase in order of first occurrence, times in milliseconds
+    phases: Dict[str, Dict[str, float]] = {}
+    for recorded in sorted(recorded_spans(), key=lambda s: s.start):
+        phase = phases.setdefault(
+            recorded.name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        )
+        duration_ms = recorded.duration * 1000
+        phase['count'] += 1
+        phase['total_ms'] += duration_ms
+        phase['max_ms'] = max(phase['max_ms'], duration_ms)
+    for phase in phases.values():
+        phase['mean_ms'] = phase['total_ms'] / phase['count']
+        for key in ['total_ms', 'max_ms', 'mean_ms']:
+            phase[key] = round(phase[key], 3)
+    return phases
+
+
+def chrome_trace() -> Dict[str, Any]:
+    # Complete events ('X') with timestamps and durations in microseconds
+    pid = getpid()
+    return {
+        'traceEvents': [
+            {
+                'name': recorded.name, 'ph': 'X', 'pid': pid,
+                'tid': recorded.thread, 'ts': recorded.start * 10**6,
+                'dur': recorded.duration * 10**6,
+                'args': {
+                    key: str(value) for key, value in recorded.args.items()
+                }
+            }
+            for recorded in recorded_spans()
+        ],
+        'displayTimeUnit': 'ms'
+    }
+
+
+@contextmanager
+def __record(
+    spans: List[Span],
+    name: str,
+    args: Dict[str, Any]
+) -> Generator[None, None, None]:
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        end = perf_counter()
+        # list.append is atomic, so spans may be recorded from any thread
+        spans.append(
+            Span(name, start - __ORIGIN, end - start, get_ident(), args)
+        )
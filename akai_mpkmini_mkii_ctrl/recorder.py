@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+r"""Compact binary recording and replay of MIDI traffic.
+
+A recording starts with a magic number followed by fixed-width records of
+12 bytes: a monotonic timestamp in nanoseconds (signed 64-bit, little
+endian), a length byte and three message bytes. Messages longer than three
+bytes, i.e., SysEx, span several records with the same timestamp whose
+length byte has the ``MORE`` bit set on all but the last. A record of
+length 0 marks the start of a recording session, as recordings are only
+ever appended to.
+
+The input callback only copies each message into preallocated arrays, so
+that it never allocates per event or waits for the disk. The recording
+loop moves the records into a fixed chunk buffer that is written to the
+file whenever it is full or ``FLUSH_INTERVAL`` has passed.
+"""
+
+from __future__ import annotations
+
+from array import array
+from os import SEEK_END
+from struct import Struct
+from threading import Event
+from time import monotonic_ns
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn, MidiOut
+
+MAGIC = b'MPKMIDI\x01'
+RECORD = Struct('<qB3s')
+RECORD_SIZE = RECORD.size
+TIMESTAMP = Struct('<q')
+# Bytes of a message per record and flag of a continued message
+RECORD_DATA = 3
+MORE = 0x80
+
+RING_CAPACITY = 1 << 16
+CHUNK_RECORDS = 1 << 14
+# Time between two drains of the ring buffer in seconds
+POLL_INTERVAL = 0.01
+# Maximum time records are kept in memory before they are written
+FLUSH_INTERVAL = 1.0
+# Replay sleeps until this long before an event and spins for the rest
+SPIN_NS = 2 * 10**6
+
+Message = List[int]
+
+
+class RecordRing:
+    """Preallocated ring buffer of records for one writer and reader.
+
+    Like the event ring of the monitor no lock is needed, as the writer
+    (the MIDI callback) and the reader (the recording loop) each only
+    advance their own counter. A message that does not fit into the free
+    records is dropped as a whole.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY) -> None:  # noqa: D107
+        self.capacity = capacity
+        self.timestamps = array('q', bytes(8 * capacity))
+        # Length byte and message bytes of each record
+        self.records = bytearray(4 * capacity)
+        self.messages = 0
+        self.dropped = 0
+        self.__written = 0
+        self.__read = 0
+
+    def __len__(self) -> int:  # noqa: D105
+        return self.__written - self.__read
+
+    def push(self, timestamp: int, message: Message) -> bool:
+        size = len(message)
+        count = (size + RECORD_DATA - 1) // RECORD_DATA
+        written = self.__written
+        if written + count - self.__read > self.capacity:
+            self.dropped += 1
+            return False
+        capacity, records = self.capacity, self.records
+        for record in range(count):
+            index = (written + record) % capacity
+            self.timestamps[index] = timestamp
+            length = min(size - record * RECORD_DATA, RECORD_DATA)
+            records[4 * index] = length | (MORE if record < count - 1 else 0)
+        for position, byte in enumerate(message):
+            index = (written + position // RECORD_DATA) % capacity
+            records[4 * index + 1 + position % RECORD_DATA] = byte
+        self.messages += 1
+        self.__written = written + count  # Publish only once all are set
+        return True
+
+    def drain(self, chunk: bytearray, filled: int) -> int:
+        # Packs buffered records into chunk after the first filled records
+        # while it has room. Returns the number of records in the chunk.
+        read = self.__read
+        count = min(self.__written - read, len(chunk) // RECORD_SIZE - filled)
+        records = memoryview(self.records)
+        for position in range(read, read + count):
+            index = position % self.capacity
+            offset = filled * RECORD_SIZE
+            TIMESTAMP.pack_into(chunk, offset, self.timestamps[index])
+            chunk[offset + 8:offset + 12] = records[4 * index:4 * index + 4]
+            filled += 1
+        self.__read = read + count
+        return filled
+
+    def on_message(self, event: Tuple[Message, float], _: Any) -> None:
+        # Input callback of the MIDI backend
+        if event[0]:
+            self.push(monotonic_ns(), event[0])
+
+
+def record_events(
+    midi_in: MidiIn,
+    file_path: str,
+    stop: Optional[Event] = None,
+    capacity: int = RING_CAPACITY,
+    chunk_records: int = CHUNK_RECORDS
+) -> RecordRing:
+    # Appends all MIDI messages received until stop is set or Ctrl+C to
+    # the recording. The ring tells the number of recorded/dropped messages.
+    ring = RecordRing(capacity)
+    chunk = bytearray(chunk_records * RECORD_SIZE)
+    stop = stop or Event()
+    with open(file_path, 'ab+', buffering=0) as record_handle:
+        record_handle.seek(0)
+        magic = record_handle.read(len(MAGIC))
+        if magic and magic != MAGIC:
+            raise ValueError(f'{file_path} is not a MIDI recording.')
+        if not magic:
+            record_handle.write(MAGIC)
+        # A record cut off by an interrupted write would shift all others
+        end = record_handle.seek(0, SEEK_END)
+        record_handle.truncate(end - (end - len(MAGIC)) % RECORD_SIZE)
+        # The session marker is written with the first chunk
+        RECORD.pack_into(chunk, 0, monotonic_ns(), 0, bytes(RECORD_DATA))
+        filled, last_write = 1, monotonic_ns()
+
+        def write(force: bool) -> None:
+            nonlocal filled, last_write
+            while True:
+                filled = ring.drain(chunk, filled)
+                full, now = filled == chunk_records, monotonic_ns()
+                if full or (filled and (
+                    force or now - last_write >= FLUSH_INTERVAL * 10**9
+                )):
+                    record_handle.write(
+                        memoryview(chunk)[:filled * RECORD_SIZE]
+                    )
+                    filled, last_write = 0, now
+                if not full:
+                    return
+
+        midi_in.ignore_types(sysex=False, timing=False, active_sense=False)
+        midi_in.set_callback(ring.on_message)
+        try:
+            while not stop.wait(POLL_INTERVAL):
+                write(False)
+        except KeyboardInterrupt:
+            pass  # The usual end of a recording
+        finally:
+            midi_in.cancel_callback()
+            write(True)
+    return ring
+
+
+def read_events(
+    file_path: str,
+    chunk_records: int = CHUNK_RECORDS
+) -> Iterator[Tuple[int, Message]]:
+    # (timestamp, message) of all recorded messages, an empty message marks
+    # the start of a session. A record or SysEx message cut off at the end
+    # of the file or of a session is ignored.
+    chunk = bytearray(chunk_records * RECORD_SIZE)
+    view = memoryview(chunk)
+    with open(file_path, 'rb') as record_handle:
+        if record_handle.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{file_path} is not a MIDI recording.')
+        message: Message = []
+        while True:
+            size = record_handle.readinto(chunk)
+            if not size:
+                return
+            size -= size % RECORD_SIZE
+            for timestamp, length, data in RECORD.iter_unpack(view[:size]):
+                if not length:
+                    message = []  # Session marker, yielded as empty message
+                message.extend(data[:length & ~MORE])
+                if not length & MORE:
+                    yield timestamp, message
+                    message = []
+
+
+def replay_events(
+    file_path: str,
+    midi_out: MidiOut,
+    speed: float = 1.0,
+    stop: Optional[Event] = None
+) -> int:
+    # Sends all recorded messages with their recorded timing (divided by
+    # speed). Sessions are played back to back. Returns the messages sent.
+    stop = stop or Event()
+    sent = 0
+    start: Optional[Tuple[int, int]] = None  # (recorded, replayed) time
+    last_due = 0
+    for timestamp, message in read_events(file_path):
+        if not message:
+            start = None  # Timestamps of a new session are unrelated
+            continue
+        if start is None:
+            start = (timestamp, max(monotonic_ns(), last_due))
+        last_due = start[1] + int((timestamp - start[0]) / speed)
+        if __wait_until(last_due, stop):
+            break
+        midi_out.send_message(message)
+        sent += 1
+    return sent
+
+
+def __wait_until(due: int, stop: Event) -> bool:
+    # Sleeping is only accurate to about a millisecond, so the last part is
+    # spent spinning on the clock. Returns whether stop was set.
+    remaining = due - monotonic_ns()
+    if remaining > SPIN_NS and stop.wait((remaining - SPIN_NS) / 10**9):
+        return True
+    while monotonic_ns() < due:
+        pass
+    return stop.is_set()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+r"""Real-time remapping of the MIDI events sent by the device.
+
+A route translates the events the device sends for its current (source)
+preset into the events it would send for another (target) preset, written
+in the configuration format of ``json_converter``: pad notes, CCs and
+programs per bank, dial CCs with their min/max range, joystick CCs and the
+pad and key channels. Notes are in addition shaped by the velocity curve
+in the ``velocity`` section of the target configuration, a setting of the
+router only that is not part of the preset.
+
+Every route is compiled once into flat 128-entry lookup tables per channel,
+so that translating an event is a few table lookups that rewrite the
+message received from the MIDI backend in place, without allocations, in
+the input callback. Any number of routes can be loaded, switching between
+them only swaps the active table.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import (TYPE_CHECKING, Any, Generator, List, Optional, Sequence,
+                    Tuple)
+
+from akai_mpkmini_mkii_ctrl.config_schema import SchemaField, compile_schema
+from akai_mpkmini_mkii_ctrl.monitor import (CONTROL_CHANGE, NOTE_OFF, NOTE_ON,
+                                            POLY_PRESSURE, PROGRAM_CHANGE)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+
+if TYPE_CHECKING:
+    from rtmidi import MidiIn, MidiOut
+
+    from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+# Table that leaves data bytes as they are, the first of RouteTable.curves
+IDENTITY = bytes(range(128))
+# Velocity curve -> exponent of the normalised velocity
+VELOCITY_CURVES = {'LINEAR': 1.0, 'SOFT': 0.5, 'HARD': 2.0, 'FIXED': 0.0}
+# Settings of the router in a configuration. They have no counterpart on the
+# device, so the section is removed before the preset is compiled.
+ROUTE_SECTION = 'velocity'
+ROUTE_SCHEMA = compile_schema([
+    SchemaField('velocity.curve', str, 'LINEAR',
+                choices=list(VELOCITY_CURVES)),
+    SchemaField('velocity.min', int, 1, range=(1, 127)),
+    SchemaField('velocity.max', int, 127, range=(1, 127)),
+])
+
+
+class RouteTable:
+    """Lookup tables of a single route.
+
+    Tables of notes, CCs and programs are indexed by source channel times
+    128 plus the note, CC or program number and hold the target number and
+    channel. ``control_curves`` holds the index of the table in ``curves``
+    that translates the CC value.
+    """
+
+    def __init__(self, name: str = '') -> None:  # noqa: D107
+        self.name = name
+        # Target channel of all other channel messages
+        self.channels = bytearray(range(16))
+        self.notes = bytearray(IDENTITY * 16)
+        self.note_channels = bytearray(channel for channel in range(16)
+                                       for _ in range(128))
+        self.controls = bytearray(IDENTITY * 16)
+        self.control_channels = bytearray(self.note_channels)
+        self.control_curves = bytearray(16 * 128)
+        self.curves: List[bytes] = [IDENTITY]
+        self.programs = bytearray(IDENTITY * 16)
+        self.program_channels = bytearray(self.note_channels)
+        self.velocities = bytearray(IDENTITY)
+
+    def transform(self, message: List[int]) -> None:
+        # Rewrites a channel message in place, others are left as they are
+        status = message[0]
+        if status >= 0xF0:
+            return
+        kind, channel = status & 0xF0, status & 0x0F
+        if kind == NOTE_ON or kind == NOTE_OFF or kind == POLY_PRESSURE:
+            key = channel << 7 | message[1]
+            message[0] = kind | self.note_channels[key]
+            message[1] = self.notes[key]
+            if kind == NOTE_ON:
+                message[2] = self.velocities[message[2]]
+        elif kind == CONTROL_CHANGE:
+            key = channel << 7 | message[1]
+            message[0] = kind | self.control_channels[key]
+            message[1] = self.controls[key]
+            message[2] = self.curves[self.control_curves[key]][message[2]]
+        elif kind == PROGRAM_CHANGE:
+            key = channel << 7 | message[1]
+            message[0] = kind | self.program_channels[key]
+            message[1] = self.programs[key]
+        else:
+            message[0] = kind | self.channels[channel]
+
+
+class Router:
+    """Input callback that sends the routed events to an output port.
+
+    With a ``switch_channel`` (0-based), program changes on that channel
+    select the route of that number instead of being sent.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        routes: Sequence[RouteTable],
+        midi_out: MidiOut,
+        switch_channel: Optional[int] = None
+    ) -> None:
+        if not routes:
+            raise ValueError('At least one route is required.')
+        self.routes = list(routes)
+        self.midi_out = midi_out
+        self.switch_status = (
+            -1 if switch_channel is None else PROGRAM_CHANGE | switch_channel
+        )
+        self.route = self.routes[0]
+        self.active = 0
+
+    def select(self, index: int) -> RouteTable:
+        if not 0 <= index < len(self.routes):
+            raise ValueError(
+                f'No route {index}, expected 0-{len(self.routes) - 1}'
+            )
+        self.route, self.active = self.routes[index], index
+        return self.route
+
+    def on_message(self, event: Tuple[List[int], float], _: Any) -> None:
+        message = event[0]
+        if message[0] == self.switch_status:
+            if message[1] < len(self.routes):
+                self.route, self.active = self.routes[message[1]], message[1]
+            return
+        self.route.transform(message)
+        self.midi_out.send_message(message)
+
+
+@contextmanager
+def routing(midi_in: MidiIn, router: Router) -> Generator[Router, None, None]:
+    # Routes all events received by midi_in until the context is left
+    midi_in.ignore_types(sysex=True, timing=False, active_sense=True)
+    midi_in.set_callback(router.on_message)
+    try:
+        yield router
+    finally:
+        midi_in.cancel_callback()
+
+
+def compile_route(
+    source: MPK_MINI_MK2,
+    target: MPK_MINI_MK2,
+    velocity: Tuple[str, int, int] = ('LINEAR', 1, 127),
+    name: str = ''
+) -> RouteTable:
+    # Route of the events of the source preset to those of the target
+    # preset. velocity is the (curve, min, max) of ROUTE_SCHEMA.
+    table = RouteTable(name)
+    general, target_general = source[0], target[0]
+    pchannel, dchannel = general.pchannel, general.dchannel
+    target_pchannel, target_dchannel = (
+        target_general.pchannel, target_general.dchannel
+    )
+    # Keys, joystick and dials are on the key channel
+    for kind in ('notes', 'controls', 'programs'):
+        __set_channel(table, kind, dchannel, target_dchannel)
+    table.channels[dchannel] = target_dchannel
+    for axis, up, down in [('x', 'x_up', 'x_down'), ('y', 'y_up', 'y_down')]:
+        modes = {str(general[f'axis_{axis}']),
+                 str(target_general[f'axis_{axis}'])}
+        if 'PBEND' in modes:
+            continue  # Pitch bend is only moved to the target channel
+        for field in (up, down):
+            table.controls[dchannel << 7 | general[field]] = (
+                target_general[field]
+            )
+    for dial, target_dial in zip(source[2][0], target[2][0]):
+        key = dchannel << 7 | dial.midicc
+        table.controls[key] = target_dial.midicc
+        table.control_curves[key] = __add_curve(table, __scale(
+            (dial.min, dial.max), (target_dial.min, target_dial.max)
+        ))
+    # Pads are on the pad channel, they win over keys sharing it
+    for kind in ('notes', 'controls', 'programs'):
+        __set_channel(table, kind, pchannel, target_pchannel)
+    table.channels[pchannel] = target_pchannel
+    for bank, target_bank in zip(source[1], target[1]):
+        for pad, target_pad in zip(bank, target_bank):
+            table.notes[pchannel << 7 | pad.note] = target_pad.note
+            table.controls[pchannel << 7 | pad.midicc] = target_pad.midicc
+            table.control_curves[pchannel << 7 | pad.midicc] = 0  # IDENTITY
+            table.programs[pchannel << 7 | pad.prog] = target_pad.prog
+    table.velocities[:] = velocity_curve(*velocity)
+    return table
+
+
+def load_route(
+    config: dict,
+    source: MPK_MINI_MK2,
+    name: str = ''
+) -> RouteTable:
+    # Route to the preset of a configuration, see json_converter, with the
+    # optional settings of ROUTE_SCHEMA
+    curve, minimum, maximum = ROUTE_SCHEMA.read(
+        {ROUTE_SECTION: config.get(ROUTE_SECTION)}
+    )
+    target = MPK_MINI_MK2_COMPILED.parse(compile_config({
+        key: value for key, value in config.items() if key != ROUTE_SECTION
+    }))
+    return compile_route(source, target, (curve, minimum, maximum), name)
+
+
+def velocity_curve(curve: str, minimum: int, maximum: int) -> bytes:
+    # Table of note on velocities, 0 (note off) is kept and 1-127 are
+    # mapped to minimum-maximum along the curve
+    if curve not in VELOCITY_CURVES:
+        raise ValueError(f'Unknown velocity curve {curve}')
+    exponent = VELOCITY_CURVES[curve]
+    return bytes([0] + [
+        max(1, round(
+            minimum + (maximum - minimum) * ((velocity - 1) / 126) ** exponent
+        )) for velocity in range(1, 128)
+    ])
+
+
+def __set_channel(
+    table: RouteTable, kind: str, channel: int, target_channel: int
+) -> None:
+    # Target channel of all numbers of a kind sent on the source channel
+    channels = getattr(table, f'{kind[:-1]}_channels')
+    channels[channel << 7:(channel + 1) << 7] = bytes([target_channel]) * 128
+
+
+def __scale(source: Tuple[int, int], target: Tuple[int, int]) -> bytes:
+    # Linear map of the source range of a dial to the target range. A range
+    # with min = max (e.g., unset in a configuration) is the full range.
+    low, high = source if source[0] != source[1] else (0, 127)
+    target_low, target_high = target if target[0] != target[1] else (0, 127)
+    factor = (target_high - target_low) / (high - low)
+    return bytes([
+        round(target_low + (
+            min(max(value, min(low, high)), max(low, high)) - low
+        ) * factor) for value in range(128)
+    ])
+
+
+def __add_curve(table: RouteTable, curve: bytes) -> int:
+    # Index of the curve, equal curves are shared
+    if curve not in table.curves:
+        table.curves.append(curve)
+    return table.curves.index(curve)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.async_controller."""
+
+import asyncio
+import json
+from os import path
+from threading import Event
+from time import perf_counter
+from typing import Any, Tuple
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl.async_controller import (AsyncMpkController,
+                                                     PushResult,
+                                                     push_to_devices)
+from akai_mpkmini_mkii_ctrl.device_state import (load_device_state,
+                                                 save_device_state)
+from akai_mpkmini_mkii_ctrl.emulator import (DUMP_REQUEST, LOAD_PRESET,
+                                             VirtualMidiIn, VirtualMidiOut,
+                                             VirtualMpkMini)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+TIMEOUT = 1.0
+
+
+@pytest.fixture
+def device(monkeypatch: pytest.MonkeyPatch) -> VirtualMpkMini:
+    device = VirtualMpkMini(latency=0.002, chunk_size=32)
+    monkeypatch.setattr(
+        ctrl, 'setup_midi_in_and_out',
+        lambda port, interactive=True: device.ports()
+    )
+    return device
+
+
+def _run(coroutine: Any) -> Any:
+    return asyncio.run(coroutine)
+
+
+def _push(config: Any, state_file: str, **options: bool) -> PushResult:
+    # Pushes to preset 1 of the emulated device, only changes by default
+    options.setdefault('if_changed', True)
+    results = _run(push_to_devices(
+        [0], config, 1, TIMEOUT, state_file=state_file, **options
+    ))
+    assert len(results) == 1 and results[0].success
+    return results[0]
+
+
+def _commands(device: VirtualMpkMini) -> list:
+    return [message[4] for message in device.received]
+
+
+class TestAsyncMpkController:  # noqa: D101
+
+    def test_connect_and_disconnect(self, device: VirtualMpkMini) -> None:
+        async def connect() -> AsyncMpkController:
+            async with AsyncMpkController(0, TIMEOUT) as controller:
+                assert controller.midi_in is device.midi_in
+                assert controller.midi_out is device.midi_out
+            return controller
+        controller = _run(connect())
+        assert controller.midi_in is None and controller.midi_out is None
+        assert not device.midi_in.is_port_open()
+        assert not device.midi_out.is_port_open()
+
+    def test_pull(self, device: VirtualMpkMini) -> None:
+        async def pull() -> bytearray:
+            async with AsyncMpkController(0, TIMEOUT) as controller:
+                return await controller.pull(3)
+        binary = _run(pull())
+        assert binary[4] == 100 and binary[7] == 3
+        assert binary[8:] == device.presets[3][8:]
+
+    def test_concurrent_pulls(self, device: VirtualMpkMini) -> None:
+        async def pull_all() -> list:
+            async with AsyncMpkController(0, TIMEOUT) as controller:
+                return list(await asyncio.gather(*[
+                    controller.pull(preset) for preset in ctrl.ALL_PRESETS
+                ]))
+        binaries = _run(pull_all())
+        assert [binary[7] for binary in binaries] == ctrl.ALL_PRESETS
+
+    def test_push_and_verify(self, device: VirtualMpkMini) -> None:
+        config = ctrl.read_binary_file(
+            path.join(FACTORY_PATCHES, 'preset2.mk2')
+        )
+        config[0].pchannel = 11
+
+        async def push() -> Any:
+            async with AsyncMpkController(0, TIMEOUT) as controller:
+                assert await controller.push_and_verify(config, 4)
+                return await controller.pull_config(4)
+        pulled = _run(push())
+        assert pulled[0].preset == 4 and pulled[0].pchannel == 11
+        assert device.presets[4][8] == 11
+
+    def test_pull_timeout(self, device: VirtualMpkMini) -> None:
+        device.drop_rate = 1.0
+
+        async def pull() -> bytearray:
+            async with AsyncMpkController(0, 0.05) as controller:
+                return await controller.pull(0)
+        with pytest.raises(TimeoutError):
+            _run(pull())
+
+    def test_late_reply_is_skipped(self, device: VirtualMpkMini) -> None:
+        device.latency = 0.15
+        device.presets[1][8] = 5  # Tell the slots apart
+
+        async def pull() -> bytearray:
+            async with AsyncMpkController(0, 0.1) as controller:
+                with pytest.raises(TimeoutError):
+                    await controller.pull(1)
+                controller.timeout = TIMEOUT
+                return await controller.pull(2)
+        binary = _run(pull())
+        assert binary[7] == 2 and binary[8] != 5
+
+    def test_not_connected(self) -> None:
+        with pytest.raises(RuntimeError, match='not connected'):
+            _run(AsyncMpkController(0).pull(0))
+
+    def test_connect_timeout_closes_late_ports(
+        self, device: VirtualMpkMini, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        release, closed = Event(), Event()
+
+        def hung_ports(
+            port: int, interactive: bool = True
+        ) -> Tuple[VirtualMidiIn, VirtualMidiOut]:
+            release.wait(TIMEOUT)
+            ports = device.ports()
+            device.midi_out.close_port = closed.set  # type: ignore
+            return ports
+        monkeypatch.setattr(ctrl, 'setup_midi_in_and_out', hung_ports)
+        start = perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            _run(AsyncMpkController(0).connect(0.05))
+        # asyncio.run does not wait for the hung opener
+        assert perf_counter() - start < TIMEOUT / 2
+        release.set()
+        assert closed.wait(TIMEOUT)
+
+
+class TestPushToDevices:  # noqa: D101
+
+    @pytest.fixture
+    def state_file(self, tmp_path: Any) -> str:
+        return str(tmp_path / 'state.json')
+
+    def test_skip_known_state(
+        self, device: VirtualMpkMini, state_file: str
+    ) -> None:
+        config = MPK_MINI_MK2.parse(bytes(device.presets[1]))
+        config[0].pchannel = 11
+        save_device_state({0: MPK_MINI_MK2.build(config)}, 1, state_file)
+        result = _push(config, state_file)
+        assert result.skipped and result.changes == ()
+        assert device.received == []
+
+    def test_skip_read_back(
+        self, device: VirtualMpkMini, state_file: str
+    ) -> None:
+        # The device differs from the state cache, which is not asked
+        save_device_state({0: bytes(device.presets[2])}, 1, state_file)
+        device.presets[1][8] = 11
+        config = MPK_MINI_MK2.parse(bytes(device.presets[1]))
+        result = _push(config, state_file, read_back=True)
+        assert result.skipped
+        assert _commands(device) == [DUMP_REQUEST]
+
+    def test_push_changes(
+        self, device: VirtualMpkMini, state_file: str
+    ) -> None:
+        config = MPK_MINI_MK2.parse(bytes(device.presets[1]))
+        channel = config[0].pchannel
+        config[0].pchannel = 11
+        result = _push(config, state_file, read_back=True)
+        assert not result.skipped
+        assert result.changes == (f'pchannel: {channel} -> 11',)
+        assert _commands(device) == [DUMP_REQUEST, LOAD_PRESET]
+        assert device.presets[1][8] == 11
+        assert load_device_state(0, 1, state_file) == bytes(device.presets[1])
+
+    @pytest.mark.parametrize('entry', [None, 'zz', '00' * 10])
+    def test_unknown_state_is_read_back(
+        self, device: VirtualMpkMini, state_file: str, entry: Any
+    ) -> None:
+        with open(state_file, 'w') as state_handle:
+            json.dump({} if entry is None else {'0:1': entry}, state_handle)
+        config = MPK_MINI_MK2.parse(bytes(device.presets[1]))
+        assert _push(config, state_file).skipped
+        assert _commands(device) == [DUMP_REQUEST]
+
+    def test_corrupt_state_is_pushed_in_full(
+        self, device: VirtualMpkMini, state_file: str
+    ) -> None:
+        # A preset of the right size that cannot be parsed
+        save_device_state({0: bytes(ctrl.PRESET_SIZE)}, 1, state_file)
+        config = MPK_MINI_MK2.parse(bytes(device.presets[1]))
+        result = _push(config, state_file)
+        assert not result.skipped and result.changes == ()
+        assert _commands(device) == [LOAD_PRESET]
+        assert load_device_state(0, 1, state_file) == bytes(device.presets[1])
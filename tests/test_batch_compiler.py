@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.batch_compiler."""
+
+import shutil
+from glob import glob
+from os import makedirs, path
+
+from akai_mpkmini_mkii_ctrl import json_converter
+from akai_mpkmini_mkii_ctrl.batch_compiler import (compile_configs,
+                                                   find_config_files,
+                                                   output_files)
+from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_files
+
+CONFIG_PRESETS = path.join(
+    path.dirname(__file__), '..', 'resources', 'config-presets'
+)
+BASE_CONFIG = path.join(CONFIG_PRESETS, 'Base-Config.yaml')
+
+
+def _variants(tmp_path: str) -> str:
+    # Two folders with equally named presets and a broken one
+    variants = path.join(tmp_path, 'variants')
+    for folder in ['artist-a', 'artist-b']:
+        makedirs(path.join(variants, folder))
+        for preset in glob(path.join(CONFIG_PRESETS, 'Logic-*.yaml')):
+            shutil.copy(preset, path.join(variants, folder))
+    with open(path.join(variants, 'artist-b', 'broken.json'), 'w') as broken:
+        broken.write('{"pads": {"bank-a": {"notes": "X1 X2 - - - - - -"}}}')
+    with open(path.join(variants, 'README.md'), 'w') as readme:
+        readme.write('# Not a preset')
+    return variants
+
+
+class TestBatchCompiler:  # noqa: D101
+
+    def test_find_config_files(self, tmp_path: str) -> None:
+        variants = _variants(tmp_path)
+        assert len(find_config_files([variants])) == 9
+        assert len(find_config_files([
+            path.join(variants, 'artist-a', '*Drum*'),
+            path.join(variants, '**', 'Logic-DrumKit.yaml')
+        ])) == 3
+        assert find_config_files([path.join(variants, 'missing')]) == []
+
+    def test_output_files(self) -> None:
+        assert output_files(['/in/a/x.yaml', '/in/b/x.json'], '/out') == [
+            '/out/a/x.mk2', '/out/b/x.mk2'
+        ]
+        assert output_files(['/in/a/x.yaml'], '/out') == ['/out/x.mk2']
+
+    def test_compile_configs(self, tmp_path: str) -> None:
+        config_files = find_config_files([_variants(tmp_path)])
+        output_dir = path.join(tmp_path, 'out')
+        results = list(compile_configs(
+            config_files, output_dir, [BASE_CONFIG], 2,
+            path.join(tmp_path, 'cache')
+        ))
+        assert len(results) == len(config_files)
+        failed = [result for result in results if not result.success]
+        assert len(failed) == 1
+        assert failed[0].input_file.endswith('broken.json')
+        assert "pads.bank-a.notes: Invalid value 'X1', Invalid value 'X2'" \
+            in str(failed[0].error)
+        assert not path.exists(failed[0].output_file)
+        for result in results:
+            if not result.success:
+                continue
+            with open(result.output_file, 'rb') as output_handle:
+                assert output_handle.read() == json_converter.json_to_binary(
+                    load_config_from_files([BASE_CONFIG, result.input_file])
+                )
+
+    def test_compile_nothing(self, tmp_path: str) -> None:
+        assert list(compile_configs([], str(tmp_path))) == []
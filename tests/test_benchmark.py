@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+r"""Benchmark suite for the conversion hot paths.
+
+Benchmarks only run as such with ``make benchmark``, otherwise every
+benchmarked call is executed once as a plain test (``--benchmark-disable``).
+"""
+
+import json
+from functools import reduce
+from glob import glob
+from os import path
+from typing import Any, Callable, List
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import config_reader
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl import json_converter, note_converter
+from akai_mpkmini_mkii_ctrl.config_reader import (load_config_from_file,
+                                                  update_config)
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import (MPK_MINI_MK2,
+                                                MPK_MINI_MK2_COMPILED)
+from akai_mpkmini_mkii_ctrl.preset_library import PresetLibrary, write_library
+from akai_mpkmini_mkii_ctrl.router import compile_route
+
+RESOURCES = path.join(path.dirname(__file__), '..', 'resources')
+CONFIG_PRESETS = sorted(glob(path.join(RESOURCES, 'config-presets', '*')))
+BASE_CONFIG = path.join(RESOURCES, 'config-presets', 'Base-Config.yaml')
+FACTORY_PATCHES = sorted(glob(path.join(RESOURCES, 'factory-patches', '*')))
+NOTES = [note_converter.decimal_to_note(decimal) for decimal in range(128)]
+
+Benchmark = Callable[..., Any]
+
+
+def _name(file_path: str) -> str:
+    return path.basename(file_path)
+
+
+def _read(file_path: str) -> bytes:
+    with open(file_path, 'rb') as file_handle:
+        return file_handle.read()
+
+
+def _load_uncached(file_path: str) -> dict:
+    getattr(config_reader, '__CONFIG_CACHE').clear()
+    return load_config_from_file(file_path)
+
+
+def _deep_config(depth: int, width: int) -> dict:
+    if not depth:
+        return {f'key-{index}': index for index in range(width)}
+    return {
+        f'key-{index}': _deep_config(depth - 1, width)
+        for index in range(width)
+    }
+
+
+@pytest.mark.benchmark(group='note-converter')
+class TestNoteConverterBenchmark:  # noqa: D101
+
+    def test_note_to_decimal(self, benchmark: Benchmark) -> None:
+        decimals = benchmark(
+            lambda: [note_converter.note_to_decimal(note) for note in NOTES]
+        )
+        assert decimals == list(range(128))
+
+    def test_decimal_to_note(self, benchmark: Benchmark) -> None:
+        notes = benchmark(lambda: [
+            note_converter.decimal_to_note(decimal) for decimal in range(128)
+        ])
+        assert notes == NOTES
+
+    def test_bank_to_decimals(self, benchmark: Benchmark) -> None:
+        bank = ' '.join(NOTES)
+        assert benchmark(note_converter.bank_to_decimals, bank) == list(
+            range(128)
+        )
+
+    def test_decimals_to_bank(self, benchmark: Benchmark) -> None:
+        bank = benchmark(note_converter.decimals_to_bank, range(128))
+        assert bank == ' '.join(NOTES)
+
+
+@pytest.mark.benchmark(group='config-reader')
+class TestConfigReaderBenchmark:  # noqa: D101
+
+    @pytest.mark.parametrize('config_file', CONFIG_PRESETS, ids=_name)
+    def test_load_yaml_config(
+        self, benchmark: Benchmark, config_file: str
+    ) -> None:
+        assert benchmark(_load_uncached, config_file)
+
+    @pytest.mark.parametrize('config_file', CONFIG_PRESETS, ids=_name)
+    def test_load_json_config(
+        self, benchmark: Benchmark, config_file: str, tmp_path: str
+    ) -> None:
+        json_file = path.join(tmp_path, f'{_name(config_file)}.json')
+        with open(json_file, 'w') as json_handle:
+            json.dump(load_config_from_file(config_file), json_handle)
+        assert benchmark(_load_uncached, json_file)
+
+    @pytest.mark.parametrize('config_file', CONFIG_PRESETS, ids=_name)
+    def test_load_cached_config(
+        self, benchmark: Benchmark, config_file: str
+    ) -> None:
+        load_config_from_file(config_file)
+        assert benchmark(load_config_from_file, config_file)
+
+    def test_update_layered_presets(self, benchmark: Benchmark) -> None:
+        # Base configuration extended by every bundled preset in turn
+        layers = [load_config_from_file(file) for file in CONFIG_PRESETS]
+        assert benchmark(lambda: reduce(update_config, layers, {}))
+
+    def test_update_deep_config(self, benchmark: Benchmark) -> None:
+        layers = [_deep_config(6, 4) for _ in range(3)]
+        assert benchmark(lambda: reduce(update_config, layers, {}))
+
+
+@pytest.mark.benchmark(group='json-converter')
+class TestJsonConverterBenchmark:  # noqa: D101
+
+    @pytest.mark.parametrize('config_file', CONFIG_PRESETS, ids=_name)
+    def test_json_to_binary(
+        self, benchmark: Benchmark, config_file: str
+    ) -> None:
+        config = update_config(
+            load_config_from_file(BASE_CONFIG),
+            load_config_from_file(config_file)
+        )
+        binary: List[int] = benchmark(json_converter.json_to_binary, config)
+        assert len(binary) == MPK_MINI_MK2.sizeof()
+
+    def test_update_binary(self, benchmark: Benchmark) -> None:
+        # A single field changed, e.g., while watching a configuration
+        previous = load_config_from_file(BASE_CONFIG)
+        config = load_config_from_file(BASE_CONFIG)
+        config['arpeggiator']['tempo'] = 90
+        data = bytearray(json_converter.json_to_binary(previous))
+        benchmark(json_converter.update_binary, data, previous, config)
+        assert data == bytes(json_converter.json_to_binary(config))
+
+
+@pytest.mark.benchmark(group='mpkmini-mk2')
+class TestMpkMiniMk2Benchmark:  # noqa: D101
+
+    @pytest.mark.parametrize('patch_file', FACTORY_PATCHES, ids=_name)
+    def test_parse(self, benchmark: Benchmark, patch_file: str) -> None:
+        assert benchmark(MPK_MINI_MK2.parse, _read(patch_file))
+
+    @pytest.mark.parametrize('patch_file', FACTORY_PATCHES, ids=_name)
+    def test_build(self, benchmark: Benchmark, patch_file: str) -> None:
+        data = _read(patch_file)
+        assert benchmark(MPK_MINI_MK2.build, MPK_MINI_MK2.parse(data)) == data
+
+    @pytest.mark.parametrize('patch_file', FACTORY_PATCHES, ids=_name)
+    def test_compiled_parse(
+        self, benchmark: Benchmark, patch_file: str
+    ) -> None:
+        assert benchmark(MPK_MINI_MK2_COMPILED.parse, _read(patch_file))
+
+    @pytest.mark.parametrize('patch_file', FACTORY_PATCHES, ids=_name)
+    def test_compiled_build(
+        self, benchmark: Benchmark, patch_file: str
+    ) -> None:
+        data = _read(patch_file)
+        config = MPK_MINI_MK2_COMPILED.parse(data)
+        assert benchmark(MPK_MINI_MK2_COMPILED.build, config) == data
+
+    @pytest.mark.parametrize('codec', [MPK_MINI_MK2, MPK_MINI_MK2_COMPILED],
+                             ids=['construct', 'compiled'])
+    def test_roundtrip(self, benchmark: Benchmark, codec: Any) -> None:
+        # Parse and build of all factory patches, compare both codecs with
+        # --benchmark-group-by=func
+        presets = [_read(patch_file) for patch_file in FACTORY_PATCHES]
+        configs = [MPK_MINI_MK2.parse(data) for data in presets]
+
+        def roundtrip() -> List[bytes]:
+            for data in presets:
+                codec.parse(data)
+            return [codec.build(config) for config in configs]
+        assert benchmark(roundtrip) == presets
+
+
+@pytest.mark.benchmark(group='preset-library')
+class TestPresetLibraryBenchmark:  # noqa: D101
+
+    # Size of a preset store, each preset a file or a library record
+    PRESETS = 1000
+
+    def test_read_preset_files(
+        self, benchmark: Benchmark, tmp_path: str
+    ) -> None:
+        data = _read(FACTORY_PATCHES[0])
+        preset_files = [
+            path.join(tmp_path, f'{index}.mk2')
+            for index in range(self.PRESETS)
+        ]
+        for preset_file in preset_files:
+            with open(preset_file, 'wb') as preset_handle:
+                preset_handle.write(data)
+        presets = benchmark(lambda: [_read(file) for file in preset_files])
+        assert len(presets) == self.PRESETS
+
+    def test_read_library_presets(
+        self, benchmark: Benchmark, tmp_path: str
+    ) -> None:
+        data = _read(FACTORY_PATCHES[0])
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        write_library(library_file, {
+            str(index): data for index in range(self.PRESETS)
+        })
+
+        def read_all() -> int:
+            with PresetLibrary(library_file) as library:
+                return sum([
+                    len(library.get(name)) for name in library.names()
+                ])
+        assert benchmark(read_all) == self.PRESETS * len(data)
+
+
+@pytest.mark.benchmark(group='controller')
+class TestControllerBenchmark:  # noqa: D101
+
+    # The emulated device replies without latency, so only the host-side
+    # processing of a round trip is measured
+    TIMEOUT = 1.0
+
+    def test_round_trip(self, benchmark: Benchmark) -> None:
+        device = VirtualMpkMini(chunk_size=64)
+        binary = benchmark(
+            ctrl.get_binary_from_device, 0, *device.ports(), self.TIMEOUT
+        )
+        assert binary[7] == 0
+
+    def test_push_pull(self, benchmark: Benchmark) -> None:
+        device = VirtualMpkMini()
+        config = MPK_MINI_MK2_COMPILED.parse(_read(FACTORY_PATCHES[0]))
+
+        def push_pull() -> bytearray:
+            ctrl.send_config_to_device(config, 1, device.midi_out)
+            return ctrl.get_binary_from_device(
+                1, *device.ports(), self.TIMEOUT
+            )
+        assert benchmark(push_pull)[27:] == _read(FACTORY_PATCHES[0])[27:]
+
+
+@pytest.mark.benchmark(group='router')
+class TestRouterBenchmark:  # noqa: D101
+
+    def test_compile_route(self, benchmark: Benchmark) -> None:
+        source = MPK_MINI_MK2_COMPILED.parse(_read(FACTORY_PATCHES[0]))
+        target = MPK_MINI_MK2_COMPILED.parse(_read(FACTORY_PATCHES[1]))
+        table = benchmark(compile_route, source, target, ('SOFT', 1, 127))
+        assert len(table.notes) == 16 * 128
+
+    def test_transform(self, benchmark: Benchmark) -> None:
+        source = MPK_MINI_MK2_COMPILED.parse(_read(FACTORY_PATCHES[0]))
+        table = compile_route(source, source, ('SOFT', 1, 127))
+        messages = [[0x90 | channel, note, 100]
+                    for channel in range(2) for note in range(128)]
+
+        def transform_all() -> None:
+            for message in messages:
+                table.transform(message)
+                message[0] &= 0xF1  # Keep routing the same events
+        benchmark(transform_all)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.compiled_codec."""
+
+from glob import glob
+from os import path
+from typing import List
+
+import pytest
+from construct.core import ConstError, MappingError, StreamError
+
+from akai_mpkmini_mkii_ctrl.json_converter import TEMPLATE
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import (MPK_MINI_MK2,
+                                                MPK_MINI_MK2_COMPILED)
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+PRESET_FILES: List[str] = sorted(
+    glob(path.join(FACTORY_PATCHES, '*.mk2'))
+) + [TEMPLATE]
+
+
+def _read(file_path: str) -> bytes:
+    with open(file_path, 'rb') as file_handle:
+        return file_handle.read()
+
+
+class TestCompiledCodec:  # noqa: D101
+
+    def test_sizeof(self) -> None:
+        assert MPK_MINI_MK2_COMPILED.sizeof() == 117
+        assert MPK_MINI_MK2_COMPILED.sizeof() == MPK_MINI_MK2.sizeof()
+
+    @pytest.mark.parametrize('file_path', PRESET_FILES)
+    def test_parse_parity(self, file_path: str) -> None:
+        data = _read(file_path)
+        assert MPK_MINI_MK2_COMPILED.parse(data) == MPK_MINI_MK2.parse(data)
+
+    @pytest.mark.parametrize('file_path', PRESET_FILES)
+    def test_build_parity(self, file_path: str) -> None:
+        data = _read(file_path)
+        config = MPK_MINI_MK2.parse(data)
+        assert MPK_MINI_MK2_COMPILED.build(config) == data
+        config = MPK_MINI_MK2_COMPILED.parse(data)
+        assert MPK_MINI_MK2.build(config) == data
+        assert MPK_MINI_MK2_COMPILED.build(config) == data
+
+    def test_modified_build_parity(self) -> None:
+        config = MPK_MINI_MK2_COMPILED.parse_file(TEMPLATE)
+        config[0].preset = 3
+        config[0].tempo = 187
+        config[0].octave = 'OCT_P2'
+        config[0].axis_x = 1
+        config[1][1][7].trigger = 'TOGGLE'
+        config[3].transpose = 'TRANS_M5'
+        del config[0]['y_down']
+        expected = MPK_MINI_MK2.build(config)
+        assert MPK_MINI_MK2_COMPILED.build(config) == expected
+
+    def test_build_into_memoryview(self) -> None:
+        data = _read(TEMPLATE)
+        config = MPK_MINI_MK2_COMPILED.parse(data)
+        buffer = bytearray(3 + len(data))
+        MPK_MINI_MK2_COMPILED.build_into(config, memoryview(buffer), 3)
+        assert buffer[3:] == data
+        assert MPK_MINI_MK2_COMPILED.parse(memoryview(buffer)[3:]) == config
+
+    def test_parse_invalid_const(self) -> None:
+        data = bytearray(_read(TEMPLATE))
+        data[0] = 0x00
+        with pytest.raises(ConstError):
+            MPK_MINI_MK2_COMPILED.parse(data)
+
+    def test_check(self) -> None:
+        data = _read(TEMPLATE)
+        assert MPK_MINI_MK2_COMPILED.check(data) == data
+        with pytest.raises(ConstError):
+            MPK_MINI_MK2_COMPILED.check(b'\x00' + data[1:])
+        with pytest.raises(StreamError):
+            MPK_MINI_MK2_COMPILED.check(data[:-1])
+
+    def test_parse_short_data(self) -> None:
+        with pytest.raises(StreamError):
+            MPK_MINI_MK2_COMPILED.parse(_read(TEMPLATE)[:-1])
+
+    def test_build_unknown_enum(self) -> None:
+        config = MPK_MINI_MK2_COMPILED.parse_file(TEMPLATE)
+        config[0].octave = 'OCT_P9'
+        with pytest.raises(MappingError):
+            MPK_MINI_MK2_COMPILED.build(config)
+
+    def test_fields(self) -> None:
+        fields = MPK_MINI_MK2_COMPILED.fields
+        assert fields['0.preset'][:2] == (7, 1)
+        assert fields['0.tempo'][:2] == (18, 2)
+        assert fields['1.0.0.note'][:2] == (27, 1)
+        assert fields['1.1'][:2] == (59, 32)
+        assert fields['2.0.7.max'][:2] == (114, 1)
+        assert fields['3.transpose'][:2] == (115, 1)
+        assert '0.mk2' not in fields  # Computed, i.e., not in the binary
+
+    @pytest.mark.parametrize('field, value', [
+        ('0.tempo', 187),
+        ('0.octave', 'OCT_P2'),
+        ('1.1.7.trigger', 'TOGGLE'),
+        ('2.0.3.midicc', 99),
+        ('1.0.2', {'note': 1, 'prog': 2, 'midicc': 3, 'trigger': 1}),
+    ])
+    def test_build_field(self, field: str, value: object) -> None:
+        data = bytearray(_read(TEMPLATE))
+        config = MPK_MINI_MK2_COMPILED.parse(data)
+        byte_range = MPK_MINI_MK2_COMPILED.build_field(field, value, data)
+        assert byte_range[0] == MPK_MINI_MK2_COMPILED.fields[field][0]
+        *parents, name = [
+            int(part) if part.isdigit() else part for part in field.split('.')
+        ]
+        target = config
+        for parent in parents:
+            target = target[parent]
+        target[name] = value
+        assert bytes(data) == MPK_MINI_MK2.build(config)
+
+    def test_build_unknown_field(self) -> None:
+        with pytest.raises(KeyError):
+            MPK_MINI_MK2_COMPILED.build_field(
+                '0.unknown', 1, bytearray(_read(TEMPLATE))
+            )
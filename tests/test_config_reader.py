@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 r"""Test suite for akai_mpkmini_mkii_ctrl.note_converter."""
 
-from os import path
+import shutil
+from os import path, stat, utime
 
 import pytest
 
+from akai_mpkmini_mkii_ctrl import config_reader
 from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_file
 
 FIXTURES = path.join(path.dirname(__file__), 'fixtures')
@@ -32,6 +34,56 @@ class TestConfigReader:  # noqa: D101
         config: dict = load_config_from_file(YAML_CONFIG)
         TestConfigReader.__assert_content(config)
 
+    @pytest.mark.parametrize('fixture', [JSON_CONFIG, YAML_CONFIG])
+    def test_load_config_without_extension(
+        self, fixture: str, tmp_path: str
+    ) -> None:
+        config_file = path.join(tmp_path, 'config')
+        shutil.copy(fixture, config_file)
+        TestConfigReader.__assert_content(load_config_from_file(config_file))
+
+    def test_load_config_is_cached(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.json')
+        shutil.copy(JSON_CONFIG, config_file)
+        config = load_config_from_file(config_file)
+        config['midi-channels']['pads'] = 16
+        config['extra'] = True
+        # Callers get a copy that does not change the cached configuration
+        TestConfigReader.__assert_content(load_config_from_file(config_file))
+        assert 'extra' not in load_config_from_file(config_file)
+        cache = getattr(config_reader, '__CONFIG_CACHE')
+        assert path.abspath(config_file) in cache
+
+    def test_load_config_cache_is_bounded(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(config_reader, 'MAX_CACHED_CONFIGS', 2)
+        config_files = [path.join(tmp_path, f'{name}.yaml') for name in 'abc']
+        for config_file in config_files:
+            with open(config_file, 'w') as config_handle:
+                config_handle.write('a: 1\n')
+        for config_file in config_files[:2] + config_files[:1]:
+            load_config_from_file(config_file)
+        load_config_from_file(config_files[2])
+        # The least recently used file is evicted
+        cache = getattr(config_reader, '__CONFIG_CACHE')
+        assert path.abspath(config_files[0]) in cache
+        assert path.abspath(config_files[1]) not in cache
+        assert path.abspath(config_files[2]) in cache
+        assert len(cache) == 2
+
+    def test_load_config_after_change(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.yaml')
+        with open(config_file, 'w') as config_handle:
+            config_handle.write('a: 1\n')
+        mtime = stat(config_file).st_mtime_ns
+        assert load_config_from_file(config_file) == {'a': 1}
+        # Same modification time, but the size changed
+        with open(config_file, 'w') as config_handle:
+            config_handle.write('a: 10\n')
+        utime(config_file, ns=(mtime, mtime))
+        assert load_config_from_file(config_file) == {'a': 10}
+
     @staticmethod
     def __assert_content(config: dict) -> None:
         assert config
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.config_schema."""
+
+import logging
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl.config_schema import (ConfigError, SchemaField,
+                                                  compile_schema, enum_choices)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import Arpeggio, Joy
+
+SCHEMA = compile_schema([
+    SchemaField('channels.pads', int, 1, range=(1, 16)),
+    SchemaField('channels.keys', int, 1, range=(1, 16)),
+    SchemaField(
+        'swing', str, 'SWING_50', choices=enum_choices(Arpeggio.swing)
+    ),
+    SchemaField('bank', int, '1 2 3', range=(0, 127), entries=3),
+])
+
+
+class TestConfigSchema:  # noqa: D101
+
+    def test_defaults(self) -> None:
+        assert SCHEMA.read({}) == [1, 1, 'SWING_50', [1, 2, 3]]
+        assert SCHEMA.read(None) == [1, 1, 'SWING_50', [1, 2, 3]]
+
+    def test_read(self) -> None:
+        assert SCHEMA.read({
+            'channels': {'keys': 16}, 'swing': 'SWING_64', 'bank': '7 8 9'
+        }) == [1, 16, 'SWING_64', [7, 8, 9]]
+
+    def test_empty_values_take_default(self) -> None:
+        assert SCHEMA.read({'channels': None, 'swing': '', 'bank': None}) == [
+            1, 1, 'SWING_50', [1, 2, 3]
+        ]
+
+    def test_all_errors_are_reported(self) -> None:
+        with pytest.raises(ConfigError) as error:
+            SCHEMA.read({
+                'channels': {'pads': 0, 'keys': 'two'},
+                'swing': 'SWING_99',
+                'bank': '1 200 x'
+            })
+        assert error.value.errors == [
+            'channels.pads: Value 0 out of range 1-16',
+            "channels.keys: Invalid value 'two'",
+            "swing: Invalid value 'SWING_99', expected one of SWING_50, "
+            + 'SWING_55, SWING_57, SWING_59, SWING_61, SWING_64',
+            "bank: Value '200' out of range 0-127, Invalid value 'x'",
+        ]
+        assert isinstance(error.value, ValueError)
+        assert str(error.value).startswith('Invalid configuration:\n- ')
+
+    def test_bank_entries(self) -> None:
+        with pytest.raises(ConfigError) as error:
+            SCHEMA.read({'bank': '1 2'})
+        assert error.value.errors == [
+            "bank: Expected 3 entries, found 2 in '1 2'"
+        ]
+
+    def test_mapping_expected(self) -> None:
+        with pytest.raises(ConfigError) as error:
+            SCHEMA.read({'channels': 5})
+        assert error.value.errors == ['channels: Expected a mapping, found 5']
+
+    def test_unknown_keys(self, caplog: pytest.LogCaptureFixture) -> None:
+        with caplog.at_level(logging.WARNING):
+            assert SCHEMA.read({'channels': {'dials': 2}, 'tempo': 90})[0] == 1
+        assert 'channels.dials, tempo' in caplog.text
+
+    def test_invalid_schemas(self) -> None:
+        with pytest.raises(ValueError):
+            compile_schema([
+                SchemaField('a', int, 1), SchemaField('a', int, 2)
+            ])
+        with pytest.raises(ValueError):
+            compile_schema([
+                SchemaField('a', int, 1), SchemaField('a.b', int, 2)
+            ])
+        with pytest.raises(ValueError):  # Invalid default
+            compile_schema([SchemaField('a', int, 0, range=(1, 16))])
+
+    def test_enum_choices(self) -> None:
+        assert enum_choices(Joy.axis_x) == ['PBEND', 'CC1', 'CC2']
+        with pytest.raises(ValueError):
+            enum_choices(Arpeggio.taps)
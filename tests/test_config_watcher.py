@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.config_watcher."""
+
+import sys
+from os import fsdecode, makedirs, path, replace
+from shutil import copyfile
+from threading import Timer
+from typing import Iterator, List, Tuple
+
+import pytest
+from click.testing import CliRunner
+
+from akai_mpkmini_mkii_ctrl.__main__ import main
+from akai_mpkmini_mkii_ctrl.config_watcher import FileWatcher, watch_configs
+
+BASE_CONFIG = path.join(
+    path.dirname(__file__), '..', 'resources', 'config-presets',
+    'Base-Config.yaml'
+)
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith('linux'), reason='inotify is Linux only'
+)
+
+
+def _write(file_path: str, content: str) -> None:
+    with open(file_path, 'w') as file_handle:
+        file_handle.write(content)
+
+
+class TestFileWatcher:  # noqa: D101
+
+    def test_no_change(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.yaml')
+        _write(config_file, 'a: 1')
+        with FileWatcher([config_file]) as watcher:
+            assert watcher.wait(timeout=0.05) == set()
+
+    def test_change(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.yaml')
+        _write(config_file, 'a: 1')
+        with FileWatcher([config_file]) as watcher:
+            _write(config_file, 'a: 2')
+            assert watcher.wait(timeout=1, debounce=0.05) == {config_file}
+
+    def test_atomic_save(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.yaml')
+        _write(config_file, 'a: 1')
+        with FileWatcher([config_file]) as watcher:
+            _write(f'{config_file}.swp', 'a: 2')
+            replace(f'{config_file}.swp', config_file)
+            assert watcher.wait(timeout=1, debounce=0.05) == {config_file}
+
+    def test_other_files_ignored(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, 'config.yaml')
+        _write(config_file, 'a: 1')
+        with FileWatcher([config_file]) as watcher:
+            _write(path.join(tmp_path, 'other.yaml'), 'a: 2')
+            assert watcher.wait(timeout=0.1, debounce=0.05) == set()
+
+    def test_undecodable_file_name(self, tmp_path: str) -> None:
+        config_file = path.join(tmp_path, fsdecode(b'config-\xff.yaml'))
+        _write(config_file, 'a: 1')
+        with FileWatcher([config_file]) as watcher:
+            _write(path.join(tmp_path, fsdecode(b'other-\xfe.yaml')), 'a: 2')
+            _write(config_file, 'a: 2')
+            assert watcher.wait(timeout=1, debounce=0.05) == {config_file}
+
+    def test_debounce(self, tmp_path: str) -> None:
+        config_files = [
+            path.join(tmp_path, 'base.yaml'),
+            path.join(tmp_path, 'sub', 'config.yaml')
+        ]
+        _write(config_files[0], 'a: 1')
+        makedirs(path.dirname(config_files[1]))
+        _write(config_files[1], 'a: 1')
+        with FileWatcher(config_files) as watcher:
+            _write(config_files[0], 'a: 2')
+            # Within the quiet period, so it belongs to the same burst
+            timer = Timer(0.05, _write, [config_files[1], 'a: 2'])
+            timer.start()
+            assert watcher.wait(timeout=1, debounce=0.3) == set(config_files)
+            timer.join()
+            assert watcher.wait(timeout=0.05) == set()
+
+    def test_missing_directory(self, tmp_path: str) -> None:
+        with pytest.raises(OSError):
+            FileWatcher([path.join(tmp_path, 'missing', 'config.yaml')])
+
+
+class TestWatchConfigs:  # noqa: D101
+
+    def _watch(self, tmp_path: str) -> Tuple[str, Iterator[bytes]]:
+        base_file = path.join(tmp_path, 'base.yaml')
+        config_file = path.join(tmp_path, 'config.yaml')
+        copyfile(BASE_CONFIG, base_file)
+        _write(config_file, 'midi-channels:\n  pads: 2\n')
+        return config_file, watch_configs(
+            [base_file, config_file], debounce=0.05, timeout=0.3,
+            cache_dir=path.join(tmp_path, 'cache')
+        )
+
+    def test_changed_preset(self, tmp_path: str) -> None:
+        config_file, watcher = self._watch(tmp_path)
+        initial = next(watcher)
+        assert len(initial) == 117
+        _write(config_file, 'midi-channels:\n  pads: 5\n')
+        assert next(watcher) != initial
+
+    def test_unchanged_preset(self, tmp_path: str) -> None:
+        config_file, watcher = self._watch(tmp_path)
+        next(watcher)
+        _write(config_file, '# Pads\nmidi-channels:\n  pads: 2\n')
+        with pytest.raises(StopIteration):
+            next(watcher)
+
+    def test_broken_config(self, tmp_path: str) -> None:
+        config_file, watcher = self._watch(tmp_path)
+        next(watcher)
+        _write(config_file, 'midi-channels: [\n')
+        with pytest.raises(StopIteration):
+            next(watcher)
+
+    @pytest.mark.parametrize('options', [
+        ['push-config-preset', '--verify'],
+        ['push-config-preset', '--if-changed', '--read-back'],
+        ['--socket', 'daemon.sock', 'push-config-preset'],
+    ])
+    def test_unsupported_options(self, options: List[str]) -> None:
+        result = CliRunner().invoke(
+            main, options + ['--watch', '--input-file', BASE_CONFIG]
+        )
+        assert result.exit_code == 2
+        assert '--watch cannot be combined with' in result.output
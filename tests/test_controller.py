@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.controller."""
+
+import asyncio
+from os import path
+from time import sleep
+from typing import List, Tuple
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl.async_controller import push_to_devices
+from akai_mpkmini_mkii_ctrl.emulator import (VirtualMidiIn, VirtualMidiOut,
+                                             VirtualMpkMini)
+from akai_mpkmini_mkii_ctrl.preset_library import write_library
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+TIMEOUT = 1.0
+
+
+def _read(name: str) -> bytes:
+    with open(path.join(FACTORY_PATCHES, name), 'rb') as file_handle:
+        return file_handle.read()
+
+
+class TestBundleFile:  # noqa: D101
+
+    def test_write_and_read_bundle(self, tmp_path: str) -> None:
+        bundle_file = path.join(tmp_path, 'bundle.mk2')
+        binaries = []
+        for preset in ctrl.ALL_PRESETS:
+            data = bytearray(_read('preset1.mk2'))
+            data[7] = preset
+            binaries.append(data)
+        ctrl.write_bundle_file(bundle_file, binaries)
+        assert path.getsize(bundle_file) == 5 * ctrl.PRESET_SIZE
+        configs = ctrl.read_bundle_file(bundle_file)
+        assert [c[0].preset for c in configs] == ctrl.ALL_PRESETS
+
+    @pytest.mark.parametrize('data', [
+        b'', b'\xf0\xf7', bytes(ctrl.PRESET_SIZE)
+    ])
+    def test_read_invalid_bundle(self, tmp_path: str, data: bytes) -> None:
+        bundle_file = path.join(tmp_path, 'bundle.mk2')
+        with open(bundle_file, 'wb') as file_handle:
+            file_handle.write(data)
+        with pytest.raises(ValueError, match='not a valid bundle format'):
+            ctrl.read_bundle_file(bundle_file)
+
+
+class TestController:  # noqa: D101
+
+    def test_push_and_pull_library_preset(self, tmp_path: str) -> None:
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        write_library(library_file, {'kit': _read('preset2.mk2')})
+        device = VirtualMpkMini()
+        # The stored slot (1) is sent as is, other slots are patched
+        for preset in [1, 3]:
+            ctrl.send_binary_to_device(
+                f'{library_file}:kit', preset, device.midi_out
+            )
+            assert device.presets[preset][8:] == _read('preset2.mk2')[8:]
+        ctrl.write_binary_file(
+            f'{library_file}:pulled',
+            ctrl.get_binary_from_device(3, *device.ports(), TIMEOUT)
+        )
+        config = ctrl.read_binary_file(f'{library_file}:pulled')
+        assert config[0].preset == 3
+
+    def test_pull_preset(self) -> None:
+        device = VirtualMpkMini(presets={2: _read('preset2.mk2')})
+        binary = ctrl.get_binary_from_device(2, *device.ports(), TIMEOUT)
+        expected = bytearray(_read('preset2.mk2'))
+        expected[7] = 2
+        assert binary == expected
+
+    def test_pulled_frame_is_patched_in_place(self) -> None:
+        device = VirtualMpkMini()
+        frames: List[bytearray] = []
+        with ctrl.SysexReceiver(device.midi_in, frames.append):
+            ctrl.send_sysex_from_hex_string(
+                'f0 47 00 26 66 00 01 01 f7', device.midi_out
+            )
+        assert isinstance(frames[0], bytearray)
+        assert frames[0][4] == 0x67
+        assert ctrl.patch_dump_to_load(frames[0]) is frames[0]
+        assert frames[0][4] == 0x64
+
+    def test_push_preset_file_without_parsing(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        def fail(_: object) -> None:
+            raise AssertionError('Preset was parsed.')
+
+        device = VirtualMpkMini()
+        monkeypatch.setattr(ctrl.MPK_MINI_MK2, 'parse', fail)
+        monkeypatch.setattr(ctrl.MPK_MINI_MK2_COMPILED, 'parse', fail)
+        ctrl.send_binary_to_device(
+            path.join(FACTORY_PATCHES, 'preset3.mk2'), 4, device.midi_out
+        )
+        assert device.presets[4][7] == 4
+        assert device.presets[4][8:] == _read('preset3.mk2')[8:]
+
+    @pytest.mark.parametrize('data', [
+        b'', b'\xf0\xf7', bytes(ctrl.PRESET_SIZE), _read('preset1.mk2')[:-1]
+    ])
+    def test_read_invalid_binary(self, tmp_path: str, data: bytes) -> None:
+        binary_file = path.join(tmp_path, 'preset.mk2')
+        with open(binary_file, 'wb') as file_handle:
+            file_handle.write(data)
+        with pytest.raises(ValueError, match='not a valid binary format'):
+            ctrl.read_binary_data(binary_file)
+
+    def test_push_and_pull_preset(self) -> None:
+        device = VirtualMpkMini(latency=0.001)
+        config = ctrl.read_binary_file(
+            path.join(FACTORY_PATCHES, 'preset3.mk2')
+        )
+        config[0].pchannel = 9
+        ctrl.send_config_to_device(config, 4, device.midi_out)
+        pulled = ctrl.get_config_from_device(4, *device.ports(), TIMEOUT)
+        assert pulled[0].preset == 4
+        assert pulled[0].pchannel == 9
+
+    def test_pull_chunked_reply(self) -> None:
+        device = VirtualMpkMini(chunk_size=16)
+        device.midi_in.deliver([0x90, 60, 100])  # Note before the reply
+        binary = ctrl.get_binary_from_device(1, *device.ports(), TIMEOUT)
+        assert len(binary) == ctrl.PRESET_SIZE
+        assert binary[7] == 1
+
+    def test_pull_dropped_request(self) -> None:
+        device = VirtualMpkMini(drop_rate=1.0)
+        with pytest.raises(TimeoutError):
+            ctrl.get_binary_from_device(0, *device.ports(), 0.05)
+        assert device.dropped == 1
+
+    def test_late_reply_is_discarded(self) -> None:
+        device = VirtualMpkMini(latency=0.15)
+        device.presets[1][8] = 5  # Tell the slots apart
+        with pytest.raises(TimeoutError):
+            ctrl.get_binary_from_device(1, *device.ports(), 0.1)
+        sleep(0.1)  # The reply to slot 1 is queued, not yet received
+        binary = ctrl.get_binary_from_device(2, *device.ports(), TIMEOUT)
+        assert binary[7] == 2 and binary[8] != 5
+
+    def test_late_reply_of_other_slot_is_skipped(self) -> None:
+        device = VirtualMpkMini(latency=0.15)
+        device.presets[1][8] = 5
+        with pytest.raises(TimeoutError):
+            ctrl.get_binary_from_device(1, *device.ports(), 0.1)
+        # The reply to slot 1 arrives while waiting for slot 2
+        binary = ctrl.get_binary_from_device(2, *device.ports(), TIMEOUT)
+        assert binary[7] == 2 and binary[8] != 5
+
+    def test_receive_sysex_after_request(self) -> None:
+        # The caller sends first, the reply is queued before receiving
+        device = VirtualMpkMini()
+        device.midi_in.deliver([0xF0, 0x7E, 0x00, 0x06, 0x01, 0xF7])
+        ctrl.send_sysex_from_hex_string('f0 47 00 26 66 00 01 03 f7',
+                                        device.midi_out)
+        binary = ctrl.receive_sysex(device.midi_in, TIMEOUT)
+        assert binary[4] == 100 and binary[7] == 3
+
+    def test_receive_sysex_timeout(self) -> None:
+        device = VirtualMpkMini()
+        device.midi_in.deliver([0xF0, 0x7E, 0x00, 0x06, 0x01, 0xF7])
+        with pytest.raises(TimeoutError, match='within 0.05s'):
+            ctrl.receive_sysex(device.midi_in, 0.05)
+
+    def test_pull_all_presets(self) -> None:
+        device = VirtualMpkMini(latency=0.001, chunk_size=32)
+        binaries = ctrl.get_binaries_from_device(
+            ctrl.ALL_PRESETS, *device.ports(), TIMEOUT
+        )
+        assert [binary[7] for binary in binaries] == ctrl.ALL_PRESETS
+
+    def test_push_all_presets(self, tmp_path: str) -> None:
+        source, target = VirtualMpkMini(), VirtualMpkMini()
+        source.presets[3][8] = 7  # MIDI channel of pads
+        bundle_file = path.join(tmp_path, 'bundle.mk2')
+        ctrl.write_bundle_file(bundle_file, ctrl.get_binaries_from_device(
+            ctrl.ALL_PRESETS, *source.ports(), TIMEOUT
+        ))
+        ctrl.send_configs_to_device(
+            ctrl.read_bundle_file(bundle_file), target.midi_out
+        )
+        assert target.presets[3][8] == 7
+        assert target.presets[0][8] == source.presets[0][8]
+
+    def test_push_to_devices(
+        self, monkeypatch: pytest.MonkeyPatch, tmp_path: str
+    ) -> None:
+        devices = {port: VirtualMpkMini(latency=0.002) for port in range(3)}
+
+        def ports(
+            port: int, interactive: bool = True
+        ) -> Tuple[VirtualMidiIn, VirtualMidiOut]:
+            if port not in devices:
+                raise OSError(f'Cannot connect to MIDI device {port}.')
+            return devices[port].ports()
+        monkeypatch.setattr(ctrl, 'setup_midi_in_and_out', ports)
+        config = ctrl.read_binary_file(
+            path.join(FACTORY_PATCHES, 'preset4.mk2')
+        )
+        results = asyncio.run(push_to_devices(
+            [0, 1, 2, 3], config, 1, TIMEOUT, verify=True,
+            state_file=path.join(tmp_path, 'state.json')
+        ))
+        assert [result.success for result in results] == [
+            True, True, True, False
+        ]
+        assert results[3].error == 'Cannot connect to MIDI device 3.'
+        assert devices[2].presets[1][27:] == _read('preset4.mk2')[27:]
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.daemon."""
+
+import json
+import socket
+from os import path
+from threading import Event, Thread
+from time import perf_counter, sleep
+from typing import Any, Iterator
+
+import pytest
+from click.testing import CliRunner
+
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl import daemon
+from akai_mpkmini_mkii_ctrl.__main__ import main
+from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_files
+from akai_mpkmini_mkii_ctrl.daemon import Session
+from akai_mpkmini_mkii_ctrl.device_state import (load_device_state,
+                                                 save_device_state)
+from akai_mpkmini_mkii_ctrl.emulator import (DUMP_REQUEST, LOAD_PRESET,
+                                             VirtualMpkMini)
+from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+FIXTURES = path.join(path.dirname(__file__), 'fixtures')
+TIMEOUT = 1.0
+
+
+@pytest.fixture
+def device(monkeypatch: pytest.MonkeyPatch) -> VirtualMpkMini:
+    device = VirtualMpkMini(latency=0.002)
+    monkeypatch.setattr(
+        ctrl, 'setup_midi_in_and_out',
+        lambda port, interactive=True: device.ports()
+    )
+    return device
+
+
+@pytest.fixture
+def state_file(tmp_path: Any) -> str:
+    return str(tmp_path / 'state.json')
+
+
+@pytest.fixture
+def session(device: VirtualMpkMini, state_file: str) -> Session:
+    return Session(0, *device.ports(), TIMEOUT, state_file)
+
+
+@pytest.fixture
+def socket_path(
+    device: VirtualMpkMini, tmp_path: Any, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[str]:
+    # Daemon serving the emulated device until the test is done
+    monkeypatch.setattr(daemon, 'IDLE_TIMEOUT', 0.2)
+    socket_path, stop = str(tmp_path / 'daemon.sock'), Event()
+    server = Thread(
+        target=daemon.serve, args=(0, socket_path, TIMEOUT, stop)
+    )
+    server.start()
+    while server.is_alive() and not path.exists(socket_path):
+        sleep(0.01)
+    yield socket_path
+    stop.set()
+    server.join()
+    assert not path.exists(socket_path)
+
+
+def _request(session: Session, request: Any) -> dict:
+    line = json.dumps(request).encode('utf-8')
+    return json.loads(daemon.handle_request(line, session))
+
+
+def _read(name: str) -> bytes:
+    with open(path.join(FACTORY_PATCHES, name), 'rb') as file_handle:
+        return file_handle.read()
+
+
+def _commands(device: VirtualMpkMini) -> list:
+    return [message[4] for message in device.received]
+
+
+class TestDaemon:  # noqa: D101
+
+    def test_handle_request(self, device: VirtualMpkMini) -> None:
+        session = Session(0, *device.ports(), TIMEOUT)
+        response = _request(session, {'command': 'print-preset', 'preset': 1})
+        assert response['ok']
+        assert 'preset = 1' in response['output']
+
+    @pytest.mark.parametrize('request_data, error', [
+        ([], 'Invalid request: []'),
+        ({'command': 'format-device'}, 'Unknown command: format-device'),
+        ({'command': 'print-preset'}, "'preset'"),
+    ])
+    def test_handle_invalid_request(
+        self, device: VirtualMpkMini, request_data: Any, error: str
+    ) -> None:
+        session = Session(0, *device.ports(), TIMEOUT)
+        assert _request(session, request_data) == {'ok': False, 'error': error}
+
+    def test_handle_unexpected_error(
+        self, device: VirtualMpkMini, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        def broken_dump(message: Any) -> None:
+            raise AssertionError('broken dump')
+        monkeypatch.setattr(ctrl, 'patch_dump_to_load', broken_dump)
+        session = Session(0, *device.ports(), TIMEOUT)
+        response = _request(session, {'command': 'print-preset', 'preset': 0})
+        assert response == {
+            'ok': False, 'error': 'AssertionError: broken dump'
+        }
+
+    def test_handle_timeout(self, device: VirtualMpkMini) -> None:
+        device.drop_rate = 1.0
+        session = Session(0, *device.ports(), 0.01)
+        response = _request(session, {'command': 'print-preset', 'preset': 0})
+        assert not response['ok'] and 'within 0.01s' in response['error']
+
+    def test_pull_preset(
+        self, device: VirtualMpkMini, session: Session, state_file: str,
+        tmp_path: Any
+    ) -> None:
+        output_file = str(tmp_path / 'preset.mk2')
+        response = _request(session, {
+            'command': 'pull-preset', 'preset': 2, 'output_file': output_file
+        })
+        assert response == {
+            'ok': True, 'output': f'Wrote preset 2 to {output_file}'
+        }
+        with open(output_file, 'rb') as file_handle:
+            binary = file_handle.read()
+        assert binary[7] == 2 and binary[8:] == device.presets[2][8:]
+        assert load_device_state(0, 2, state_file) == binary
+
+    def test_push_preset(
+        self, device: VirtualMpkMini, session: Session, state_file: str
+    ) -> None:
+        input_file = path.join(FACTORY_PATCHES, 'preset2.mk2')
+        response = _request(session, {
+            'command': 'push-preset', 'preset': 3, 'input_file': input_file
+        })
+        assert response == {
+            'ok': True, 'output': f'Pushed {input_file} to preset 3'
+        }
+        assert device.presets[3][8:] == _read('preset2.mk2')[8:]
+        assert load_device_state(0, 3, state_file) == device.presets[3]
+
+    def test_push_config_preset(
+        self, device: VirtualMpkMini, session: Session
+    ) -> None:
+        input_files = [path.join(FIXTURES, 'yaml-config.yaml')]
+        response = _request(session, {
+            'command': 'push-config-preset', 'preset': 4,
+            'input_files': input_files
+        })
+        assert response == {
+            'ok': True, 'output': f'Pushed {input_files[0]} to preset 4'
+        }
+        binary = compile_config(load_config_from_files(input_files))
+        assert device.presets[4][7] == 4
+        assert device.presets[4][8:] == binary[8:]
+
+    def test_pull_and_push_all(
+        self, device: VirtualMpkMini, session: Session, state_file: str,
+        tmp_path: Any
+    ) -> None:
+        bundle_file = str(tmp_path / 'bundle.mk2')
+        device.presets[3][8] = 7  # MIDI channel of pads
+        response = _request(session, {
+            'command': 'pull-all', 'output_file': bundle_file
+        })
+        assert response['ok'] and path.getsize(bundle_file) == 5 * 117
+        assert load_device_state(0, 3, state_file) == device.presets[3]
+
+        target = VirtualMpkMini()
+        target_session = Session(
+            1, *target.ports(), TIMEOUT, state_file
+        )
+        response = _request(target_session, {
+            'command': 'push-all', 'input_file': bundle_file
+        })
+        assert response == {
+            'ok': True,
+            'output': f'Pushed presets [0, 1, 2, 3, 4] from {bundle_file}'
+        }
+        assert target.presets == device.presets
+        assert load_device_state(1, 3, state_file) == target.presets[3]
+
+    @pytest.mark.parametrize('read_back, commands', [
+        (False, []),
+        (True, [DUMP_REQUEST]),
+    ])
+    def test_push_unchanged_preset(
+        self, device: VirtualMpkMini, session: Session, state_file: str,
+        tmp_path: Any, read_back: bool, commands: list
+    ) -> None:
+        input_file = str(tmp_path / 'preset.mk2')
+        ctrl.write_binary_file(input_file, device.presets[1])
+        # The state cache is only asked without read-back
+        state = device.presets[1] if not read_back else device.presets[2]
+        save_device_state({0: state}, 1, state_file)
+        response = _request(session, {
+            'command': 'push-preset', 'preset': 1, 'input_file': input_file,
+            'if_changed': True, 'read_back': read_back
+        })
+        assert response == {
+            'ok': True, 'output': 'Preset 1 is unchanged, nothing pushed'
+        }
+        assert _commands(device) == commands
+
+    @pytest.mark.parametrize('state, commands', [
+        (None, [DUMP_REQUEST, LOAD_PRESET]),
+        (bytes(117), [LOAD_PRESET]),  # Corrupt, so pushed in full
+    ])
+    def test_push_changed_preset(
+        self, device: VirtualMpkMini, session: Session, state_file: str,
+        state: Any, commands: list
+    ) -> None:
+        if state:
+            save_device_state({0: state}, 1, state_file)
+        input_file = path.join(FACTORY_PATCHES, 'preset2.mk2')
+        response = _request(session, {
+            'command': 'push-preset', 'preset': 1, 'input_file': input_file,
+            'if_changed': True
+        })
+        assert response['ok'] and 'Pushed' in response['output']
+        assert _commands(device) == commands
+        assert device.presets[1][8:] == _read('preset2.mk2')[8:]
+
+    def test_push_and_verify(
+        self, device: VirtualMpkMini, session: Session
+    ) -> None:
+        response = _request(session, {
+            'command': 'push-preset', 'preset': 0, 'verify': True,
+            'input_file': path.join(FACTORY_PATCHES, 'preset3.mk2')
+        })
+        assert response['ok']
+        assert _commands(device) == [LOAD_PRESET, DUMP_REQUEST]
+
+    def test_push_and_verify_mismatch(
+        self, device: VirtualMpkMini, session: Session, state_file: str,
+        monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # The device misses the push
+        monkeypatch.setattr(ctrl, 'send_config_to_device', lambda *args: None)
+        response = _request(session, {
+            'command': 'push-preset', 'preset': 0, 'verify': True,
+            'input_file': path.join(FACTORY_PATCHES, 'preset3.mk2')
+        })
+        assert response == {
+            'ok': False, 'error': 'Preset on device differs after push.'
+        }
+        assert load_device_state(0, 0, state_file) is None
+
+    @pytest.mark.parametrize('request_data, error', [
+        ({'command': 'push-preset', 'preset': 0}, "'input_file'"),
+        ({'command': 'push-preset', 'preset': 0, 'input_file': 'missing.mk2'},
+         "[Errno 2] No such file or directory: 'missing.mk2'"),
+        ({'command': 'pull-all'}, "'output_file'"),
+    ])
+    def test_handle_request_error(
+        self, session: Session, request_data: Any, error: str
+    ) -> None:
+        assert _request(session, request_data) == {'ok': False, 'error': error}
+
+    def test_serve(self, device: VirtualMpkMini, socket_path: str) -> None:
+        for preset in (1, 2):
+            response = daemon.send_command(
+                socket_path, {'command': 'print-preset', 'preset': preset}
+            )
+            assert response['ok']
+            assert f'preset = {preset}' in response['output']
+        assert len(device.received) == 2
+
+    def test_forward(self, device: VirtualMpkMini, socket_path: str) -> None:
+        result = CliRunner().invoke(
+            main, ['--socket', socket_path, '--preset', '3', 'print-preset']
+        )
+        assert result.exit_code == 0
+        assert len(device.received) == 1 and device.received[0][7] == 3
+
+    def test_forward_without_response(self, tmp_path: Any) -> None:
+        # A daemon that dies while handling the request
+        socket_path = str(tmp_path / 'daemon.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(socket_path)
+            server.listen(1)
+
+            def close_connection() -> None:
+                connection, _ = server.accept()
+                connection.recv(1024)
+                connection.close()
+            Thread(target=close_connection).start()
+            result = CliRunner().invoke(
+                main, ['--socket', socket_path, 'print-preset']
+            )
+        assert result.exit_code == 1
+        assert isinstance(result.exception, SystemExit)
+
+    def test_serve_drops_idle_client(
+        self, device: VirtualMpkMini, socket_path: str
+    ) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+            idle.connect(socket_path)
+            start = perf_counter()
+            response = daemon.send_command(
+                socket_path, {'command': 'print-preset', 'preset': 1}
+            )
+            assert response['ok'] and perf_counter() - start < TIMEOUT
+            idle.settimeout(TIMEOUT)
+            assert idle.recv(1) == b''
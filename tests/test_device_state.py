@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.device_state."""
+
+import json
+from os import path
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl.device_state import (diff_presets,
+                                                 load_device_state,
+                                                 save_device_state)
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+
+
+def _read(name: str) -> bytes:
+    with open(path.join(FACTORY_PATCHES, name), 'rb') as file_handle:
+        return file_handle.read()
+
+
+class TestDeviceState:  # noqa: D101
+
+    def test_diff_identical_presets(self) -> None:
+        assert diff_presets(_read('preset1.mk2'), _read('preset1.mk2')) == []
+
+    def test_diff_ignores_preset_slot(self) -> None:
+        data = bytearray(_read('preset1.mk2'))
+        data[7] = 4
+        assert diff_presets(_read('preset1.mk2'), data) == []
+
+    def test_diff_reports_changed_fields(self) -> None:
+        data = bytearray(_read('preset1.mk2'))
+        data[8] = 5  # MIDI channel of pads
+        data[35] = 60  # Note of the third pad in bank A
+        assert diff_presets(_read('preset1.mk2'), data) == [
+            'pchannel: 0 -> 5',
+            'pads[0][2].note: 46 -> 60',
+        ]
+
+    def test_load_unknown_device_state(self, tmp_path: str) -> None:
+        state_file = path.join(tmp_path, 'state.json')
+        assert load_device_state(1, 0, state_file) is None
+
+    def test_save_and_load_device_state(self, tmp_path: str) -> None:
+        state_file = path.join(tmp_path, 'cache', 'state.json')
+        preset1, preset2 = _read('preset1.mk2'), _read('preset2.mk2')
+        save_device_state({1: preset1, 2: preset2}, 3, state_file)
+        save_device_state({2: preset1}, 4, state_file)
+        assert load_device_state(1, 3, state_file) == preset1
+        assert load_device_state(2, 3, state_file) == preset2
+        assert load_device_state(2, 4, state_file) == preset1
+        assert load_device_state(1, 4, state_file) is None
+
+    @pytest.mark.parametrize('entry', ['zz', '00' * 10, 42, None])
+    def test_load_broken_device_state(self, tmp_path: str, entry: str) -> None:
+        state_file = path.join(tmp_path, 'state.json')
+        with open(state_file, 'w') as state_handle:
+            json.dump({'1:0': entry}, state_handle)
+        assert load_device_state(1, 0, state_file) is None
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.json_converter."""
+
+from os import path, stat, utime
+from shutil import copyfile
+from typing import Dict, Tuple
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import json_converter
+from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_file
+from akai_mpkmini_mkii_ctrl.config_schema import ConfigError
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2
+
+RESOURCES = path.join(path.dirname(__file__), '..', 'resources')
+BASE_CONFIG = path.join(RESOURCES, 'config-presets', 'Base-Config.yaml')
+FACTORY_PATCH = path.join(RESOURCES, 'factory-patches', 'preset1.mk2')
+
+
+def _template_cache() -> Dict[str, Tuple[int, bytes]]:
+    return getattr(json_converter, '__TEMPLATE_CACHE')
+
+
+class TestJsonConverter:  # noqa: D101
+
+    def test_json_to_binary(self) -> None:
+        data = json_converter.json_to_binary(
+            load_config_from_file(BASE_CONFIG)
+        )
+        assert len(data) == 117
+        preset = MPK_MINI_MK2.parse(data)
+        assert preset[0].pchannel == 1
+        assert preset[0].tempo == 140
+        assert preset[0].axis_x == 'CC2'
+        assert preset[1][0][0].note == 49
+        assert preset[1][1][7].prog == 15
+        assert [dial.midicc for dial in preset[2][0]] == list(range(4, 12))
+
+    def test_json_to_binary_is_repeatable(self) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        first = json_converter.json_to_binary(config)
+        json_converter.json_to_binary({'arpeggiator': {'tempo': 90}})
+        assert json_converter.json_to_binary(config) == first
+
+    def test_template_is_cached_until_modified(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        template = path.join(tmp_path, 'preset.mk2')
+        copyfile(json_converter.TEMPLATE, template)
+        monkeypatch.setattr(json_converter, 'TEMPLATE', template)
+        json_converter.json_to_binary({})
+        mtime, data = _template_cache()[template]
+        assert mtime == stat(template).st_mtime_ns
+
+        # Same mtime: The cached template is reused
+        copyfile(FACTORY_PATCH, template)
+        utime(template, ns=(mtime, mtime))
+        json_converter.json_to_binary({})
+        assert _template_cache()[template][1] == data
+
+        # New mtime: The template is read again
+        utime(template, ns=(mtime + 10**9, mtime + 10**9))
+        json_converter.json_to_binary({})
+        with open(FACTORY_PATCH, 'rb') as factory_patch:
+            assert _template_cache()[template][1] == factory_patch.read()
+
+    def test_json_to_binary_reports_all_errors(self) -> None:
+        with pytest.raises(ConfigError) as error:
+            json_converter.json_to_binary({
+                'arpeggiator': {'tempo': 500, 'mode': 'SIDEWAYS'},
+                'pads': {'bank-b': {'trigger': 'T T X M M M M M'}}
+            })
+        assert [e.split(':')[0] for e in error.value.errors] == [
+            'arpeggiator.tempo', 'arpeggiator.mode', 'pads.bank-b.trigger'
+        ]
+
+    def test_json_to_binary_zero_values(self) -> None:
+        # Zero is a value, only missing or empty values take the default
+        data = json_converter.json_to_binary({'joystick': {'x-up': 0}})
+        assert MPK_MINI_MK2.parse(data)[0].x_up == 0
+
+    @pytest.mark.parametrize('value', ['ON', 'OFF'])
+    def test_unquoted_on_off(self, tmp_path: str, value: str) -> None:
+        # Read as a boolean from YAML
+        config_file = path.join(tmp_path, 'config.yaml')
+        with open(config_file, 'w') as file_handle:
+            file_handle.write(f'arpeggiator:\n  enable: {value}\n')
+        config = load_config_from_file(config_file)
+        assert isinstance(config['arpeggiator']['enable'], bool)
+        data = json_converter.json_to_binary(config)
+        assert MPK_MINI_MK2.parse(data)[0].enable == value
+
+    @pytest.mark.parametrize('changes', [
+        {'arpeggiator': {'tempo': 90}},
+        {'midi-channels': {'pads': 7}},
+        {'transponse': {'note': 'TRANS_M5', 'octave': 'OCT_P2'}},
+        {'pads': {'bank-a': {'notes': 'C1 D1 - - E1 F1 G1 A1'}}},
+        {'pads': {'bank-b': {'prog': '1 2 3 4 5 6 7 8',
+                             'trigger': 'T M T M T M T M'}}},
+        {'dials': {'cc': '1 2 3 4 5 6 7 8', 'max-value': 100}},
+        {'joystick': None},
+        {'arpeggiator': {'enable': 'ON'}, 'unknown': {'key': 1}},
+    ])
+    def test_update_binary(self, changes: dict) -> None:
+        previous = load_config_from_file(BASE_CONFIG)
+        config = load_config_from_file(BASE_CONFIG)
+        for key, value in changes.items():
+            if value is None:  # Removed, i.e., the defaults apply
+                del config[key]
+            elif isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+        data = bytearray(json_converter.json_to_binary(previous))
+        json_converter.update_binary(data, previous, config)
+        assert data == bytes(json_converter.json_to_binary(config))
+
+    def test_update_binary_ranges(self) -> None:
+        previous = load_config_from_file(BASE_CONFIG)
+        config = load_config_from_file(BASE_CONFIG)
+        config['arpeggiator']['tempo'] = 90
+        config['pads']['bank-b']['notes'] = 'C1 D1 E1 F1 G1 A1 B1 C2'
+        data = bytearray(json_converter.json_to_binary(previous))
+        ranges = json_converter.update_binary(data, previous, config)
+        assert ranges == [(18, 20)] + [
+            (59 + pad * 4, 60 + pad * 4) for pad in range(8)
+        ]
+
+    def test_update_binary_unchanged(self) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        data = bytearray(json_converter.json_to_binary(config))
+        assert json_converter.update_binary(data, config, config) == []
+
+    def test_changed_config_paths(self) -> None:
+        assert json_converter.changed_config_paths(
+            {'a': {'b': 1, 'c': 2}, 'd': 3, 'e': {'f': 4}},
+            {'a': {'b': 1, 'c': 5}, 'e': 6, 'g': 7}
+        ) == {'a.c', 'd', 'e', 'g'}
+        assert json_converter.changed_config_paths(None, {'a': 1}) == {'a'}
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.latency."""
+
+from typing import List
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import latency
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+from akai_mpkmini_mkii_ctrl.latency import RoundTrips
+
+
+class TestLatency:  # noqa: D101
+
+    def test_measure_round_trips(self) -> None:
+        device = VirtualMpkMini(latency=0.002)
+        round_trips = latency.measure_round_trips(
+            1, *device.ports(), cycles=5, timeout=1.0, warmup=2
+        )
+        assert len(round_trips.samples) == 5
+        assert round_trips.timeouts == 0
+        assert min(round_trips.samples) >= 0.002
+        assert len(device.received) == 7
+
+    def test_measure_dropped_round_trips(self) -> None:
+        device = VirtualMpkMini(drop_rate=1.0)
+        round_trips = latency.measure_round_trips(
+            0, *device.ports(), cycles=3, timeout=0.01, warmup=1
+        )
+        assert round_trips == RoundTrips([], 3)
+        statistics = latency.latency_statistics(round_trips)
+        assert statistics == {'cycles': 3, 'timeouts': 3}
+        assert latency.format_statistics(statistics) == (
+            '3 round trips, 3 timed out'
+        )
+
+    def test_measure_late_round_trip(self) -> None:
+        # The first reply arrives after its request timed out and before
+        # the reply to the second request
+        device = VirtualMpkMini()
+        latencies = iter([0.25, 0.1, 0.01])
+        send_message = device.midi_out.send_message
+
+        def send_with_latency(message: List[int]) -> None:
+            device.latency = next(latencies)
+            send_message(message)
+        device.midi_out.send_message = send_with_latency  # type: ignore
+        round_trips = latency.measure_round_trips(
+            0, *device.ports(), cycles=3, timeout=0.2, warmup=0
+        )
+        assert round_trips.timeouts == 1
+        assert len(round_trips.samples) == 2
+        assert round_trips.samples[0] >= 0.1
+        assert round_trips.samples[1] < 0.05
+
+    @pytest.mark.parametrize('percent, expected', [
+        (0, 1), (50, 50), (95, 95), (99, 99), (100, 100)
+    ])
+    def test_percentile(self, percent: float, expected: int) -> None:
+        assert latency.percentile(range(1, 101), percent) == expected
+
+    def test_latency_statistics(self) -> None:
+        samples = [0.001 * value for value in [4, 1, 2, 3, 10]]
+        statistics = latency.latency_statistics(RoundTrips(samples, 1))
+        assert statistics['cycles'] == 6
+        assert statistics['min_ms'] == pytest.approx(1)
+        assert statistics['median_ms'] == pytest.approx(3)
+        assert statistics['p99_ms'] == pytest.approx(10)
+        assert statistics['mean_ms'] == pytest.approx(4)
+        histogram = statistics['histogram']
+        assert len(histogram) == latency.HISTOGRAM_BINS
+        assert [entry['count'] for entry in histogram] == [
+            1, 1, 1, 1, 0, 0, 0, 0, 0, 1
+        ]
+        assert 'median=3.000' in latency.format_statistics(statistics)
+
+    def test_histogram_of_equal_samples(self) -> None:
+        assert latency.latency_histogram([0.002] * 3) == [
+            {'from_ms': 2.0, 'to_ms': 2.0, 'count': 3}
+        ]
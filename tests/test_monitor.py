@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.monitor."""
+
+from threading import Event, Thread
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import monitor
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+from akai_mpkmini_mkii_ctrl.json_converter import TEMPLATE
+from akai_mpkmini_mkii_ctrl.monitor import (EventRing, EventStatistics,
+                                            decode_event, event_names,
+                                            monitor_events)
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+
+Events = List[Tuple[int, int, int, int]]
+
+
+def _drain(ring: EventRing) -> Events:
+    events: Events = []
+    ring.drain(lambda *event: events.append(event))
+    return events
+
+
+class TestEventRing:  # noqa: D101
+
+    def test_push_and_drain(self) -> None:
+        ring = EventRing(4)
+        ring.push(1, [0x90, 60, 100])
+        ring.push(2, [0xF8])
+        ring.push(3, [0xC0, 5])
+        assert len(ring) == 3
+        assert _drain(ring) == [
+            (1, 0x90, 60, 100), (2, 0xF8, 0, 0), (3, 0xC0, 5, 0)
+        ]
+        assert len(ring) == 0 and _drain(ring) == []
+
+    def test_wrap_around(self) -> None:
+        ring = EventRing(3)
+        for timestamp in range(10):
+            ring.push(timestamp, [0xB0, 1, timestamp])
+            assert _drain(ring) == [(timestamp, 0xB0, 1, timestamp)]
+        assert ring.dropped == 0
+
+    def test_full_ring_drops(self) -> None:
+        ring = EventRing(2)
+        assert [ring.push(t, [0xF8]) for t in range(4)] == [
+            True, True, False, False
+        ]
+        assert ring.dropped == 2
+        assert [event[0] for event in _drain(ring)] == [0, 1]
+
+    def test_sysex_is_ignored(self) -> None:
+        ring = EventRing()
+        ring.on_message(([0xF0, 0x47, 0xF7], 0.0), None)
+        ring.on_message(([], 0.0), None)
+        ring.on_message(([0x80, 60, 0], 0.0), None)
+        assert [event[1] for event in _drain(ring)] == [0x80]
+
+
+class TestEventStatistics:  # noqa: D101
+
+    def test_report(self) -> None:
+        statistics = EventStatistics()
+        for timestamp_ms in [0, 10, 20, 40]:
+            statistics.add(timestamp_ms * 10**6)
+        report = statistics.report(0.5, 3)
+        assert report['events'] == 4
+        assert report['events_per_second'] == 8
+        assert report['mean_interval_ms'] == pytest.approx(40 / 3)
+        assert report['max_interval_ms'] == 20
+        assert report['jitter_ms'] == pytest.approx(4.714, abs=0.001)
+        assert report['dropped'] == 3
+
+    def test_empty_report(self) -> None:
+        report = EventStatistics().report(1.0, 0)
+        assert report['events'] == 0 and report['jitter_ms'] == 0
+
+
+class TestDecodeEvent:  # noqa: D101
+
+    @pytest.mark.parametrize('event, expected', [
+        ((0x90, 44, 100), 'Pad A1      ch 1  note on G#1 velocity 100'),
+        ((0x90, 44, 0), 'Pad A1      ch 1  note off G#1 velocity 0'),
+        ((0x91, 60, 90), 'Key         ch 2  note on C3 velocity 90'),
+        ((0xB0, 3, 64), 'Dial K3     ch 1  cc 3 value 64'),
+        ((0xB0, 20, 127), 'Pad A1      ch 1  cc 20 value 127'),
+        ((0xE0, 0, 0x40), 'Joystick X  ch 1  pitch bend 0'),
+        ((0xC5, 9, 0), '-           ch 6  program 10'),
+        ((0xF8, 0, 0), 'clock'),
+        ((0xF2, 0, 0), 'system f2'),
+    ])
+    def test_decode_event(
+        self, event: Tuple[int, int, int], expected: str
+    ) -> None:
+        names = event_names(MPK_MINI_MK2_COMPILED.parse_file(TEMPLATE))
+        assert decode_event(*event, names) == expected
+
+    def test_decode_without_names(self) -> None:
+        assert decode_event(0xB0, 3, 64) == '-           ch 1  cc 3 value 64'
+
+
+class TestMonitorEvents:  # noqa: D101
+
+    def test_monitor_events(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(monitor, 'POLL_INTERVAL', 0.001)
+        device = VirtualMpkMini()
+        events: Events = []
+        reports: List[Dict[str, Any]] = []
+        stop = Event()
+
+        def play() -> None:
+            stop.wait(0.05)  # Until the monitor is listening
+            for note in range(50):
+                device.midi_in.deliver([0x90, note, 100])
+            device.midi_in.deliver([0xF0, 0x47, 0xF7])
+            stop.wait(0.05)
+            stop.set()
+
+        player = Thread(target=play)
+        player.start()
+        ring = monitor_events(
+            device.midi_in, lambda *event: events.append(event),
+            reports.append, report_interval=0.01, stop=stop
+        )
+        player.join()
+        assert [event[2] for event in events] == list(range(50))
+        assert sum(report['events'] for report in reports) <= 50
+        assert ring.dropped == 0
+        # The callback is released again
+        device.midi_in.deliver([0x90, 1, 1])
+        assert device.midi_in.get_message() is not None
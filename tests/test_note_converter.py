@@ -175,3 +175,27 @@ class TestNoteConverter:  # noqa: D101
     def test_decimal_to_note_exceptions(self, decimal: int) -> None:
         with pytest.raises(ValueError, match=f'Decimal "{decimal}" unknown'):
             note_converter.decimal_to_note(decimal)
+
+    @pytest.mark.parametrize('note, expected_decimal', [
+        ('Db-2', 1), ('db3', 61), ('Eb3', 63), ('Gb8', 126), ('Bb-1', 22),
+        ('C+1', 36), ('C01', 36),
+    ])
+    def test_note_to_decimal_aliases(
+        self, note: str, expected_decimal: int
+    ) -> None:
+        assert note_converter.note_to_decimal(note) == expected_decimal
+
+    def test_bank_to_decimals(self) -> None:
+        assert note_converter.bank_to_decimals('C1 D1 - e1  Db1 c#1') == [
+            36, 38, 0, 40, 37, 37
+        ]
+
+    def test_bank_to_decimals_exceptions(self) -> None:
+        with pytest.raises(ValueError, match='Note "H1" unknown'):
+            note_converter.bank_to_decimals('C1 H1')
+
+    def test_decimals_to_bank(self) -> None:
+        bank = note_converter.decimals_to_bank([36, 38, 0, 127])
+        assert bank == 'C1 D1 C-2 G8'
+        with pytest.raises(ValueError, match='Decimal "128" unknown'):
+            note_converter.decimals_to_bank([36, 128])
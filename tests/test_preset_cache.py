@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.preset_cache."""
+
+import ast
+from os import listdir, path, utime
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import json_converter, preset_cache
+from akai_mpkmini_mkii_ctrl.config_reader import load_config_from_file
+from akai_mpkmini_mkii_ctrl.preset_cache import compile_config, config_key
+
+BASE_CONFIG = path.join(
+    path.dirname(__file__), '..', 'resources', 'config-presets',
+    'Base-Config.yaml'
+)
+
+
+def _fail(_: dict) -> None:
+    raise AssertionError('Preset was compiled again.')
+
+
+class TestPresetCache:  # noqa: D101
+
+    def test_compile_config(self, tmp_path: str) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        data = compile_config(config, tmp_path)
+        assert data == bytes(json_converter.json_to_binary(config))
+        assert listdir(tmp_path) == [f'{config_key(config)}.mk2']
+
+    def test_compile_cached_config(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        data = compile_config(config, tmp_path)
+        monkeypatch.setattr(json_converter, 'json_to_binary', _fail)
+        assert compile_config(config, tmp_path) == data
+
+    def test_unknown_keys_of_cached_config(
+        self, tmp_path: str, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        config['unknown'] = {'key': 1}
+        for _ in range(2):  # Converted, then taken from the cache
+            caplog.clear()
+            compile_config(config, tmp_path)
+            assert 'keys ignored: unknown' in caplog.text
+
+    def test_converter_files(self) -> None:
+        # All package modules the converter depends on are fingerprinted,
+        # except for profiling that does not change its output
+        package = path.dirname(json_converter.__file__)
+        converter_files = set(getattr(preset_cache, '__CONVERTER_FILES'))
+        pending = [json_converter.__file__]
+        while pending:
+            source = pending.pop()
+            assert source in converter_files
+            with open(source) as source_handle:
+                tree = ast.parse(source_handle.read())
+            pending.extend([
+                path.join(package, f'{node.module.split(".")[1]}.py')
+                for node in ast.walk(tree)
+                if isinstance(node, ast.ImportFrom) and node.module
+                and node.module.startswith('akai_mpkmini_mkii_ctrl.')
+                and node.module != 'akai_mpkmini_mkii_ctrl.profiling'
+            ])
+
+    def test_key_of_equal_configs(self) -> None:
+        assert config_key({'a': 1, 'b': {'c': 2}}) == config_key(
+            {'b': {'c': 2}, 'a': 1}
+        )
+        assert config_key({'a': 1}) != config_key({'a': 2})
+
+    def test_key_changes_with_converter(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        template = path.join(tmp_path, 'preset.mk2')
+        with open(template, 'wb') as template_handle:
+            template_handle.write(b'\x00')
+        monkeypatch.setattr(preset_cache, '__CONVERTER_FILES', [template])
+        key = config_key({})
+        with open(template, 'wb') as template_handle:
+            template_handle.write(b'\x01\x02')
+        assert config_key({}) != key
+
+    def test_broken_entry_is_ignored(self, tmp_path: str) -> None:
+        config = load_config_from_file(BASE_CONFIG)
+        entry = path.join(tmp_path, f'{config_key(config)}.mk2')
+        with open(entry, 'wb') as entry_handle:
+            entry_handle.write(b'\xf0\xf7')
+        data = compile_config(config, tmp_path)
+        assert len(data) == preset_cache.PRESET_SIZE
+        with open(entry, 'rb') as entry_handle:
+            assert entry_handle.read() == data
+
+    def test_least_recently_used_are_evicted(self, tmp_path: str) -> None:
+        configs = [
+            {'arpeggiator': {'tempo': tempo}} for tempo in range(100, 104)
+        ]
+        for index, config in enumerate(configs[:3]):
+            compile_config(config, tmp_path, max_entries=3)
+            entry = path.join(tmp_path, f'{config_key(config)}.mk2')
+            utime(entry, ns=(index, index))
+        compile_config(configs[0], tmp_path, max_entries=3)  # Use again
+        compile_config(configs[3], tmp_path, max_entries=3)
+        assert sorted(listdir(tmp_path)) == sorted([
+            f'{config_key(config)}.mk2'
+            for config in [configs[0], configs[2], configs[3]]
+        ])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.preset_library."""
+
+from glob import glob
+from os import path
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl.preset_library import (HEADER, PresetLibrary,
+                                                   pack_library, read_library,
+                                                   split_reference,
+                                                   update_library,
+                                                   write_library)
+
+FACTORY_PATCHES = path.join(
+    path.dirname(__file__), '..', 'resources', 'factory-patches'
+)
+
+
+def _read(name: str) -> bytes:
+    with open(path.join(FACTORY_PATCHES, name), 'rb') as file_handle:
+        return file_handle.read()
+
+
+class TestPresetLibrary:  # noqa: D101
+
+    def test_write_and_open_library(self, tmp_path: str) -> None:
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        write_library(library_file, {
+            'one': _read('preset1.mk2'), 'drums/two': _read('preset2.mk2')
+        }, {'author': 'tester'})
+        with PresetLibrary(library_file) as library:
+            assert len(library) == 2
+            assert library.names() == ['one', 'drums/two']
+            assert 'drums/two' in library and 'three' not in library
+            assert library.metadata == {'author': 'tester'}
+            with library.get('drums/two') as preset:
+                assert isinstance(preset, memoryview)
+                assert preset == _read('preset2.mk2')
+            with pytest.raises(ValueError, match='"three" not found'):
+                library.get('three')
+
+    def test_update_library(self, tmp_path: str) -> None:
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        update_library(library_file, {'one': _read('preset1.mk2')})
+        update_library(library_file, {
+            'one': _read('preset3.mk2'), 'two': _read('preset2.mk2')
+        }, {'version': '2'})
+        presets, metadata = read_library(library_file)
+        assert presets == {
+            'one': _read('preset3.mk2'), 'two': _read('preset2.mk2')
+        }
+        assert metadata == {'version': '2'}
+
+    def test_pack_library(self, tmp_path: str) -> None:
+        library_file = path.join(tmp_path, 'factory.mk2lib')
+        preset_files = sorted(glob(path.join(FACTORY_PATCHES, '*.mk2')))
+        assert pack_library(preset_files, library_file) == [
+            'preset1', 'preset2', 'preset3', 'preset4'
+        ]
+        assert read_library(library_file)[0]['preset4'] == _read(
+            'preset4.mk2'
+        )
+
+    @pytest.mark.parametrize('preset', [b'', b'\xf0\xf7', bytes(117)])
+    def test_write_invalid_preset(self, tmp_path: str, preset: bytes) -> None:
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        with pytest.raises(ValueError, match='not a valid binary format'):
+            write_library(library_file, {'broken': preset})
+        assert not path.exists(library_file)
+
+    @pytest.mark.parametrize('data', [
+        b'', b'MK2LIB', HEADER.pack(b'MK2LIB', 1, 1, 20, 2) + b'{}',
+        HEADER.pack(b'NOTLIB', 1, 0, 20, 0), _read('preset1.mk2')
+    ])
+    def test_open_invalid_library(self, tmp_path: str, data: bytes) -> None:
+        library_file = path.join(tmp_path, 'presets.mk2lib')
+        with open(library_file, 'wb') as library_handle:
+            library_handle.write(data)
+        with pytest.raises(ValueError, match='not a valid library format'):
+            PresetLibrary(library_file)
+
+    @pytest.mark.parametrize('reference, expected', [
+        ('presets.mk2lib:one', ('presets.mk2lib', 'one')),
+        ('/store/presets.mk2lib:drums/kit:1', (
+            '/store/presets.mk2lib', 'drums/kit:1'
+        )),
+        ('preset1.mk2', ('preset1.mk2', None)),
+        ('presets.mk2lib', ('presets.mk2lib', None)),
+        ('C:/presets/preset1.mk2', ('C:/presets/preset1.mk2', None)),
+    ])
+    def test_split_reference(self, reference: str, expected: tuple) -> None:
+        assert split_reference(reference) == expected
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.profiling."""
+
+import threading
+from typing import Generator
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import profiling
+
+
+@pytest.fixture(autouse=True)
+def _disable_profiling() -> Generator[None, None, None]:
+    yield
+    profiling.disable_profiling()
+
+
+class TestProfiling:  # noqa: D101
+
+    def test_disabled_spans_are_not_recorded(self) -> None:
+        assert not profiling.profiling_enabled()
+        with profiling.span('phase'):
+            pass
+        assert profiling.span('a') is profiling.span('b')
+        assert profiling.recorded_spans() == []
+        assert profiling.summary() == {}
+
+    def test_spans_are_recorded(self) -> None:
+        profiling.enable_profiling()
+        with profiling.span('outer', file='a.yaml'):
+            for _ in range(2):
+                with profiling.span('inner'):
+                    pass
+        spans = profiling.recorded_spans()
+        assert [s.name for s in spans] == ['inner', 'inner', 'outer']
+        assert spans[2].args == {'file': 'a.yaml'}
+        assert spans[2].duration >= spans[0].duration + spans[1].duration
+        summary = profiling.summary()
+        assert list(summary) == ['outer', 'inner']
+        assert summary['inner']['count'] == 2
+
+    def test_spans_of_threads(self) -> None:
+        profiling.enable_profiling()
+
+        def phase() -> None:
+            with profiling.span('thread'):
+                pass
+        threads = [threading.Thread(target=phase) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        spans = profiling.recorded_spans()
+        assert len(spans) == 3
+        assert [s.name for s in spans] == ['thread'] * 3
+
+    def test_span_of_failed_phase(self) -> None:
+        profiling.enable_profiling()
+        with pytest.raises(ValueError):
+            with profiling.span('failing'):
+                raise ValueError
+        assert [s.name for s in profiling.recorded_spans()] == ['failing']
+
+    def test_chrome_trace(self) -> None:
+        profiling.enable_profiling()
+        with profiling.span('phase', preset=1):
+            pass
+        events = profiling.chrome_trace()['traceEvents']
+        assert len(events) == 1
+        assert events[0]['ph'] == 'X'
+        assert events[0]['args'] == {'preset': '1'}
+        assert events[0]['ts'] >= 0 and events[0]['dur'] >= 0
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.recorder."""
+
+from os import path
+from threading import Event, Thread
+from time import monotonic_ns
+from typing import List, Sequence, Tuple
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import recorder
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+from akai_mpkmini_mkii_ctrl.recorder import (MAGIC, MORE, RECORD, RECORD_SIZE,
+                                             RecordRing, read_events,
+                                             record_events, replay_events)
+
+SYSEX = [0xF0, 0x47, 0x00, 0x26, 0x66, 0x01, 0xF7]
+MESSAGES = [[0x90, 60, 100], [0xF8], SYSEX, [0xC0, 5], [0x80, 60, 0]]
+
+
+class _Output:
+    # Receiving end of a replay
+
+    def __init__(self) -> None:
+        self.messages: List[Tuple[int, List[int]]] = []
+
+    def send_message(self, message: Sequence[int]) -> None:
+        self.messages.append((monotonic_ns(), list(message)))
+
+
+def _record(
+    file_path: str,
+    messages: List[List[int]],
+    chunk_records: int = recorder.CHUNK_RECORDS
+) -> RecordRing:
+    device = VirtualMpkMini()
+    stop = Event()
+
+    def play() -> None:
+        stop.wait(0.05)  # Until the recorder is listening
+        for message in messages:
+            device.midi_in.deliver(message)
+            stop.wait(0.01)
+        stop.set()
+
+    player = Thread(target=play)
+    player.start()
+    ring = record_events(device.midi_in, file_path, stop,
+                         chunk_records=chunk_records)
+    player.join()
+    return ring
+
+
+class TestRecordRing:  # noqa: D101
+
+    def test_records_per_message(self) -> None:
+        ring = RecordRing(8)
+        assert ring.push(1, [0x90, 60, 100]) and len(ring) == 1
+        assert ring.push(2, [0xF8]) and len(ring) == 2
+        assert ring.push(3, SYSEX) and len(ring) == 5
+        assert ring.messages == 3
+
+    def test_drain_into_chunks(self) -> None:
+        ring = RecordRing(8)
+        ring.push(1, SYSEX)
+        chunk = bytearray(2 * RECORD_SIZE)
+        assert ring.drain(chunk, 0) == 2
+        assert len(ring) == 1
+        assert chunk[8:12] == bytes([0x83, 0xF0, 0x47, 0x00])
+        assert chunk[20:24] == bytes([0x83, 0x26, 0x66, 0x01])
+        assert ring.drain(chunk, 1) == 2
+        assert chunk[20:24] == bytes([0x01, 0xF7, 0x00, 0x00])
+        assert len(ring) == 0
+
+    def test_message_dropped_as_a_whole(self) -> None:
+        ring = RecordRing(3)
+        assert ring.push(1, [0x90, 60, 100])
+        assert not ring.push(2, SYSEX)
+        assert ring.push(3, [0xC0, 5])
+        assert ring.dropped == 1 and ring.messages == 2
+
+    def test_wrap_around(self) -> None:
+        ring = RecordRing(5)
+        chunk = bytearray(8 * RECORD_SIZE)
+        for timestamp in range(10):
+            assert ring.push(timestamp, SYSEX)
+            assert ring.drain(chunk, 0) == 3
+        assert ring.dropped == 0
+
+
+class TestRecorder:  # noqa: D101
+
+    def test_record_and_read(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        ring = _record(file_path, MESSAGES)
+        assert ring.messages == len(MESSAGES) and ring.dropped == 0
+        events = list(read_events(file_path))
+        assert [message for _, message in events] == [[], *MESSAGES]
+        timestamps = [timestamp for timestamp, _ in events]
+        assert timestamps == sorted(timestamps)
+        assert path.getsize(file_path) == len(MAGIC) + 8 * RECORD_SIZE
+
+    def test_small_chunks(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES, chunk_records=2)
+        assert [
+            message for _, message in read_events(file_path, chunk_records=2)
+        ] == [[], *MESSAGES]
+
+    def test_sessions_are_appended(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES[:2])
+        with open(file_path, 'ab') as record_handle:
+            record_handle.write(b'\x01\x02')  # Interrupted write
+        _record(file_path, MESSAGES[2:])
+        assert [message for _, message in read_events(file_path)] == [
+            [], *MESSAGES[:2], [], *MESSAGES[2:]
+        ]
+
+    def test_message_cut_off_by_session(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        with open(file_path, 'wb') as record_handle:
+            record_handle.write(MAGIC + b''.join([
+                RECORD.pack(1, 0, bytes(3)),
+                RECORD.pack(2, 3 | MORE, bytes(SYSEX[:3])),  # Interrupted
+                RECORD.pack(3, 0, bytes(3)),
+                RECORD.pack(4, 3, bytes(MESSAGES[0])),
+            ]))
+        assert list(read_events(file_path)) == [
+            (1, []), (3, []), (4, MESSAGES[0])
+        ]
+
+    def test_not_a_recording(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'preset.mk2')
+        with open(file_path, 'wb') as record_handle:
+            record_handle.write(bytes(SYSEX))
+        with pytest.raises(ValueError, match='not a MIDI recording'):
+            list(read_events(file_path))
+        with pytest.raises(ValueError, match='not a MIDI recording'):
+            record_events(VirtualMpkMini().midi_in, file_path)
+
+
+class TestReplay:  # noqa: D101
+
+    def test_replay_timing(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES)
+        output = _Output()
+        assert replay_events(file_path, output) == len(MESSAGES)
+        recorded = [timestamp for timestamp, _ in read_events(file_path)][1:]
+        replayed = [timestamp for timestamp, _ in output.messages]
+        assert [message for _, message in output.messages] == MESSAGES
+        for index in range(1, len(MESSAGES)):
+            # Accurate to about a millisecond, with room for the host
+            # scheduler and the GIL switch interval (5 ms) on a busy host
+            assert abs(
+                (replayed[index] - replayed[0])
+                - (recorded[index] - recorded[0])
+            ) < 5 * 10**6
+
+    def test_replay_speed(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES)
+        output = _Output()
+        replay_events(file_path, output, speed=2.0)
+        recorded = [timestamp for timestamp, _ in read_events(file_path)]
+        replayed = [timestamp for timestamp, _ in output.messages]
+        assert replayed[-1] - replayed[0] == pytest.approx(
+            (recorded[-1] - recorded[1]) / 2, abs=10**6
+        )
+
+    def test_sessions_are_played_back_to_back(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES[:2])
+        _record(file_path, MESSAGES[2:])
+        output = _Output()
+        start = monotonic_ns()
+        assert replay_events(file_path, output) == len(MESSAGES)
+        # The gap between the sessions is not replayed
+        assert monotonic_ns() - start < 10**9
+
+    def test_stop(self, tmp_path: str) -> None:
+        file_path = path.join(tmp_path, 'session.mpkrec')
+        _record(file_path, MESSAGES)
+        stop = Event()
+        stop.set()
+        output = _Output()
+        assert replay_events(file_path, output, stop=stop) == 0
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+r"""Test suite for akai_mpkmini_mkii_ctrl.router."""
+
+import subprocess
+import sys
+from os import environ, path
+from typing import Any, List, Sequence
+
+import pytest
+
+from akai_mpkmini_mkii_ctrl import router
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+from akai_mpkmini_mkii_ctrl.json_converter import json_to_binary
+from akai_mpkmini_mkii_ctrl.mpkmini_mk2 import MPK_MINI_MK2_COMPILED
+from akai_mpkmini_mkii_ctrl.preset_cache import compile_config
+from akai_mpkmini_mkii_ctrl.router import (IDENTITY, Router, RouteTable,
+                                           compile_route, load_route, routing,
+                                           velocity_curve)
+
+BASE_CONFIG = path.join(
+    path.dirname(__file__), '..', 'resources', 'config-presets',
+    'Base-Config.yaml'
+)
+TIMEOUT = 5.0
+SOURCE = {
+    'midi-channels': {'pads': 10, 'keys': 1},
+    'pads': {
+        'bank-a': {
+            'notes': 'C1 C#1 D1 D#1 E1 F1 F#1 G1',
+            'prog': '1 2 3 4 5 6 7 8'
+        },
+        'bank-b': {
+            'notes': 'G#1 A1 A#1 B1 C2 C#2 D2 D#2',
+            'cc': '28 29 30 31 32 33 34 35',
+            'prog': '9 10 11 12 13 14 15 16'
+        }
+    },
+    'joystick': {'axis-x': 'CC2', 'x-up': 1, 'x-down': 2}
+}
+TARGET = {
+    'midi-channels': {'pads': 11, 'keys': 3},
+    'pads': {
+        'bank-a': {
+            'notes': 'C3 D3 E3 F3 G3 A3 B3 C4',
+            'cc': '40 41 42 43 44 45 46 47',
+            'prog': '101 102 103 104 105 106 107 108'
+        },
+        'bank-b': {'notes': 'C5 D5 E5 F5 G5 A5 B5 C6'}
+    },
+    'dials': {
+        'cc': '70 71 72 73 74 75 76 77', 'min-value': 0, 'max-value': 63
+    },
+    'joystick': {'axis-x': 'CC2', 'x-up': 16, 'x-down': 17},
+    'velocity': {'curve': 'FIXED', 'max': 100}
+}
+
+
+def _preset(config: dict) -> Any:
+    return MPK_MINI_MK2_COMPILED.parse(bytes(json_to_binary(config)))
+
+
+def _route(target: dict = TARGET) -> RouteTable:
+    return compile_route(
+        _preset(SOURCE), _preset(target), ('FIXED', 1, 100), 'target'
+    )
+
+
+def _transform(table: RouteTable, message: List[int]) -> List[int]:
+    table.transform(message)
+    return message
+
+
+class _Output:
+    # Receiving end of a route
+
+    def __init__(self) -> None:
+        self.messages: List[List[int]] = []
+
+    def send_message(self, message: Sequence[int]) -> None:
+        self.messages.append(list(message))
+
+
+class TestRouteTable:  # noqa: D101
+
+    @pytest.mark.parametrize('message', [
+        [0x90, 60, 100], [0x80, 60, 0], [0xB5, 7, 64], [0xC0, 3],
+        [0xE1, 0, 64], [0xD2, 90], [0xF8], [0xF2, 1, 2]
+    ])
+    def test_identity(self, message: List[int]) -> None:
+        assert _transform(RouteTable(), list(message)) == message
+
+
+class TestCompileRoute:  # noqa: D101
+
+    def test_pad_notes_per_bank(self) -> None:
+        table = _route()
+        assert _transform(table, [0x99, 36, 80]) == [0x9A, 60, 100]
+        assert _transform(table, [0x89, 37, 0]) == [0x8A, 62, 0]
+        assert _transform(table, [0x99, 44, 80]) == [0x9A, 84, 100]
+
+    def test_keys(self) -> None:
+        table = _route()
+        # Keys are moved to the target channel with the velocity curve
+        assert _transform(table, [0x90, 60, 1]) == [0x92, 60, 100]
+        assert _transform(table, [0x90, 60, 0]) == [0x92, 60, 0]
+        assert _transform(table, [0xE0, 0, 64]) == [0xE2, 0, 64]
+        # Other channels are left as they are
+        assert _transform(table, [0xB4, 4, 1]) == [0xB4, 4, 1]
+
+    def test_pad_controls_and_programs(self) -> None:
+        table = _route()
+        assert _transform(table, [0xB9, 20, 127]) == [0xBA, 40, 127]
+        assert _transform(table, [0xC9, 0]) == [0xCA, 100]
+        assert _transform(table, [0xC9, 8]) == [0xCA, 19]
+
+    def test_dials(self) -> None:
+        table = _route()
+        assert _transform(table, [0xB0, 4, 127]) == [0xB2, 70, 63]
+        assert _transform(table, [0xB0, 11, 64]) == [0xB2, 77, 32]
+        assert _transform(table, [0xB0, 11, 0]) == [0xB2, 77, 0]
+        # All dials share the same scaling
+        assert len(table.curves) == 2
+
+    def test_joystick(self) -> None:
+        table = _route()
+        assert _transform(table, [0xB0, 1, 90]) == [0xB2, 16, 90]
+        assert _transform(table, [0xB0, 2, 90]) == [0xB2, 17, 90]
+        pitch_bend = {**TARGET, 'joystick': {'axis-x': 'PBEND'}}
+        assert _transform(
+            _route(pitch_bend), [0xB0, 1, 90]
+        ) == [0xB2, 1, 90]
+
+    def test_load_route(
+        self, tmp_path: str, monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture
+    ) -> None:
+        monkeypatch.setattr(
+            router, 'compile_config',
+            lambda config: compile_config(config, tmp_path)
+        )
+        table = load_route(TARGET, _preset(SOURCE), 'target')
+        assert not caplog.records  # velocity is no unknown preset key
+        assert table.name == 'target'
+        assert table.velocities == _route().velocities
+        with pytest.raises(ValueError, match='velocity.curve'):
+            load_route({'velocity': {'curve': 'LOUD'}}, _preset(SOURCE))
+
+
+class TestVelocityCurve:  # noqa: D101
+
+    def test_linear(self) -> None:
+        assert velocity_curve('LINEAR', 1, 127) == IDENTITY
+
+    def test_range(self) -> None:
+        curve = velocity_curve('LINEAR', 20, 80)
+        assert curve[0] == 0 and curve[1] == 20 and curve[127] == 80
+        assert list(curve[1:]) == sorted(curve[1:])
+
+    def test_curves(self) -> None:
+        soft, hard = velocity_curve('SOFT', 1, 127), velocity_curve(
+            'HARD', 1, 127
+        )
+        assert soft[64] > 64 > hard[64]
+        assert soft[127] == hard[127] == 127 and hard[1] == 1
+        assert set(velocity_curve('FIXED', 1, 90)[1:]) == {90}
+
+    def test_unknown_curve(self) -> None:
+        with pytest.raises(ValueError, match='Unknown velocity curve'):
+            velocity_curve('LOUD', 1, 127)
+
+
+class TestRouter:  # noqa: D101
+
+    def test_switch_routes(self) -> None:
+        output = _Output()
+        event_router = Router(
+            [RouteTable('identity'), _route()], output,
+            switch_channel=15
+        )
+        event_router.on_message(([0x99, 36, 80], 0.0), None)
+        assert event_router.select(1).name == 'target'
+        event_router.on_message(([0x99, 36, 80], 0.0), None)
+        event_router.on_message(([0xCF, 0], 0.0), None)
+        event_router.on_message(([0x99, 36, 80], 0.0), None)
+        event_router.on_message(([0xCF, 5], 0.0), None)  # No such route
+        assert event_router.active == 0
+        assert output.messages == [
+            [0x99, 36, 80], [0x9A, 60, 100], [0x99, 36, 80]
+        ]
+        with pytest.raises(ValueError, match='No route 2'):
+            event_router.select(2)
+
+    def test_no_routes(self) -> None:
+        with pytest.raises(ValueError, match='At least one route'):
+            Router([], _Output())
+
+    def test_routing(self) -> None:
+        device = VirtualMpkMini()
+        output = _Output()
+        event_router = Router([_route()], output)
+        with routing(device.midi_in, event_router):
+            device.midi_in.deliver([0x99, 36, 80])
+            device.midi_in.deliver([0xF8])
+        device.midi_in.deliver([0x99, 36, 80])
+        assert output.messages == [[0x9A, 60, 100], [0xF8]]
+
+    def test_route_command_without_input(self, tmp_path: str) -> None:
+        # Routing goes on after EOF of stdin until SIGTERM
+        script = """
+import sys
+from contextlib import contextmanager
+from akai_mpkmini_mkii_ctrl import controller as ctrl
+from akai_mpkmini_mkii_ctrl.__main__ import main
+from akai_mpkmini_mkii_ctrl.emulator import VirtualMpkMini
+device = VirtualMpkMini()
+ctrl.setup_midi_in_and_out = lambda port, interactive=True: device.ports()
+ctrl.virtual_midi_output = contextmanager(lambda name: iter([None]))
+main(sys.argv[1:])
+"""
+        command = subprocess.Popen(
+            [sys.executable, '-c', script, 'route', '--mapping', BASE_CONFIG],
+            stdin=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            env={**environ, 'XDG_CACHE_HOME': tmp_path}
+        )
+        assert command.stderr
+        for line in command.stderr:
+            if 'Routing to' in line:
+                break
+        with pytest.raises(subprocess.TimeoutExpired):
+            command.wait(0.3)
+        command.terminate()
+        assert command.wait(TIMEOUT) == 0
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+r"""Startup benchmark for the akai_mpkmini_mkii_ctrl command-line."""
+
+import subprocess
+import sys
+from os import path
+from time import perf_counter
+from typing import List
+
+import pytest
+
+PROJECT_ROOT = path.join(path.dirname(__file__), '..')
+# The best of several runs is compared, timings of single runs are noisy
+RUNS = 5
+HEAVY_MODULES = ['rtmidi', 'construct', 'yaml', 'asyncio', 'socketserver']
+# Modules of HEAVY_MODULES that can be imported in every test environment.
+# Startup is compared to importing them, so the checks scale with the host.
+DEFERRED_MODULES = ['construct', 'yaml', 'asyncio']
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=PROJECT_ROOT, capture_output=True,
+        check=True, text=True
+    )
+
+
+def _import_time(modules: List[str]) -> float:
+    # Best cumulative import time of the modules in seconds. click, the
+    # only eager dependency of the CLI, is imported before and not counted.
+    import_times: List[float] = []
+    for _ in range(RUNS):
+        result = _run([
+            '-X', 'importtime', '-c',
+            f'import click, {", ".join(modules)}'
+        ])
+        # import time: self [us] | cumulative [us] | package
+        import_times.append(sum(
+            int(line.split('|')[1]) / 10**6
+            for line in result.stderr.splitlines()
+            if line.split('|')[-1][1:] in modules
+        ))
+    return min(import_times)
+
+
+def _best_run(args: List[str]) -> float:
+    latencies: List[float] = []
+    for _ in range(RUNS):
+        start = perf_counter()
+        _run(args)
+        latencies.append(perf_counter() - start)
+    return min(latencies)
+
+
+class TestStartup:  # noqa: D101
+
+    @pytest.mark.parametrize('command', [[], ['push-config-preset']])
+    def test_help_does_not_import_heavy_modules(
+        self, command: List[str]
+    ) -> None:
+        result = _run(['-c', (
+            'import sys\n'
+            'from akai_mpkmini_mkii_ctrl.__main__ import main\n'
+            f'try:\n    main({command + ["--help"]})\n'
+            'except SystemExit:\n    pass\n'
+            f'print([m for m in {HEAVY_MODULES} if m in sys.modules])'
+        )])
+        assert result.stdout.strip().splitlines()[-1] == '[]'
+
+    def test_import_time(self) -> None:
+        # The CLI module must be cheaper to import than what it defers
+        assert _import_time(['akai_mpkmini_mkii_ctrl.__main__']) < (
+            _import_time(DEFERRED_MODULES)
+        )
+
+    def test_help_latency(self) -> None:
+        lazy = _best_run(['-m', 'akai_mpkmini_mkii_ctrl', '--help'])
+        eager = _best_run(['-c', (
+            f'import {", ".join(DEFERRED_MODULES)}\n'
+            'from akai_mpkmini_mkii_ctrl.__main__ import main\n'
+            'main(["--help"])'
+        )])
+        assert lazy < eager